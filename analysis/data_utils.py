@@ -9,7 +9,12 @@ __author__ = 'dickeym'
 import pandas as pd 
 import numpy as np 
 
-def get_conf_win_pcts(league):
+## Tournament structure is shared with the bracket builder package (installed from viz)
+from bracket_builder.datasets import load_dataset
+from bracket_builder.slots import load_slot_tree
+
+
+def get_conf_win_pcts(league, teams_df = None, conferences_df = None, reg_season_results_df = None):
     """
     Calculate regular season standings (conf. win pct) within each conference 
      and season.
@@ -18,6 +23,12 @@ def get_conf_win_pcts(league):
     ----------
     league : str
         Either 'women' or 'men'.
+    teams_df : DataFrame
+        Optional. Pre-loaded {prefix}Teams data (read from the current directory if not given).
+    conferences_df : DataFrame
+        Optional. Pre-loaded {prefix}TeamConferences data.
+    reg_season_results_df : DataFrame
+        Optional. Pre-loaded {prefix}RegularSeasonCompactResults data.
 
     Returns
     -------
@@ -26,13 +37,12 @@ def get_conf_win_pcts(league):
     """
     
     ## Read and merge datasets
-    if league == 'women':
-        prefix = 'W'
-    else:
-        prefix = 'M'
-    teams_df = pd.read_csv(f"{prefix}Teams.csv")
-    conferences_df = pd.read_csv(f"{prefix}TeamConferences.csv")
-    reg_season_results_df = pd.read_csv(f"{prefix}RegularSeasonCompactResults.csv")
+    if teams_df is None:
+        teams_df = load_dataset('Teams', league)
+    if conferences_df is None:
+        conferences_df = load_dataset('TeamConferences', league)
+    if reg_season_results_df is None:
+        reg_season_results_df = load_dataset('RegularSeasonCompactResults', league)
     teams_df = teams_df.merge(conferences_df)
     
     teams_df.columns = [f'W{c}' if c != 'Season' else c for c in teams_df.columns]
@@ -42,23 +52,16 @@ def get_conf_win_pcts(league):
     
     ## Limit to conference games
     conf_games = reg_season_results_df[reg_season_results_df['WConfAbbrev'] == 
-                                   reg_season_results_df['LConfAbbrev']].copy()
-    
-    ## Gather number of wins and losses by team, conference, and season
-    seasons, confs, teams, n_wins, n_losses  = [], [], [], [], []
-    for i, row in conferences_df.iterrows():
-        seasons.append(row['Season'])
-        confs.append(row['ConfAbbrev'])
-        teams.append(row['TeamID'])
-        n_wins.append(len(conf_games[(conf_games['Season'] == row['Season']) &
-                                     (conf_games['WTeamID'] == row['TeamID'])]))
-        n_losses.append(len(conf_games[(conf_games['Season'] == row['Season']) &
-                                     (conf_games['LTeamID'] == row['TeamID'])]))
-    conf_win_pcts_df = pd.DataFrame({'Season': seasons,
-                                     'ConfAbbrev': confs,
-                                     'TeamID': teams,
-                                     'n_wins': n_wins,
-                                     'n_losses': n_losses})
+                                   reg_season_results_df['LConfAbbrev']]
+    
+    ## Count number of wins and losses by team and season, then join back to every team/conference/season
+    n_wins = conf_games.groupby(['Season', 'WTeamID']).size().rename('n_wins')
+    n_losses = conf_games.groupby(['Season', 'LTeamID']).size().rename('n_losses')
+    n_wins.index.names = n_losses.index.names = ['Season', 'TeamID']
+    conf_win_pcts_df = (conferences_df[['Season', 'ConfAbbrev', 'TeamID']]
+                        .merge(n_wins.reset_index(), how = 'left', on = ['Season', 'TeamID'])
+                        .merge(n_losses.reset_index(), how = 'left', on = ['Season', 'TeamID']))
+    conf_win_pcts_df[['n_wins', 'n_losses']] = conf_win_pcts_df[['n_wins', 'n_losses']].fillna(0).astype(int)
     conf_win_pcts_df['conf_win_pct'] = conf_win_pcts_df['n_wins']/(conf_win_pcts_df['n_wins'] + conf_win_pcts_df['n_losses'])
     
     ## Rank within conference and season
@@ -67,67 +70,55 @@ def get_conf_win_pcts(league):
     return conf_win_pcts_df
 
 
-def exhaust_possible_seeds(tourney_slots_df, parent_seeds):
+def get_round_met(league, tourney_results_df, seed_cols = ('WSeed', 'LSeed')):
     """
-    Recursive function to get all of the possible seeds for each slot.
-     Can be used to add a "possible_teams" column to the tournament slots data
+    Get the round that two seeds met in for every game in the tournament results, using the
+     compiled slot tree of each season. Games of play-in winners after the play-in (e.g. 'W16a'
+     against 'W01') get their round too, where the old tagging left them without one.
 
     Parameters
     ----------
-    tourney_slots_df : DataFrame
-        The provided tournament slots data.
-    parent_seeds : list
-        A list of seeds from rounds > 1 (which are really the names of rounds).
+    league : str
+        Either 'women' or 'men'.
+    tourney_results_df : DataFrame
+        Tournament results with a Season column and seeds for both teams.
+    seed_cols : tuple of str
+        Names of the columns with the seeds of the two teams.
 
     Returns
     -------
-    list
-        A list of all possible seeds that could reach that round.
+    rounds : np.array
+        Round number that each game was played in.
 
+    Raises
+    ------
+    ValueError
+        If a game has a seed that isn't in its season's tournament slots.
     """
-    parent_rows = tourney_slots_df[
-        tourney_slots_df['Slot'].isin(parent_seeds)].copy()
-    if np.min(parent_rows['round']) != 1:
-        parent_seeds.extend(list(parent_rows['StrongSeed']))
-        parent_seeds.extend(list(parent_rows['WeakSeed']))
-        return exhaust_possible_seeds(tourney_slots_df, parent_seeds)
+    if league == 'women':
+        prefix = 'W'
     else:
-        rd1_seeds = parent_rows[parent_rows['round'] == 1]
-        possible_seeds = list(rd1_seeds['StrongSeed'])
-        possible_seeds.extend(list(rd1_seeds['WeakSeed']))
-        return possible_seeds
-
-
-def get_round_met(tourney_slots_df, seed_1, seed_2):
-    """
-    Get the round that two seeds meet in the slots dataframe
-
-    Parameters
-    ----------
-    tourney_slots_df : DataFrame
-        The provided tournament slots data.
-    seed_1 : str
-        Seed of team 1.
-    seed_2 : str
-        Seed of team 2.
-
-    Returns
-    -------
-    rd : int
-        Minimum round number that two teams can feasibly meet.
-    """
-    
-    teams_in_slot = tourney_slots_df.possible_teams.apply(lambda x: ((seed_1 in x) and 
-                                                                    (seed_2 in x)))
-    slots_with_teams = tourney_slots_df[teams_in_slot]
+        prefix = 'M'
     
-    rd = np.min(slots_with_teams['round'])
+    rounds = np.zeros(len(tourney_results_df), dtype = int)
+    seasons = tourney_results_df['Season'].to_numpy()
+    for season in np.unique(seasons):
+        in_season = seasons == season
+        slot_tree = load_slot_tree(f"{prefix}NCAATourneySlots.csv", season)
+        season_rounds = slot_tree.get_round_met(
+                                tourney_results_df.loc[in_season, seed_cols[0]],
+                                tourney_results_df.loc[in_season, seed_cols[1]])
+        if (season_rounds < 0).any():
+            unmatched = tourney_results_df.loc[in_season, list(seed_cols)][season_rounds < 0]
+            raise ValueError(f"Seeds not in the {season} tournament slots: {unmatched.values.tolist()}")
+        rounds[in_season] = season_rounds
     
-    return rd
+    ## Play-in games (round 0) count as round 1
+    return np.where(rounds == 0, 1, rounds)
 
 
 def get_rolling_avg_round_reached(league, by = 'conf_standing', start_season = 2000,
-                                 end_season = 2020, n_year_avg = 5):
+                                 end_season = 2020, n_year_avg = 5, conf_win_pcts_df = None):
     """
     Calculate avg. round reached in NCAA tourney the last X years for teams 
      that are in each standing/position in each conference.
@@ -143,21 +134,51 @@ def get_rolling_avg_round_reached(league, by = 'conf_standing', start_season = 2
         Year of current season to calculate the last X years for.
     n_year_avg : int
         How many years back to look at tournament results for.
+    conf_win_pcts_df : DataFrame
+        Optional. Output of get_conf_win_pcts to reuse (only used when by = 'conf_standing').
 
     Returns
     -------
     full_avg_max_rd_df : DataFrame
         Avg. round reached in tourney by conference standing or coach since X year.
     """
-    ## Read and merge datasets
-    if league == 'women':
-        prefix = 'W'
-    else:
-        prefix = 'M'
+    avg_max_rd_dfs = get_rolling_avg_rounds_reached(league, by = [by], start_season = start_season,
+                                                    end_season = end_season, n_year_avgs = [n_year_avg],
+                                                    conf_win_pcts_df = conf_win_pcts_df)
+    
+    return avg_max_rd_dfs[(by, n_year_avg)]
+
+
+def get_rolling_avg_rounds_reached(league, by = ('conf_standing', 'coach/team', 'team'), start_season = 2000,
+                                   end_season = 2020, n_year_avgs = (5,), conf_win_pcts_df = None):
+    """
+    Calculate avg. round reached in NCAA tourney for several groupings and window lengths at once.
+     The max round per season and group is computed once, and every n-year window is then a
+     difference of cumulative totals.
+     
+    Parameters
+    ----------
+    league : str
+        Either 'women' or 'men'.
+    by : list of str
+        Any of 'conf_standing', 'coach/team' (team for women) and 'team'.
+    start_season : int
+        First season to calculate the last X years for.
+    end_season : int
+        Season to stop at (not included).
+    n_year_avgs : list of int
+        How many years back to look at tournament results for.
+    conf_win_pcts_df : DataFrame
+        Optional. Output of get_conf_win_pcts to reuse (only used for 'conf_standing').
+
+    Returns
+    -------
+    avg_max_rd_dfs : dict
+        (by, n_year_avg) to the DataFrame get_rolling_avg_round_reached returns for those arguments.
+    """
     ## Read in tourney results
-    tourney_results_df = pd.read_csv(f"{prefix}NCAATourneyCompactResults.csv")
-    tourney_seeds_df = pd.read_csv(f"{prefix}NCAATourneySeeds.csv")
-    tourney_slots_df = pd.read_csv(f"{prefix}NCAATourneySlots.csv")
+    tourney_results_df = load_dataset('NCAATourneyCompactResults', league)
+    tourney_seeds_df = load_dataset('NCAATourneySeeds', league)
     
     ## Merge in seeds to tourney results
     tourney_seeds_df = tourney_seeds_df.rename(columns = {'TeamID': 'WTeamID', 'Seed': 'WSeed'})
@@ -165,83 +186,117 @@ def get_rolling_avg_round_reached(league, by = 'conf_standing', start_season = 2
     tourney_seeds_df = tourney_seeds_df.rename(columns = {'WTeamID': 'LTeamID', 'WSeed': 'LSeed'})
     tourney_results_df = tourney_results_df.merge(tourney_seeds_df, on = ['LTeamID', 'Season'])
     
-    ## Add a field to slots with the possible teams that could reach that round
-    tourney_slots_df['round'] = tourney_slots_df['Slot'].apply(lambda x: int(x[1]))
-    possible_teams = []
-    for i, row in tourney_slots_df.iterrows():
-        if row['round'] != 1:
-            possible_seeds = exhaust_possible_seeds(
-            tourney_slots_df, [row['StrongSeed'], row['WeakSeed']])
-            possible_teams.append(possible_seeds)
-        else:
-            possible_teams.append([row['StrongSeed'], row['WeakSeed']])
-    tourney_slots_df['possible_teams'] = possible_teams
-    
     ## Add a column to tourney results with the round that the 2 teams met
-    tourney_results_df['round'] = tourney_results_df.apply(lambda x: get_round_met(tourney_slots_df, x['WSeed'], x['LSeed']),
-                                                  axis = 1)
+    tourney_results_df['round'] = get_round_met(league, tourney_results_df)
     
     ## Double the tourney results to have one record per team playing
-    tourney_results_df['TeamID'] = tourney_results_df.apply(lambda x: [x['WTeamID'], x['LTeamID']], axis = 1)
-    tourney_results_df = tourney_results_df.explode('TeamID')
-    
-    ## Get conference winnning pcts and ranks by year/team to merge with tourney results
-    if by == 'conf_standing':
-        ## Merge conf standings into tourney results
-        conf_win_pcts_df = get_conf_win_pcts(league).drop(columns = ['n_wins', 'n_losses'])
-        tourney_results_df = tourney_results_df.merge(conf_win_pcts_df, on = ['TeamID', 'Season'])
-        group_by_1_cols = ['Season', 'ConfAbbrev', 'rank_in_conf']
-        group_by_2_cols = ['ConfAbbrev', 'rank_in_conf']
-        colname_prefix = 'conf'
-    elif (by == 'coach/team') and (league == 'men'):
-        coach_df = pd.read_csv(f"{prefix}TeamCoaches.csv") ## right now prefix can only be M
-        tourney_results_df = tourney_results_df.merge(coach_df, on = ['TeamID', 'Season'])
-        group_by_1_cols = ['Season', 'CoachName']
-        group_by_2_cols = 'CoachName'
-        colname_prefix = 'coach'
-    else:
-        ## Instead of coach for women, we'll use teamID
-        group_by_1_cols = ['Season', 'TeamID']
-        group_by_2_cols = 'TeamID'
-        colname_prefix = 'team'
-        
+    tourney_results_df = pd.concat([tourney_results_df.assign(TeamID = tourney_results_df['WTeamID']),
+                                    tourney_results_df.assign(TeamID = tourney_results_df['LTeamID'])])
+    
     ## For teams that win the championship, add another 1 to their round to give credit for "advancing"
-    tourney_results_df['round'] = tourney_results_df.apply(lambda x: x['round'] + 1 if 
-                                                             ((x['round'] == 6) and (x['WTeamID']==x['TeamID']))
-                                                            else x['round'], axis = 1)
-    
-    ## Roll across required seasons and calculate new avg. rounds by conf/standing
-    avg_max_rd_dfs = []
-    for season in range(start_season, end_season):
-        ## Limit the tourney results to an n_year_avg range
-        yr_results_df = tourney_results_df[(tourney_results_df['Season'] >=  season-n_year_avg) &
-                                           (tourney_results_df['Season'] < season)]
-        
-        ## Get the maximum round reached for each season
-        max_rounds = (yr_results_df.groupby(group_by_1_cols)
-                      .agg({'round': max}).reset_index().rename(columns = {'round': 'max_round'}))
-        
-        ## Sum the maximum rounds by team to be later used in an average
-        ### (avg. needs to include years where they were not in the tourney, counted as 0)
-        avg_max_rd_df = (max_rounds.groupby(group_by_2_cols)
-                                   .agg({'max_round': np.sum, 'Season': [len, max, min]})
-                                   .reset_index().rename(columns = {'max_round': 'total_rounds'}))
+    tourney_results_df['round'] += ((tourney_results_df['round'] == 6) &
+                                    (tourney_results_df['WTeamID'] == tourney_results_df['TeamID']))
+    
+    avg_max_rd_dfs = {}
+    for by_mode in by:
+        ## Get conference winnning pcts and ranks by year/team to merge with tourney results
+        if by_mode == 'conf_standing':
+            ## Merge conf standings into tourney results
+            if conf_win_pcts_df is None:
+                conf_win_pcts_df = get_conf_win_pcts(league)
+            results_df = tourney_results_df.merge(conf_win_pcts_df.drop(columns = ['n_wins', 'n_losses']),
+                                                  on = ['TeamID', 'Season'])
+            group_cols = ['ConfAbbrev', 'rank_in_conf']
+            colname_prefix = 'conf'
+        elif (by_mode == 'coach/team') and (league == 'men'):
+            coach_df = load_dataset('TeamCoaches', league) ## right now only available for men
+            results_df = tourney_results_df.merge(coach_df, on = ['TeamID', 'Season'])
+            group_cols = ['CoachName']
+            colname_prefix = 'coach'
+        else:
+            ## Instead of coach for women, we'll use teamID
+            results_df = tourney_results_df
+            group_cols = ['TeamID']
+            colname_prefix = 'team'
         
-        ## Get rid of the multi-level columns
-        avg_max_rd_df.columns = ['_'.join(col) if '' not in col else ''.join(col) for col in
-                                 avg_max_rd_df.columns.values]
+        ## Get the maximum round reached for each season (once for all windows)
+        max_rounds = results_df.groupby(['Season'] + group_cols, observed = True)['round'].max().sort_index()
         
-        ## Calculate number of seasons and list the current season iteration as the "valid" szn.
-        min_season = np.min(avg_max_rd_df['Season_min'])
-        max_season = np.max(avg_max_rd_df['Season_max'])
-        avg_max_rd_df['Season'] = season
-        avg_max_rd_df['avg_rd_season_range'] = f"{min_season}-{max_season}"
+        for n_year_avg in n_year_avgs:
+            avg_max_rd_dfs[(by_mode, n_year_avg)] = _window_avg_max_round(max_rounds, group_cols, colname_prefix,
+                                                                          start_season, end_season, n_year_avg)
+    
+    return avg_max_rd_dfs
+
+
+def _window_avg_max_round(max_rounds, group_cols, colname_prefix, start_season, end_season, n_year_avg):
+    """
+    Average the max round reached over the n_year_avg seasons before each season, using
+     cumulative totals over a (groups x seasons) table.
+
+    Parameters
+    ----------
+    max_rounds : Series
+        Max round reached, indexed by Season and the group columns (sorted).
+    group_cols : list of str
+        Columns of the groups (e.g. ['ConfAbbrev', 'rank_in_conf'] or ['TeamID']).
+    colname_prefix : str
+        Prefix of the average column (e.g. 'conf' for 'conf_avg_round').
+    start_season : int
+        First season to calculate the last X years for.
+    end_season : int
+        Season to stop at (not included).
+    n_year_avg : int
+        How many years back to look at tournament results for.
 
-        ## Calculate the average round reached
-        avg_max_rd_df[f'{colname_prefix}_avg_round'] = avg_max_rd_df['total_rounds_sum']/(max_season-min_season+1)
-        avg_max_rd_dfs.append(avg_max_rd_df)
+    Returns
+    -------
+    avg_max_rd_df : DataFrame
+        Avg. round reached by each group that played in the window of each season, in the
+         format of get_rolling_avg_round_reached.
+    """
+    ## (groups x seasons) max round, with a column for every season a window could touch
+    first_season = min(max_rounds.index.get_level_values('Season').min(), start_season - n_year_avg)
+    seasons = np.arange(first_season, end_season)
+    rounds_wide = max_rounds.unstack('Season').reindex(columns = seasons)
+    played = rounds_wide.notna().to_numpy()
+    n_groups = len(rounds_wide)
+    
+    ## Cumulative totals so any window [season-n_year_avg, season) is one subtraction
+    cum_rounds = np.hstack([np.zeros((n_groups, 1)), np.cumsum(rounds_wide.fillna(0).to_numpy(), axis = 1)])
+    cum_played = np.hstack([np.zeros((n_groups, 1)), np.cumsum(played, axis = 1)])
+    
+    ## Latest season played up to each season, and earliest season played from each season on
+    season_idx = np.arange(len(seasons))
+    last_played = np.maximum.accumulate(np.where(played, season_idx, 0), axis = 1)
+    next_played = np.minimum.accumulate(np.where(played, season_idx, len(seasons) - 1)[:, ::-1], axis = 1)[:, ::-1]
+    
+    ## (seasons x groups) window totals for each "valid" season
+    window_end = np.arange(start_season, end_season) - first_season
+    window_start = window_end - n_year_avg
+    total_rounds = (cum_rounds[:, window_end] - cum_rounds[:, window_start]).T
+    n_seasons = (cum_played[:, window_end] - cum_played[:, window_start]).T
+    season_max = seasons[last_played[:, window_end - 1]].T
+    season_min = seasons[next_played[:, window_start]].T
+    
+    ## Keep the groups that played in the window
+    t, g = np.nonzero(n_seasons > 0)
+    avg_max_rd_df = rounds_wide.index[g].to_frame(index = False)
+    avg_max_rd_df.columns = group_cols
+    avg_max_rd_df['total_rounds_sum'] = total_rounds[t, g].astype(int)
+    avg_max_rd_df['Season_len'] = n_seasons[t, g].astype(int)
+    avg_max_rd_df['Season_max'] = season_max[t, g]
+    avg_max_rd_df['Season_min'] = season_min[t, g]
+    avg_max_rd_df['Season'] = start_season + t
+    
+    ## Range of seasons across all of the groups in each window
+    season_range = avg_max_rd_df.groupby('Season').agg({'Season_min': 'min', 'Season_max': 'max'})
+    min_season = avg_max_rd_df['Season'].map(season_range['Season_min'])
+    max_season = avg_max_rd_df['Season'].map(season_range['Season_max'])
+    avg_max_rd_df['avg_rd_season_range'] = min_season.astype(str) + '-' + max_season.astype(str)
     
-    ## Add all the seasons together and format column names
-    full_avg_max_rd_df = pd.concat(avg_max_rd_dfs).drop_duplicates()
+    ## Calculate the average round reached
+    avg_max_rd_df[f'{colname_prefix}_avg_round'] = avg_max_rd_df['total_rounds_sum']/(max_season-min_season+1)
+    avg_max_rd_df.index = avg_max_rd_df.groupby('Season').cumcount().to_numpy()
     
-    return full_avg_max_rd_df
\ No newline at end of file
+    return avg_max_rd_df
@@ -8,47 +8,38 @@ __author__ = 'lucabasa'
 __version__ = '2.0.0'
 
 
+import os
 import pandas as pd 
 import numpy as np 
 
 import gc
+from concurrent.futures import ProcessPoolExecutor
 
-def big_wins(data, rank_loc):
+## Typed, cached readers for the Kaggle files are shared with the bracket builder package (installed from viz)
+from bracket_builder import datasets
+from bracket_builder.datasets import EXCLUDED_SYSTEMS, load_rank_cube, read_dataset, read_dataset_chunks
+from bracket_builder.stages import StageCache
+from bracket_builder.submission import make_ids
+
+def big_wins(data, rank_loc, exclude_systems=EXCLUDED_SYSTEMS):
     '''
-    Takes the Massey Ordinals data and average by team/day
-    For each game, merge the team' rank on the day of the game
+    Takes the Massey Ordinals consensus rank of each team as of the day of each game
+    (see load_rank_cube, the ranks are built once and memory-mapped afterwards)
     If the losing team was in the top 30, it calls it a win against a top team
     If a team beats another one with 15 rank position higher, it calls it an upset
+    Ranks are as of the latest release on or before the day of the game, where the original merge
+    only matched releases on the exact day and gave every other game a rank of 1000
+    Teams without a rank yet get 1000, and only the ranks are filled (other missing values stay NaN)
     '''
     df = data.copy()
     
     if rank_loc:
-        ranks = pd.read_csv(rank_loc)
-        # exclude ranks that are on very different value ranges
-        ranks = ranks[~(ranks.SystemName.isin(['AP', 'USA', 'DES', 'LYN', 'ACU', 
-                                               'TRX', 'D1A', 'JNG', 'BNT']))].copy()
-        mean_ranks = ranks.groupby(['Season', 'TeamID', 'RankingDayNum'], as_index=False).OrdinalRank.mean()
-
-        df = pd.merge(df, mean_ranks.rename(columns={'TeamID': 'WTeamID', 
-                                                    'RankingDayNum':'DayNum', 
-                                                    'OrdinalRank': 'WRank'}), 
-                    on=['Season', 'WTeamID', 'DayNum'], how='left')
-
-        df = pd.merge(df, mean_ranks.rename(columns={'TeamID': 'LTeamID', 
-                                                        'RankingDayNum':'DayNum', 
-                                                        'OrdinalRank': 'LRank'}), 
-                        on=['Season', 'LTeamID', 'DayNum'], how='left')
-
-        df = df.fillna(1000)
-
-        df['Wtop_team'] = 0
-        df.loc[df.LRank <= 30, 'Wtop_team'] = 1
-
-        df['Wupset'] = 0
-        df.loc[df.WRank - df.LRank > 15, 'Wupset'] = 1
+        ranks = load_rank_cube(rank_loc, exclude_systems)
+        w_rank = np.nan_to_num(ranks.lookup(df['Season'], df['DayNum'], df['WTeamID']), nan=1000)
+        l_rank = np.nan_to_num(ranks.lookup(df['Season'], df['DayNum'], df['LTeamID']), nan=1000)
         
-        del df['WRank']
-        del df['LRank']
+        df['Wtop_team'] = np.where(l_rank <= 30, 1, 0)
+        df['Wupset'] = np.where(w_rank - l_rank > 15, 1, 0)
     
     df['WOT_win'] = 0
     df.loc[df.NumOT > 0, 'WOT_win'] = 1
@@ -70,57 +61,89 @@ def perc_OT_win(data):
     return df.rename(columns={'OT_win': 'OT_win_perc'})
 
 
+## Game level columns that team_games keeps on the rows of both teams
+GAME_COLS = ['Season', 'DayNum', 'GameDay', 'NumOT']
+LEAD_CHANGE_COLS = ['game_lc', 'half2_lc', 'crunchtime_lc']
+
+
+def team_games(data):
+    '''
+    Reshapes the games (one row per game with W and L columns) into one row per team per game, 
+    winners first and then losers
+    The W/L prefix is taken off the team columns, OppTeamID is the other team and is_win tells the two rows apart
+    _diff columns are from the team's point of view and _advantage flags are flipped for the losers
+    Flags that only the winners have (OT_win, Away, top_team, upset) are 0 for the losers
+    Both full_stats and rolling_stats take either the games or this table, so it can be built once for both
+    '''
+    game_cols = [col for col in GAME_COLS + LEAD_CHANGE_COLS if col in data.columns]
+    team_cols = {}
+    for prefix in ['W', 'L']:
+        for col in data.columns:
+            if col.startswith(prefix) and '_perc' not in col and 'Loc' not in col:
+                team_cols.setdefault(col[1:], {})[prefix] = data[col].to_numpy()
+    diff_cols = [col for col in data.columns if '_diff' in col]
+    adv_cols = [col for col in data.columns if '_advantage' in col]
+    n_games = len(data)
+    
+    games = {col: np.concatenate([data[col].to_numpy()] * 2) for col in game_cols}
+    games['TeamID'] = np.concatenate([data['WTeamID'].to_numpy(), data['LTeamID'].to_numpy()])
+    games['OppTeamID'] = np.concatenate([data['LTeamID'].to_numpy(), data['WTeamID'].to_numpy()])
+    games['is_win'] = np.arange(2 * n_games) < n_games
+    for col, sides in team_cols.items():
+        if col == 'TeamID':
+            continue
+        w_values = sides.get('W', np.zeros(n_games, dtype=int))
+        games[col] = np.concatenate([w_values, sides.get('L', np.zeros_like(w_values))])
+    for col in diff_cols:
+        games[col] = np.concatenate([data[col].to_numpy(), -data[col].to_numpy()])
+    for col in adv_cols:
+        games[col] = np.concatenate([data[col].to_numpy(), 1 - data[col].to_numpy()])
+    
+    return pd.DataFrame(games)
+
+
+def _team_stat_cols(games, exclude):
+    '''
+    Columns of a team_games table to aggregate, i.e. everything but the keys and the given game columns
+    '''
+    return [col for col in games.columns if col not in ['TeamID', 'OppTeamID', 'is_win'] + exclude]
+
+
+## Shooting percentages that full_stats and the rolling stats compute from the totals
+PERC_COLS = ['FGM_perc', 'FGM2_perc', 'FGM3_perc', 'FT_perc', 'FGM_no_ast_perc', 
+             'True_shooting_perc', 'Opp_True_shooting_perc']
+
+
+def total_percs(sums):
+    '''
+    Shooting percentages from summed team stats (a DataFrame or a dict of arrays)
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {'FGM_perc': sums['FGM'] / sums['FGA'],
+                'FGM2_perc': sums['FGM2'] / sums['FGA2'],
+                'FGM3_perc': sums['FGM3'] / sums['FGA3'],
+                'FT_perc': sums['FTM'] / sums['FTA'],
+                'FGM_no_ast_perc': sums['FGM_no_ast'] / sums['FGM'],
+                'True_shooting_perc': 0.5 * sums['Score'] / (sums['FGA'] + 0.475 * sums['FTA']),
+                'Opp_True_shooting_perc': 0.5 * sums['opp_score'] / (sums['opp_FGA'] + 0.475 * sums['opp_FTA'])}
+
+
 def full_stats(data):
-    df = data.copy()
+    '''
+    Season averages of every team stat, plus shooting percentages from the season totals
+    Takes the games or their team_games table
+    '''
+    games = data if 'is_win' in data.columns else team_games(data)
     
-    to_select = [col for col in df.columns if col.startswith('W') 
-                                             and '_perc' not in col 
-                                             and 'Loc' not in col]
-    to_select += [col for col in df.columns if '_diff' in col or '_advantage' in col]
-    df_W = df[['Season', 'DayNum', 'NumOT'] + to_select].copy()
-    df_W.columns = df_W.columns.str.replace('W','')
-    df_W['N_wins'] = 1
-    
-    to_select = [col for col in df.columns if col.startswith('L') 
-                                             and '_perc' not in col 
-                                             and 'Loc' not in col]
-    to_select += [col for col in df.columns if '_diff' in col or '_advantage' in col]
-    df_L = df[['Season', 'DayNum', 'NumOT'] + to_select].copy()
-    df_L.columns = df_L.columns.str.replace('L','')
-    df_L[[col for col in df.columns if '_diff' in col]] = - df_L[[col for col in df.columns if '_diff' in col]]
-    for col in [col for col in df.columns if '_advantage' in col]:
-        df_L[col] = df_L[col].map({0:1, 1:0})
-    df_L['N_wins'] = 0
-    df_L['OT_win'] = 0
-    df_L['Away'] = 0
-    if 'top_team' in df_W.columns:
-        df_L['top_team'] = 0
-        df_L['upset'] = 0
-
-    df = pd.concat([df_W, df_L], sort=True)
-    
-    del df['DayNum']
+    to_use = ['Season', 'TeamID'] + sorted(_team_stat_cols(games, GAME_COLS + LEAD_CHANGE_COLS) + ['N_wins'])
+    df = games.assign(N_wins=games['is_win'].astype(int))
     
     OT_perc = perc_OT_win(df)
     
-    not_use = ['NumOT']
-    to_use = [col for col in df.columns if col not in not_use]
-    
     means = df[to_use].groupby(['Season','TeamID'], as_index=False).mean()
     
     sums = df[to_use].groupby(['Season','TeamID'], as_index=False).sum()
-    sums['FGM_perc'] = sums.FGM / sums.FGA
-    sums['FGM2_perc'] = sums.FGM2 / sums.FGA2
-    sums['FGM3_perc'] = sums.FGM3 / sums.FGA3
-    sums['FT_perc'] = sums.FTM / sums.FTA
-    sums['FGM_no_ast_perc'] = sums.FGM_no_ast / sums.FGM
-    sums['True_shooting_perc'] = 0.5 * sums['Score'] / (sums['FGA'] + 0.475 * sums['FTA'])
-    sums['Opp_True_shooting_perc'] = 0.5 * sums['opp_score'] / (sums['opp_FGA'] + 0.475 * sums['opp_FTA'])
-    to_use = ['Season', 'TeamID', 'FGM_perc',
-              'FGM2_perc', 'FGM3_perc', 'FT_perc', 
-              'FGM_no_ast_perc', 'True_shooting_perc', 'Opp_True_shooting_perc']
-    
-    sums = sums[to_use].fillna(0)
+    sums = sums[['Season', 'TeamID']].assign(**total_percs(sums)).fillna(0)
     
     stats_tot = pd.merge(means, sums, on=['Season', 'TeamID'])
     stats_tot = pd.merge(stats_tot, OT_perc, on=['Season', 'TeamID'], how='left')
@@ -129,71 +152,117 @@ def full_stats(data):
     return stats_tot
 
 
-def process_details(data, rank_loc=None):
+## Box score columns (with a W or L prefix) that process_details builds its stats from
+BOX_SCORE_STATS = ['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 'PF']
+
+## Stats that process_details compares between the two teams, in output order
+DIFF_STATS = ['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 
+              'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 
+              'PF', 'FGM2', 'FGA2', 'Tot_Reb', 'FGM_no_ast', 
+              'DR_opportunity', 'OR_opportunity', 'possessions',
+              'off_rating', 'def_rating', 'shtg_opportunity', 
+              'TO_perposs', 'impact', 'True_shooting_perc'] # 'Def_effort' 
+
+
+def _box_score_kernel(box, float_dtype=np.float64):
+    '''
+    Computes the derived stats for both teams at once from a (2 x stats x games) array of box scores 
+    (axis 0 is W, L and axis 1 follows BOX_SCORE_STATS)
+    Returns a dict of (2 x games) arrays by stat name
+    Counts stay integers, ratios are computed in float_dtype
+    '''
+    fbox = box.astype(float_dtype)
+    c = {stat: box[:, i] for i, stat in enumerate(BOX_SCORE_STATS)}
+    f = {stat: fbox[:, i] for i, stat in enumerate(BOX_SCORE_STATS)}
+    out = {}
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['FG_perc'] = f['FGM'] / f['FGA']
+        out['FGM2'] = c['FGM'] - c['FGM3']
+        out['FGA2'] = c['FGA'] - c['FGA3']
+        out['FG2_perc'] = (f['FGM'] - f['FGM3']) / (f['FGA'] - f['FGA3'])
+        out['FG3_perc'] = f['FGM3'] / f['FGA3']
+        out['FT_perc'] = f['FTM'] / f['FTA']
+        out['Tot_Reb'] = c['OR'] + c['DR']
+        out['FGM_no_ast'] = c['FGM'] - c['Ast']
+        out['FGM_no_ast_perc'] = (f['FGM'] - f['Ast']) / f['FGM']
+        possessions = f['FGA'] - f['OR'] + f['TO'] + float_dtype(0.475)*f['FTA']
+        out['possessions'] = possessions
+        out['off_rating'] = f['Score'] / possessions * 100
+        out['shtg_opportunity'] = 1 + (f['OR'] - f['TO']) / possessions
+        out['TO_perposs'] = f['TO'] / possessions
+        out['True_shooting_perc'] = float_dtype(0.5) * f['Score'] / (f['FGA'] + float_dtype(0.475) * f['FTA'])
+        impact_est = (f['Score'] + f['FTM'] + f['FGM'] + f['DR'] + float_dtype(0.5)*f['OR'] - f['FTA'] - f['FGA'] + 
+                      f['Ast'] + f['Stl'] + float_dtype(0.5)*f['Blk'] - f['PF'])
+        
+        # Reversing axis 0 gives the opponent's value
+        out['def_rating'] = out['off_rating'][::-1]
+        out['opp_shtg_opportunity'] = out['shtg_opportunity'][::-1]
+        out['opp_possessions'] = possessions[::-1]
+        out['opp_score'] = c['Score'][::-1]
+        out['opp_FTA'] = c['FTA'][::-1]
+        out['opp_FGA'] = c['FGA'][::-1]
+        out['impact'] = impact_est / impact_est.sum(axis=0)
+        
+        for stat in out:
+            if 'perc' in stat:
+                out[stat] = np.where(np.isnan(out[stat]), 0, out[stat]).astype(float_dtype)
+        
+        missed = f['FGA'] - f['FGM']
+        out['DR_opportunity'] = f['DR'] / missed[::-1]
+        out['OR_opportunity'] = f['OR'] / missed
+    
+    return out
+
+
+def process_details(data, rank_loc=None, float32=False):
     '''
     Some extra statistic are calculated for both the winning and the losing team
     It calculates the difference between the two teams in each stat
+    The W and L box scores are stacked so every stat is computed once for both teams, 
+    and the new columns are added to the data in one go
+    Set float32 to compute the ratios in single precision (less memory, slightly different values)
     '''
-    df = data.copy()
-    
-    df = big_wins(df, rank_loc)
-        
-    for prefix in ['W', 'L']:
-        df[prefix+'FG_perc'] = df[prefix+'FGM'] / df[prefix+'FGA']
-        df[prefix+'FGM2'] = df[prefix+'FGM'] - df[prefix+'FGM3']
-        df[prefix+'FGA2'] = df[prefix+'FGA'] - df[prefix+'FGA3']
-        df[prefix+'FG2_perc'] = df[prefix+'FGM2'] / df[prefix+'FGA2']
-        df[prefix+'FG3_perc'] = df[prefix+'FGM3'] / df[prefix+'FGA3']
-        df[prefix+'FT_perc'] = df[prefix+'FTM'] / df[prefix+'FTA']
-        df[prefix+'Tot_Reb'] = df[prefix+'OR'] + df[prefix+'DR']
-        df[prefix+'FGM_no_ast'] = df[prefix+'FGM'] - df[prefix+'Ast']
-        df[prefix+'FGM_no_ast_perc'] = df[prefix+'FGM_no_ast'] / df[prefix+'FGM']
-        df[prefix+'possessions'] = df[prefix+'FGA'] - df[prefix+'OR'] + df[prefix+'TO'] + 0.475*df[prefix+'FTA']
-        df[prefix+'off_rating'] = df[prefix+'Score'] / df[prefix+'possessions'] * 100
-        df[prefix+'shtg_opportunity'] = 1 + (df[prefix+'OR'] - df[prefix+'TO']) / df[prefix+'possessions']
-        df[prefix+'TO_perposs'] = df[prefix+'TO'] / df[prefix+'possessions']
-        df[prefix+'True_shooting_perc'] = 0.5 * df[prefix+'Score'] / (df[prefix+'FGA'] + 0.475 * df[prefix+'FTA'])
-        df[prefix+'IE_temp'] = df[prefix+'Score'] + df[prefix+'FTM'] + df[prefix+'FGM'] + \
-                                df[prefix+'DR'] + 0.5*df[prefix+'OR'] - df[prefix+'FTA'] - df[prefix+'FGA'] + \
-                                df[prefix+'Ast'] + df[prefix+'Stl'] + 0.5*df[prefix+'Blk'] - df[prefix+'PF']
-
-    df['Wdef_rating'] = df['Loff_rating']
-    df['Ldef_rating'] = df['Woff_rating']
-    df['Wopp_shtg_opportunity'] = df['Lshtg_opportunity']
-    df['Lopp_shtg_opportunity'] = df['Wshtg_opportunity']
-    df['Wopp_possessions'] = df['Lpossessions']
-    df['Lopp_possessions'] = df['Wpossessions']
-    df['Wopp_score'] = df['LScore']
-    df['Lopp_score'] = df['WScore']
-    # These will be needed for the true shooting percentage when we aggregate
-    df['Wopp_FTA'] = df['LFTA']
-    df['Wopp_FGA'] = df['LFGA']
-    df['Lopp_FTA'] = df['WFTA']
-    df['Lopp_FGA'] = df['WFGA']
-
-    df['Wimpact'] = df['WIE_temp'] / (df['WIE_temp'] + df['LIE_temp'])
-    df['Limpact'] = df['LIE_temp'] / (df['WIE_temp'] + df['LIE_temp'])
-
-    del df['WIE_temp']
-    del df['LIE_temp']
-
-    df[[col for col in df.columns if 'perc' in col]] = df[[col for col in df.columns if 'perc' in col]].fillna(0)
-
-    df['WDR_opportunity'] = df['WDR'] / (df['LFGA'] - df['LFGM'])
-    df['LDR_opportunity'] = df['LDR'] / (df['WFGA'] - df['WFGM'])
-    df['WOR_opportunity'] = df['WOR'] / (df['WFGA'] - df['WFGM'])
-    df['LOR_opportunity'] = df['LOR'] / (df['LFGA'] - df['LFGM'])
-    
-    stats = ['Score', 'FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 
-             'FTA', 'OR', 'DR', 'Ast', 'TO', 'Stl', 'Blk', 
-             'PF', 'FGM2', 'FGA2', 'Tot_Reb', 'FGM_no_ast', 
-             'DR_opportunity', 'OR_opportunity', 'possessions',
-             'off_rating', 'def_rating', 'shtg_opportunity', 
-             'TO_perposs', 'impact', 'True_shooting_perc'] # 'Def_effort' 
-    
-    for col in stats:
-        df[col+'_diff'] = df['W'+col] - df['L'+col]
-        df[col+'_advantage'] = (df[col+'_diff'] > 0).astype(int)
+    new_cols = {}
+    if rank_loc:
+        df = big_wins(data, rank_loc)
+    else:
+        # Same flags as big_wins without ranks, added with the other columns instead of on a copy
+        df = data
+        new_cols['WOT_win'] = (df['NumOT'] > 0).astype(int).to_numpy()
+        new_cols['WAway'] = (df['WLoc'] != 'H').astype(int).to_numpy()
+    
+    box = np.array([[df[prefix+stat].to_numpy() for stat in BOX_SCORE_STATS] for prefix in ['W', 'L']])
+    stats = _box_score_kernel(box, np.float32 if float32 else np.float64)
+    stats.update({col: box[:, i] for i, col in enumerate(BOX_SCORE_STATS)})
+    
+    order = ['FG_perc', 'FGM2', 'FGA2', 'FG2_perc', 'FG3_perc', 'FT_perc', 'Tot_Reb', 'FGM_no_ast', 
+             'FGM_no_ast_perc', 'possessions', 'off_rating', 'shtg_opportunity', 'TO_perposs', 'True_shooting_perc']
+    new_cols.update({prefix+stat: stats[stat][i] for i, prefix in enumerate(['W', 'L']) for stat in order})
+    for stat in ['def_rating', 'opp_shtg_opportunity', 'opp_possessions', 'opp_score']:
+        new_cols['W'+stat], new_cols['L'+stat] = stats[stat]
+    for prefix, i in [('W', 0), ('L', 1)]:
+        new_cols[prefix+'opp_FTA'] = stats['opp_FTA'][i]
+        new_cols[prefix+'opp_FGA'] = stats['opp_FGA'][i]
+    for stat in ['impact', 'DR_opportunity', 'OR_opportunity']:
+        new_cols['W'+stat], new_cols['L'+stat] = stats[stat]
+    
+    for col in DIFF_STATS:
+        diff = stats[col][0] - stats[col][1]
+        new_cols[col+'_diff'] = diff
+        new_cols[col+'_advantage'] = (diff > 0).astype(int)
+    
+    # One block per dtype, then a single reorder into the usual column order
+    blocks = []
+    for dtype in dict.fromkeys(values.dtype for values in new_cols.values()):
+        cols = [col for col, values in new_cols.items() if values.dtype == dtype]
+        blocks.append(pd.DataFrame(np.stack([new_cols[col] for col in cols]).T, columns=cols, index=df.index))
+    df = pd.concat([df] + blocks, axis=1)[list(df.columns) + list(new_cols)]
+    
+    # Columns with 'perc' in the name that came with the data are filled like the new ones
+    old_perc = [col for col in data.columns if 'perc' in col]
+    if old_perc:
+        df[old_perc] = df[old_perc].fillna(0)
     
     return df
 
@@ -203,13 +272,13 @@ def add_days(data, info, date=True):
     Transdorms DayNum into the actual date of the game and viceversa
     '''
     df = data.copy()
-    seasons = pd.read_csv(info)
+    seasons = read_dataset(info)
     
     df = pd.merge(df, seasons[['Season', 'DayZero']], on='Season')
     df['DayZero'] = pd.to_datetime(df.DayZero)
     
     if date:
-        df['GameDay'] = df.apply(lambda x: x['DayZero'] + pd.offsets.DateOffset(days=x['DayNum']), 1)
+        df['GameDay'] = df['DayZero'] + pd.to_timedelta(df['DayNum'], unit='D')
     else:
         df['DayNum'] = (df['GameDay'] - df['DayZero']).dt.days
     
@@ -218,77 +287,102 @@ def add_days(data, info, date=True):
     return df
 
 
-def rolling_stats(data, season_info, window='30d'):
+def _window_days(window):
+    '''
+    Length in whole days of a rolling window given as days or an offset string ('30D'), None for the season so far
+    Returns the days and the suffix of the window's columns in rolling_windows
+    '''
+    if window is None:
+        return None, '_season'
+    if isinstance(window, str):
+        window = pd.Timedelta(window) // pd.Timedelta('1D')
+    return int(window), f'_{int(window)}d'
+
+
+def rolling_windows(data, windows=('7D', '14D', '30D', None)):
+    '''
+    For each team in each game, calculates the statistics of the previous days for several windows at once
+    A window covers the team's games of the season in the days before the game, from the game day 
+    minus the window included (i.e. closed='left' on the date), None is the whole season so far
+    The team games are sorted once, every window is a difference of cumulative sums 
+    and the window bounds are found with searchsorted on DayNum
+    Returns one row per team per game with the means (Score_30d), sums (Score_sum_30d) and 
+    percentages (FGM_perc_30d) of every window, NaN when the team has no games in the window
+    Non-finite values (NaN, inf) are missing, like NaN in rolling, so one of them can't spill into the later windows
+    Takes the games or their team_games table
+    '''
+    games = data if 'is_win' in data.columns else team_games(data)
+    games = games.assign(N_wins=games['is_win'].astype(int))
+    lead_changes = [col for col in LEAD_CHANGE_COLS if col in games.columns]
+    stat_cols = lead_changes + _team_stat_cols(games, GAME_COLS + LEAD_CHANGE_COLS)
+    
+    order = np.lexsort((games['DayNum'].to_numpy(), games['TeamID'].to_numpy(), games['Season'].to_numpy()))
+    seasons = games['Season'].to_numpy()[order]
+    teams = games['TeamID'].to_numpy()[order]
+    days = games['DayNum'].to_numpy().astype(np.int64)[order]
+    values = games[stat_cols].to_numpy(dtype=np.float64)[order]
+    n_games = len(days)
+    
+    # Cumulative sums (and counts, rolling skips missing values) with a leading 0
+    present = np.isfinite(values)
+    cum_values = np.zeros((n_games + 1, len(stat_cols)))
+    np.cumsum(np.where(present, values, 0), axis=0, out=cum_values[1:])
+    cum_counts = np.zeros((n_games + 1, len(stat_cols)), dtype=np.int64)
+    np.cumsum(present, axis=0, out=cum_counts[1:])
+    
+    # Sorted keys that keep every team-season in its own range of days
+    new_group = np.r_[True, (seasons[1:] != seasons[:-1]) | (teams[1:] != teams[:-1])]
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(n_games), 0))
+    day_keys = (np.cumsum(new_group) - 1) * (days.max() + 1) + days
+    window_end = np.searchsorted(day_keys, day_keys, side='left')
+    
+    out = {'Season': seasons, 'TeamID': teams, 'DayNum': days}
+    for window in windows:
+        n_days, suffix = _window_days(window)
+        if n_days is None:
+            window_start = group_start
+        else:
+            window_start = np.maximum(np.searchsorted(day_keys, day_keys - n_days, side='left'), group_start)
+        
+        sums = cum_values[window_end] - cum_values[window_start]
+        counts = cum_counts[window_end] - cum_counts[window_start]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums / counts
+        sums[counts == 0] = np.nan
+        
+        out.update({col+suffix: means[:, i] for i, col in enumerate(stat_cols)})
+        out.update({col+'_sum'+suffix: sums[:, i] for i, col in enumerate(stat_cols)})
+        has_games = counts[:, stat_cols.index('N_wins')] > 0
+        for col, perc in total_percs(dict(zip(stat_cols, sums.T))).items():
+            out[col+suffix] = np.where(np.isnan(perc) & has_games, 0, perc)
+    
+    return pd.DataFrame(out)
+
+
+def rolling_stats(data, season_info=None, window='30D'):
     '''
     For each team in each game, calculates the statistics of the previous 30 days
     The window can be changed
+    Same as rolling_windows with a single window, keeping the games with previous games in the window 
+    and the names of the stats without a suffix
+    Unlike the original version, which always returned DayNum, the DayNum of each game is only added when season_info
+    is given (the days come from DayNum either way, season_info isn't read)
     '''
-    df = data.copy()
-
-    df = add_days(df, season_info)
-
-    to_select = [col for col in df.columns if col.startswith('W') 
-                                                 and '_perc' not in col 
-                                                 and 'Loc' not in col]
-    to_select += [col for col in df.columns if '_diff' in col or '_advantage' in col]
-    df_W = df[['Season', 'GameDay', 'NumOT', 
-               'game_lc', 'half2_lc', 'crunchtime_lc'] + to_select].copy()
-    df_W.columns = df_W.columns.str.replace('W','')
-    df_W['N_wins'] = 1
-
-    to_select = [col for col in df.columns if col.startswith('L') 
-                                             and '_perc' not in col 
-                                             and 'Loc' not in col]
-    to_select += [col for col in df.columns if '_diff' in col or '_advantage' in col]
-    df_L = df[['Season', 'GameDay', 'NumOT', 
-               'game_lc', 'half2_lc', 'crunchtime_lc'] + to_select].copy()
-    df_L.columns = df_L.columns.str.replace('L','')
-    df_L[[col for col in df.columns if '_diff' in col]] = - df_L[[col for col in df.columns if '_diff' in col]]
-    for col in [col for col in df.columns if '_advantage' in col]:
-        df_L[col] = df_L[col].map({0:1, 1:0})
-    df_L['N_wins'] = 0
-    df_L['OT_win'] = 0
-    df_L['Away'] = 0
-    if 'top_team' in df_W.columns:
-        df_L['top_team'] = 0
-        df_L['upset'] = 0
-
-    df = pd.concat([df_W, df_L], sort=False)
-
-    not_use = ['NumOT', 'Season', 'TeamID']
-    to_use = [col for col in df.columns if col not in not_use]
-
-    means = df.groupby(['Season', 'TeamID'])[to_use].rolling(window, on='GameDay', 
-                                                           min_periods=1, closed='left').mean()
-    means = means.dropna()
-    means = means.reset_index()
-    del means['level_2']
-
-    sums = df.groupby(['Season', 'TeamID'])[to_use].rolling(window, on='GameDay', 
-                                                      min_periods=1, closed='left').sum()
-    sums = sums.reset_index()
-    del sums['level_2']
-    
-    sums['FGM_perc'] = sums.FGM / sums.FGA
-    sums['FGM2_perc'] = sums.FGM2 / sums.FGA2
-    sums['FGM3_perc'] = sums.FGM3 / sums.FGA3
-    sums['FT_perc'] = sums.FTM / sums.FTA
-    sums['FGM_no_ast_perc'] = sums.FGM_no_ast / sums.FGM
-    sums['True_shooting_perc'] = 0.5 * sums['Score'] / (sums['FGA'] + 0.475 * sums['FTA'])
-    sums['Opp_True_shooting_perc'] = 0.5 * sums['opp_score'] / (sums['opp_FGA'] + 0.475 * sums['opp_FTA'])
-    
-    to_use = ['Season', 'TeamID', 'GameDay', 'FGM_perc',
-              'FGM2_perc', 'FGM3_perc', 'FT_perc', 
-              'FGM_no_ast_perc', 'True_shooting_perc', 'Opp_True_shooting_perc']
-
-    sums = sums[to_use].fillna(0)
-
-    stats_tot = pd.merge(means, sums, on=['Season', 'TeamID', 'GameDay'])
-
-    stats_tot = add_days(stats_tot, season_info, date=False)
-    del stats_tot['GameDay']
+    stats = rolling_windows(data, [window])
+    _, suffix = _window_days(window)
     
-    return stats_tot
+    stat_cols = [col[:-len(suffix)] for col in stats.columns 
+                 if col.endswith(suffix) and '_sum'+suffix not in col]
+    means = [col for col in stat_cols if col not in PERC_COLS]
+    stats = stats.rename(columns={col+suffix: col for col in stat_cols})
+    stats = stats.dropna(subset=means)
+    stats[PERC_COLS] = stats[PERC_COLS].fillna(0)
+    
+    to_use = ['Season', 'TeamID'] + means + PERC_COLS
+    if season_info is not None:
+        to_use.append('DayNum')
+    
+    return stats[to_use].reset_index(drop=True)
 
 
 def make_scores(data):
@@ -298,7 +392,7 @@ def make_scores(data):
     to_keep = ['made1', 'made2', 'made3', 'miss1', 'miss2', 'miss3', 'reb', 'turnover', 'assist', 'steal', 'block']
     df = data[data.EventType.isin(to_keep)].copy()
     to_drop = ['EventPlayerID', 'EventSubType', 'X', 'Y', 'Area']
-    df.drop(to_drop, axis=1, inplace=True)
+    df.drop(to_drop, axis=1, inplace=True, errors='ignore')
     
     df['tourney'] = np.where(df.DayNum >= 132, 1, 0)
     
@@ -313,14 +407,13 @@ def make_scores(data):
     
     df['points'] = df.groupby(['tmp_gameID', 'EventTeamID']).points_made.cumsum() - df.points_made
     
-    del df['WCurrentScore']
-    del df['LCurrentScore']
+    df.drop(['WCurrentScore', 'LCurrentScore'], axis=1, inplace=True, errors='ignore')
     
     df.loc[df.WTeamID == df.EventTeamID, 'WCurrentScore'] = df.points
     df.loc[df.LTeamID == df.EventTeamID, 'LCurrentScore'] = df.points
 
-    df['WCurrentScore'] = df.groupby('tmp_gameID')['WCurrentScore'].fillna(method='ffill').fillna(0)
-    df['LCurrentScore'] = df.groupby('tmp_gameID')['LCurrentScore'].fillna(method='ffill').fillna(0)
+    df['WCurrentScore'] = df.groupby('tmp_gameID')['WCurrentScore'].ffill().fillna(0)
+    df['LCurrentScore'] = df.groupby('tmp_gameID')['LCurrentScore'].ffill().fillna(0)
     
     df['Current_difference'] = df['WCurrentScore'] - df['LCurrentScore']
     
@@ -400,99 +493,270 @@ def lead_changes(data):
     return df
 
 
-def _scoreinblock(data, text):
+## Event types that make_scores keeps and their points
+SCORE_EVENTS = {'made1': 1, 'made2': 2, 'made3': 3, 'miss1': 0, 'miss2': 0, 'miss3': 0, 'reb': 0, 
+                'turnover': 0, 'assist': 0, 'steal': 0, 'block': 0}
+
+
+def _segment_changes(sign, game_idx, mask, n_games):
+    '''
+    Number of changes of sign between consecutive rows of mask in each game (rows sorted by game)
+    '''
+    rows = np.flatnonzero(mask)
+    changed = (np.diff(sign[rows]) != 0) & (np.diff(game_idx[rows]) == 0)
     
-    df = data.groupby('tmp_gameID', as_index=False)[['WFinalScore', 'LFinalScore', 'WCurrentScore', 'LCurrentScore']].min()
-    df[f'Wpoints_made_{text}'] = df['WFinalScore'] - df['WCurrentScore']
-    df[f'Lpoints_made_{text}'] = df['LFinalScore'] - df['LCurrentScore']
+    return np.bincount(game_idx[rows[1:]][changed], minlength=n_games)
+
+
+def _segment_max(values, game_idx, mask, n_games):
+    '''
+    Max of values over the rows of mask in each game (rows sorted by game), NaN for games without rows
+    '''
+    rows = np.flatnonzero(mask)
+    out = np.full(n_games, np.nan)
+    if len(rows) > 0:
+        starts = np.flatnonzero(np.r_[True, np.diff(game_idx[rows]) != 0])
+        out[game_idx[rows[starts]]] = np.maximum.reduceat(values[rows], starts)
     
-    return df[['tmp_gameID', f'Wpoints_made_{text}', f'Lpoints_made_{text}']]
+    return out
 
 
-def _statcount(data, stat, text):
+def score_events(data, men=True):
+    '''
+    Same as lead_changes(quarter_score(make_scores(data), men)) in a single pass:
+    the games get integer keys and are sorted once by (game, ElapsedSeconds), 
+    then the scores, periods, differences and lead changes are computed on the game segments
+    '''
+    if not men:
+        data = data[~((data.DayNum == 80) & (data.WTeamID == 3111) & (data.LTeamID == 3117))]  # fix for one game with odd seconds
+    data = data[data.EventType.isin(list(SCORE_EVENTS))]
+    to_drop = ['EventPlayerID', 'EventSubType', 'X', 'Y', 'Area', 'WCurrentScore', 'LCurrentScore']
+    
+    game_cols = [data[col].to_numpy() for col in ['Season', 'DayNum', 'WTeamID', 'LTeamID']]
+    seconds = data['ElapsedSeconds'].to_numpy()
+    order = np.lexsort([seconds] + game_cols[::-1])
+    df = data[[col for col in data.columns if col not in to_drop]].iloc[order].reset_index(drop=True)
+    
+    new_game = np.zeros(len(df), dtype=bool)
+    new_game[:1] = True
+    for col in game_cols:
+        col = col[order]
+        new_game[1:] |= col[1:] != col[:-1]
+    game_idx = np.cumsum(new_game) - 1
+    game_starts = np.flatnonzero(new_game)
+    n_games = len(game_starts)
+    rows = np.arange(len(df))
+    seconds = seconds[order]
+    
+    df['tourney'] = np.where(df.DayNum >= 132, 1, 0)
+    df['Final_difference'] = df['WFinalScore'] - df['LFinalScore']
     
-    tmp = data.copy()
-    tmp['is_stat'] = np.where(tmp.EventType==stat, 1, 0)
-    tmp = tmp.groupby(['tmp_gameID', 'EventTeamID'], as_index=False).is_stat.sum()
+    ## Score of a team before its last event so far (as the groupby cumsum and ffill of make_scores)
+    points = df['EventType'].map(SCORE_EVENTS).to_numpy(dtype=float)
+    event_team = df['EventTeamID'].to_numpy()
+    for side in ['W', 'L']:
+        is_side = event_team == df[f'{side}TeamID'].to_numpy()
+        side_points = np.where(is_side, points, 0)
+        running = np.cumsum(side_points)
+        running -= (running - side_points)[game_starts][game_idx] + side_points
+        last_event = np.maximum.accumulate(np.where(is_side, rows, -1))
+        df[f'{side}CurrentScore'] = np.where(last_event >= game_starts[game_idx], running[np.maximum(last_event, 0)], 0.)
+    df['Current_difference'] = df['WCurrentScore'] - df['LCurrentScore']
     
-    return tmp.rename(columns={'is_stat': text})
+    df['period'] = np.select([seconds >= 40 * 60, seconds >= 20 * 60], [3, 2], 1)
+    df['crunch'] = np.where((seconds > 37 * 60) & (seconds <= 40 * 60), 1, 0)
+    period = df['period'].to_numpy()
+    crunch = df['crunch'].to_numpy() == 1
+    
+    ## Last second of each game
+    ot = (seconds[np.r_[game_starts[1:], len(df)] - 1] / 60 - 40) / 5
+    w_score = df['WCurrentScore'].to_numpy()
+    l_score = df['LCurrentScore'].to_numpy()
+    half = _segment_max(w_score, game_idx, period == 1, n_games) - _segment_max(l_score, game_idx, period == 1, n_games)
+    crunchtime = _segment_max(w_score, game_idx, ~crunch, n_games) - _segment_max(l_score, game_idx, ~crunch, n_games)
+    
+    if np.isnan(half).any() or np.isnan(crunchtime).any():
+        raise KeyError('Some games have no events in the 1st half or before crunch time')
+    
+    sign = np.sign(df['Current_difference'].to_numpy())
+    every = np.ones(len(df), dtype=bool)
+    changes = {'game_lc': _segment_changes(sign, game_idx, every, n_games), 
+               'half2_lc': _segment_changes(sign, game_idx, period == 2, n_games), 
+               'crunchtime_lc': _segment_changes(sign, game_idx, crunch, n_games)}
+    ## Games without events in the 2nd half had no lead changes at all in lead_changes
+    no_half2 = np.bincount(game_idx[period == 2], minlength=n_games) == 0
+    
+    df['n_OT'] = np.where(ot > 0, np.ceil(ot), 0)[game_idx]
+    df['Halftime_difference'] = half[game_idx]
+    df['3mins_difference'] = crunchtime[game_idx]
+    for col, counts in changes.items():
+        df[col] = np.where(no_half2, 0, counts)[game_idx]
+    
+    return df
+
+
+## Event types counted by event_count and the periods they are counted in
+EVENT_STATS = ['made1', 'made2', 'made3', 'miss1', 'miss2', 'miss3', 'reb', 'turnover', 'assist', 'steal', 'block']
+EVENT_PERIODS = ['game', 'half2', 'crunchtime']
 
 
 def event_count(data):
-    df = data.copy()
-    df['tmp_gameID'] = df['DayNum'].astype(str) + '_' + df['WTeamID'].astype(str) + '_' + df['LTeamID'].astype(str)
+    '''
+    Counts the events of each team in the game, in the 2nd half and in crunch time, with one count 
+    over (game, team, period, EventType) reshaped to the W{stat}_{period} and L{stat}_{period} columns
+    Also the points made in the 2nd half and in crunch time and the shooting percentages
+    Games where a team has no events in a period are dropped
+    '''
+    df = data.reset_index(drop=True)
+    game_idx = df.groupby(['Season', 'DayNum', 'WTeamID', 'LTeamID'], sort=False).ngroup().to_numpy()
+    n_games = game_idx.max() + 1 if len(df) > 0 else 0
+    
+    event_team = df['EventTeamID'].to_numpy()
+    side = np.select([event_team == df['WTeamID'].to_numpy(), event_team == df['LTeamID'].to_numpy()], [0, 1], -1)
+    stat_idx = pd.Index(EVENT_STATS).get_indexer(df['EventType'])
+    in_period = np.stack([np.ones(len(df), dtype=bool), df['period'].to_numpy() == 2, df['crunch'].to_numpy() == 1])
+    
+    ## (games x W/L x periods x stats) counts, plus the number of events of any type of each team
+    period_idx, rows = np.nonzero(in_period & (side >= 0))
+    team_period = (game_idx[rows] * 2 + side[rows]) * len(EVENT_PERIODS) + period_idx
+    present = np.bincount(team_period, minlength=n_games * 2 * len(EVENT_PERIODS)).reshape(n_games, 2, -1)
+    is_stat = stat_idx[rows] >= 0
+    counts = np.bincount(team_period[is_stat] * len(EVENT_STATS) + stat_idx[rows][is_stat], 
+                         minlength=n_games * 2 * len(EVENT_PERIODS) * len(EVENT_STATS))
+    counts = counts.reshape(n_games, 2, len(EVENT_PERIODS), len(EVENT_STATS))
+    
+    unique_cols = ['Season', 'DayNum', 'tourney', 'WTeamID', 'LTeamID', 
+                   'WFinalScore', 'LFinalScore', 'Final_difference', 'n_OT', 
+                   'Halftime_difference', '3mins_difference', 
+                   'game_lc', 'half2_lc', 'crunchtime_lc']
+    first_rows = np.unique(game_idx, return_index=True)[1]
+    new_cols = {col: df[col].to_numpy()[first_rows] for col in unique_cols}
     
     # points made in each block
-    half2 = _scoreinblock(df[df.period==2], 'half2')
-    crunch = _scoreinblock(df[df.crunch==1], 'crunchtime')
-    
-    add_ons = pd.merge(half2, crunch, on='tmp_gameID')
-    add_ons = pd.merge(add_ons, df[['tmp_gameID', 'WTeamID', 'LTeamID']].drop_duplicates(), on='tmp_gameID')
+    for period, mask in zip(EVENT_PERIODS[1:], in_period[1:]):
+        current = df.loc[mask, ['WCurrentScore', 'LCurrentScore']].groupby(game_idx[mask]).min().reindex(range(n_games))
+        new_cols[f'Wpoints_made_{period}'] = new_cols['WFinalScore'] - current['WCurrentScore'].to_numpy()
+        new_cols[f'Lpoints_made_{period}'] = new_cols['LFinalScore'] - current['LCurrentScore'].to_numpy()
     
     # stats in each block
-    stats = ['made1', 'made2', 'made3', 'miss1', 'miss2', 'miss3', 'reb', 'turnover', 'assist', 'steal', 'block']
-    
-    period = 'game'    
-    for stat in stats:
-        name = f'{stat}_{period}'
-        to_merge = _statcount(df, stat, name)
-        add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'WTeamID', 
-                                                   name: f'W{name}'}), on=['tmp_gameID', 'WTeamID'])
-        add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'LTeamID', 
-                                                   name: f'L{name}'}), on=['tmp_gameID', 'LTeamID'])
-        gc.collect()
-        
-    period = 'half2'
-    tmp = df[df.period==2]
-    for stat in stats:
-        name = f'{stat}_{period}'
-        to_merge = _statcount(tmp, stat, name)
-        add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'WTeamID', 
-                                                   name: f'W{name}'}), on=['tmp_gameID', 'WTeamID'])
-        add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'LTeamID', 
-                                                   name: f'L{name}'}), on=['tmp_gameID', 'LTeamID'])
-        gc.collect()
-        
-    period = 'crunchtime'
-    tmp = df[df.crunch==1]
-    for stat in stats:
-        name = f'{stat}_{period}'
-        to_merge = _statcount(tmp, stat, name)
-        add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'WTeamID', 
-                                                   name: f'W{name}'}), on=['tmp_gameID', 'WTeamID'])
-        add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'LTeamID', 
-                                                   name: f'L{name}'}), on=['tmp_gameID', 'LTeamID'])
-        gc.collect()
-    
-    for period in ['game', 'half2', 'crunchtime']:
-        # % of scores with assists
-        add_ons[f'WAst_perc_{period}'] = (add_ons[f'Wassist_{period}'] / (add_ons[f'Wmade2_{period}'] + add_ons[f'Wmade3_{period}'])).fillna(0)
-        add_ons[f'LAst_perc_{period}'] = (add_ons[f'Lassist_{period}'] / (add_ons[f'Lmade2_{period}'] + add_ons[f'Lmade3_{period}'])).fillna(0)
-        # % scores
-        add_ons[f'WFGM_perc_{period}'] = ((add_ons[f'Wmade2_{period}'] + add_ons[f'Wmade3_{period}'])
-                                          / (add_ons[f'Wmade2_{period}'] + add_ons[f'Wmade3_{period}'] + 
-                                             add_ons[f'Wmiss2_{period}'] + add_ons[f'Wmiss3_{period}'])).fillna(0)
-        add_ons[f'LFGM_perc_{period}'] = ((add_ons[f'Lmade2_{period}'] + add_ons[f'Lmade3_{period}'])
-                                          / ((add_ons[f'Lmade2_{period}'] + add_ons[f'Lmade3_{period}']) + 
-                                             add_ons[f'Lmiss2_{period}'] + add_ons[f'Lmiss3_{period}'])).fillna(0)
-        add_ons[f'WFGM3_perc_{period}'] = (add_ons[f'Wmade3_{period}'] / (add_ons[f'Wmade3_{period}'] + add_ons[f'Wmiss3_{period}'])).fillna(0)
-        add_ons[f'LFGM3_perc_{period}'] = (add_ons[f'Lmade3_{period}'] / (add_ons[f'Lmade3_{period}'] + add_ons[f'Lmiss3_{period}'])).fillna(0)
-        add_ons[f'WFTM_perc_{period}'] = (add_ons[f'Wmade1_{period}'] / (add_ons[f'Wmade1_{period}'] + add_ons[f'Wmiss1_{period}'])).fillna(0)
-        add_ons[f'LFTM_perc_{period}'] = (add_ons[f'Lmade1_{period}'] / (add_ons[f'Lmade1_{period}'] + add_ons[f'Lmiss1_{period}'])).fillna(0)
-        
+    stats = pd.DataFrame({f'{team}{stat}_{period}': counts[:, t, p, s]
+                          for p, period in enumerate(EVENT_PERIODS) for s, stat in enumerate(EVENT_STATS) 
+                          for t, team in enumerate(['W', 'L'])})
+    for period in EVENT_PERIODS:
+        for stat in EVENT_STATS:
+            if 'miss' not in stat:
+                new_cols[f'W{stat}_{period}'] = stats[f'W{stat}_{period}'].to_numpy()
+                new_cols[f'L{stat}_{period}'] = stats[f'L{stat}_{period}'].to_numpy()
+    
+    for period in EVENT_PERIODS:
+        percs = {}
+        for team in ['W', 'L']:
+            made1, made2, made3, miss1, miss2, miss3 = (stats[f'{team}{stat}_{period}'] for stat in EVENT_STATS[:6])
+            # % of scores with assists
+            percs[f'{team}Ast_perc_{period}'] = stats[f'{team}assist_{period}'] / (made2 + made3)
+            # % scores
+            percs[f'{team}FGM_perc_{period}'] = (made2 + made3) / (made2 + made3 + miss2 + miss3)
+            percs[f'{team}FGM3_perc_{period}'] = made3 / (made3 + miss3)
+            percs[f'{team}FTM_perc_{period}'] = made1 / (made1 + miss1)
+        for name in ['Ast', 'FGM', 'FGM3', 'FTM']:
+            for team in ['W', 'L']:
+                new_cols[f'{team}{name}_perc_{period}'] = percs[f'{team}{name}_perc_{period}'].fillna(0).to_numpy()
+    
+    df = pd.DataFrame(new_cols)
+    
+    return df[(present > 0).all(axis=(1, 2))].reset_index(drop=True)
+
+
+## Columns of the play-by-play events that the make_scores -> event_count chain uses
+EVENT_COLS = ['Season', 'DayNum', 'WTeamID', 'LTeamID', 'WFinalScore', 'LFinalScore', 
+              'ElapsedSeconds', 'EventTeamID', 'EventType']
+
+
+def game_events(data, men=True):
+    '''
+    Runs the whole play-by-play chain (make_scores, quarter_score, lead_changes, event_count) 
+    on some events, for one row per game
+    Every game must be complete in the events given
+    '''
+    df = score_events(data, men=men)
     
-    unique_cols = ['Season', 'DayNum', 'tourney', 'tmp_gameID', 'WTeamID', 'LTeamID', 
-                   'WFinalScore', 'LFinalScore', 'Final_difference', 'n_OT', 
-                   'Halftime_difference', '3mins_difference', 
-                   'game_lc', 'half2_lc', 'crunchtime_lc']
+    return event_count(df)
+
+
+def _complete_days(chunks):
+    '''
+    Regroups chunks of events (sorted by DayNum) so that every day, and so every game, is in a single chunk
+    The events of the last day in a chunk are held back and put in front of the next one
+    '''
+    carry = None
+    last_day = -1
+    for chunk in chunks:
+        if chunk['DayNum'].min() < last_day:
+            raise ValueError('Events must be sorted by DayNum to be processed in chunks')
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        last_day = chunk['DayNum'].max()
+        done = chunk['DayNum'] < last_day
+        carry = chunk[~done]
+        if done.any():
+            yield chunk[done]
+    
+    if carry is not None and len(carry) > 0:
+        yield carry
+
+
+def _season_game_events(args):
+    '''
+    Streams one season file of events through the chain a chunk at a time (run in the worker processes)
+    Appends the games to a CSV in save_loc when given, otherwise returns them
+    '''
+    events_loc, men, chunksize, save_loc = args
+    chunks = read_dataset_chunks(events_loc, columns=EVENT_COLS, chunksize=chunksize)
+    
+    games = []
+    save_path = None
+    if save_loc is not None:
+        name = os.path.splitext(os.path.basename(events_loc))[0]
+        save_path = os.path.join(save_loc, f'{name}_games.csv')
+        if os.path.exists(save_path):
+            os.remove(save_path)
+    
+    for chunk in _complete_days(chunks):
+        chunk_games = game_events(chunk, men=men)
+        if save_path is not None:
+            chunk_games.to_csv(save_path, mode='a', header=not os.path.exists(save_path), index=False)
+        else:
+            games.append(chunk_games)
+        del chunk, chunk_games
+        gc.collect()
     
-    to_drop = ['WTeamID', 'LTeamID'] + [col for col in add_ons if 'miss' in col]
+    return save_path if save_path is not None else pd.concat(games, ignore_index=True)
+
+
+def stream_game_events(events_locs, men=True, chunksize=1000000, save_loc=None, n_workers=1):
+    '''
+    Runs the play-by-play chain over the event files (e.g. MEvents2015.csv, ...) without loading them at once
+    Each file (one season) is read in chunks of chunksize rows with only the columns of EVENT_COLS, 
+    and every chunk goes through the whole chain, so memory is bounded by a chunk and a day of events
+    Files must be sorted by DayNum, like the Kaggle ones
+    With save_loc the games are appended to one CSV per file there and the paths are returned, 
+    otherwise the games of all the files are returned as one DataFrame
+    n_workers > 1 runs the files (seasons) in parallel in a process pool
+    '''
+    if isinstance(events_locs, str):
+        events_locs = [events_locs]
+    tasks = [(events_loc, men, chunksize, save_loc) for events_loc in events_locs]
     
-    df = pd.merge(df[unique_cols].drop_duplicates(), add_ons.drop(to_drop, axis=1), on='tmp_gameID')
+    if n_workers == 1 or len(tasks) == 1:
+        results = list(map(_season_game_events, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_season_game_events, tasks))
     
-    del df['tmp_gameID']
+    if save_loc is not None:
+        return results
     
-    return df
+    return pd.concat(results, ignore_index=True)
 
 
 def make_competitive(data):
@@ -565,24 +829,169 @@ def make_feats(data):
     return df
 
 
-def make_training_data(details, targets):
-    tmp = details.copy()
-    tmp.columns = ['Season', 'Team1'] + \
-                ['T1_'+col for col in tmp.columns if col not in ['Season', 'TeamID']]
-    total = pd.merge(targets, tmp, on=['Season', 'Team1'], how='left')
+class FeatureStore:
+    '''
+    Dense matrix of team-season features (one row per Season/TeamID) with a (Season, TeamID) -> row map
+    The features of any list of matchups are two row gathers and one subtraction
+    Non-numeric columns (e.g. region) are kept next to the matrix as labels, and the frames keep the column order
+    It can be saved to a directory and memory-mapped back with load
+    '''
+    
+    def __init__(self, keys, values, columns, labels=None, dtypes=None, order=None):
+        '''
+        keys: (rows x 2) array of the Season and TeamID of each row
+        values: (rows x features) array of the features
+        columns: names of the features
+        labels: DataFrame of the non-numeric columns of each row (optional)
+        dtypes: dtype of each feature in the frames (optional, the dtype of values by default)
+        order: names of the features and labels in the order of the frames (optional, the features first by default)
+        '''
+        self.keys = np.asarray(keys)
+        self.values = values
+        self.columns = list(columns)
+        self.labels = pd.DataFrame(index=range(len(self.keys))) if labels is None else labels.reset_index(drop=True)
+        self.dtypes = [str(np.asarray(values).dtype)] * len(self.columns) if dtypes is None else list(dtypes)
+        self.order = self.columns + list(self.labels.columns) if order is None else list(order)
+        
+        seasons = self.keys[:, 0].astype(int)
+        teams = self.keys[:, 1].astype(int)
+        self.first_season = seasons.min() if len(seasons) > 0 else 0
+        self.first_team = teams.min() if len(teams) > 0 else 0
+        # dense (season x team) table of rows, -1 for the teams without features
+        self.row_map = np.full((seasons.max() - self.first_season + 1 if len(seasons) > 0 else 0, 
+                                teams.max() - self.first_team + 1 if len(teams) > 0 else 0), -1, dtype=np.int32)
+        self.row_map[seasons - self.first_season, teams - self.first_team] = np.arange(len(seasons))
+        if (self.row_map >= 0).sum() != len(seasons):
+            raise ValueError('There must be one row per Season and TeamID')
+    
+    @classmethod
+    def from_frame(cls, stats, dtype='float64'):
+        '''
+        Builds the store from some team-season stats (e.g. the output of full_stats)
+        The numeric columns are the features, the others are kept as labels
+        '''
+        others = [col for col in stats.columns if col not in ['Season', 'TeamID']]
+        columns = [col for col in stats[others].select_dtypes('number').columns]
+        labels = stats[[col for col in others if col not in columns]]
+        
+        return cls(stats[['Season', 'TeamID']].to_numpy(), stats[columns].to_numpy(dtype=dtype), columns, 
+                   labels=labels, dtypes=stats[columns].dtypes.astype(str), order=others)
+    
+    def rows(self, seasons, team_ids):
+        '''
+        Row of each (Season, TeamID), -1 when the team has no features
+        '''
+        season_idx = np.asarray(seasons, dtype=int) - self.first_season
+        team_idx = np.asarray(team_ids, dtype=int) - self.first_team
+        valid = ((season_idx >= 0) & (season_idx < self.row_map.shape[0]) 
+                 & (team_idx >= 0) & (team_idx < self.row_map.shape[1]))
+        rows = np.full(len(valid), -1, dtype=np.int32)
+        rows[valid] = self.row_map[season_idx[valid], team_idx[valid]]
+        
+        return rows
+    
+    def gather(self, seasons, team_ids):
+        '''
+        (teams x features) array of the features of each (Season, TeamID), NaN when the team has no features
+        '''
+        return self._take(self.rows(seasons, team_ids))
+    
+    def frame(self, rows):
+        '''
+        Features (in their dtypes) and labels of some rows as a DataFrame, missing when a row is -1
+        '''
+        rows = np.asarray(rows)
+        df = pd.DataFrame(self._take(rows), columns=self.columns)
+        if (rows >= 0).all():
+            df = df.astype(dict(zip(self.columns, self.dtypes)))
+        labels = self.labels.reindex(np.where(rows >= 0, rows, -1)).reset_index(drop=True)
+        
+        return pd.concat([df, labels], axis=1)[self.order]
+    
+    def matchups(self, seasons, team1, team2, prefixes=('T1_', 'T2_', 'delta_')):
+        '''
+        Features of both teams of each matchup and their difference, as a DataFrame 
+        with the columns of the store prefixed by prefixes (T1_*, T2_* and delta_* by default)
+        '''
+        t1 = self.gather(seasons, team1)
+        t2 = self.gather(seasons, team2)
+        names = [f'{prefix}{col}' for prefix in prefixes for col in self.columns]
+        
+        return pd.DataFrame(np.hstack([t1, t2, t1 - t2]), columns=names)
+    
+    def to_frame(self):
+        '''
+        The store as a DataFrame with Season and TeamID columns
+        '''
+        df = self.frame(np.arange(len(self.keys)))
+        df.insert(0, 'Season', self.keys[:, 0])
+        df.insert(1, 'TeamID', self.keys[:, 1])
+        
+        return df
+    
+    def save(self, path):
+        '''
+        Saves the store in the directory path (keys.npy, values.npy, columns.txt and labels.pkl)
+        columns.txt has every column in the order of the frames, with the dtype of the features and 'label' for the labels
+        '''
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'keys.npy'), self.keys)
+        np.save(os.path.join(path, 'values.npy'), np.asarray(self.values))
+        dtypes = dict(zip(self.columns, self.dtypes))
+        with open(os.path.join(path, 'columns.txt'), 'w') as f:
+            f.write('\n'.join(f'{col}\t{dtypes.get(col, "label")}' for col in self.order))
+        self.labels.to_pickle(os.path.join(path, 'labels.pkl'))
+    
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''
+        Loads a store saved with save, with the features memory-mapped by default
+        '''
+        keys = np.load(os.path.join(path, 'keys.npy'))
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode=mmap_mode)
+        with open(os.path.join(path, 'columns.txt')) as f:
+            columns = [line.split('\t') for line in f.read().split('\n') if line]
+        labels = pd.read_pickle(os.path.join(path, 'labels.pkl'))
+        features = [(col, dtype) for col, dtype in columns if dtype != 'label']
+        
+        return cls(keys, values, [col for col, _ in features], labels=labels, dtypes=[dtype for _, dtype in features], 
+                   order=[col for col, _ in columns])
+    
+    def _take(self, rows):
+        '''
+        Rows of the features as floats, NaN for -1
+        '''
+        values = np.asarray(self.values)[rows].astype(float)
+        values[rows < 0] = np.nan
+        
+        return values
+
 
-    tmp = details.copy()
-    tmp.columns = ['Season', 'Team2'] + \
-                ['T2_'+col for col in tmp.columns if col not in ['Season', 'TeamID']]
-    total = pd.merge(total, tmp, on=['Season', 'Team2'], how='left')
+def make_training_data(details, targets):
+    '''
+    Adds the features of Team1 (T1_*) and Team2 (T2_*) to each target game and their differences (delta_*)
+    details is either the team-season stats or a FeatureStore of them (from_frame, so both give the same data)
+    The features are gathered with the row map of the FeatureStore instead of merged
+    '''
+    store = details if isinstance(details, FeatureStore) else FeatureStore.from_frame(details)
+    
+    rows1 = store.rows(targets['Season'], targets['Team1'])
+    rows2 = store.rows(targets['Season'], targets['Team2'])
+    if (rows1 < 0).any() or (rows2 < 0).any():
+        raise ValueError('Something went wrong')
+    
+    total = pd.concat([targets.reset_index(drop=True), 
+                       store.frame(rows1).add_prefix('T1_'), 
+                       store.frame(rows2).add_prefix('T2_')], axis=1)
     
     if total.isnull().any().any():
         raise ValueError('Something went wrong')
         
     stats = [col[3:] for col in total.columns if 'T1_' in col and 'region' not in col]
-
-    for stat in stats:
-        total['delta_'+stat] = total['T1_'+stat] - total['T2_'+stat]
+    
+    deltas = (total[['T1_'+stat for stat in stats]].set_axis(stats, axis=1) 
+              - total[['T2_'+stat for stat in stats]].set_axis(stats, axis=1))
+    total = pd.concat([total, deltas.add_prefix('delta_')], axis=1)
         
     try:
         total['delta_off_edge'] = total['T1_off_rating'] - total['T2_def_rating']
@@ -595,60 +1004,136 @@ def make_training_data(details, targets):
 
 
 def add_seed(seed_location, total):
-    seed_data = pd.read_csv(seed_location)
-    seed_data['region'] = seed_data['Seed'].apply(lambda x: x[0])
-    seed_data['Seed'] = seed_data['Seed'].apply(lambda x: int(x[1:3]))
+    seed_data = read_dataset(seed_location)
+    seed_data['region'] = seed_data['Seed'].str[0]
+    seed_data['Seed'] = seed_data['Seed'].str[1:3].astype(int)
     total = pd.merge(total, seed_data, how='left', on=['TeamID', 'Season'])
     return total
 
 
-def make_teams_target(data, league):
+## Location of a team as an integer (the opponent's is the opposite)
+LOC_CODES = {'H': 1, 'A': -1, 'N': 0}
+
+
+def make_teams_target(data, league, mirror=True):
+    '''
+    Makes a target for each game from the point of view of Team1
+    The canonical orientation (Team1 < Team2) comes first, followed by its mirror (Team1 > Team2)
+    With mirror=False only the canonical orientation is returned, see mirror_teams_target for the rest
+    '''
     if league == 'men':
         limit = 2003
     else:
         limit = 2010
-
-    df = data[data.Season >= limit].copy()
-
-    df['Team1'] = np.where((df.WTeamID < df.LTeamID), df.WTeamID, df.LTeamID)
-    df['Team2'] = np.where((df.WTeamID > df.LTeamID), df.WTeamID, df.LTeamID)
-    df['target'] = np.where((df['WTeamID'] < df['LTeamID']),1,0)
-    df['target_points'] = np.where((df['WTeamID'] < df['LTeamID']),df.WScore - df.LScore,df.LScore - df.WScore)
-    df.loc[df.WLoc == 'N', 'LLoc'] = 'N'
-    df.loc[df.WLoc == 'H', 'LLoc'] = 'A'
-    df.loc[df.WLoc == 'A', 'LLoc'] = 'H'
-    df['T1_Loc'] = np.where((df.WTeamID < df.LTeamID), df.WLoc, df.LLoc)
-    df['T2_Loc'] = np.where((df.WTeamID > df.LTeamID), df.WLoc, df.LLoc)
-    df['T1_Loc'] = df['T1_Loc'].map({'H': 1, 'A': -1, 'N': 0})
-    df['T2_Loc'] = df['T2_Loc'].map({'H': 1, 'A': -1, 'N': 0})
-
-    reverse = data[data.Season >= limit].copy()
-    reverse['Team1'] = np.where((reverse.WTeamID > reverse.LTeamID), reverse.WTeamID, reverse.LTeamID)
-    reverse['Team2'] = np.where((reverse.WTeamID < reverse.LTeamID), reverse.WTeamID, reverse.LTeamID)
-    reverse['target'] = np.where((reverse['WTeamID'] > reverse['LTeamID']),1,0)
-    reverse['target_points'] = np.where((reverse['WTeamID'] > reverse['LTeamID']),
-                                        reverse.WScore - reverse.LScore,
-                                        reverse.LScore - reverse.WScore)
-    reverse.loc[reverse.WLoc == 'N', 'LLoc'] = 'N'
-    reverse.loc[reverse.WLoc == 'H', 'LLoc'] = 'A'
-    reverse.loc[reverse.WLoc == 'A', 'LLoc'] = 'H'
-    reverse['T1_Loc'] = np.where((reverse.WTeamID > reverse.LTeamID), reverse.WLoc, reverse.LLoc)
-    reverse['T2_Loc'] = np.where((reverse.WTeamID < reverse.LTeamID), reverse.WLoc, reverse.LLoc)
-    reverse['T1_Loc'] = reverse['T1_Loc'].map({'H': 1, 'A': -1, 'N': 0})
-    reverse['T2_Loc'] = reverse['T2_Loc'].map({'H': 1, 'A': -1, 'N': 0})
-    
-    df = pd.concat([df, reverse], ignore_index=True)
-
+    
+    data = data[data.Season >= limit]
     to_drop = ['WScore','WTeamID', 'LTeamID', 'LScore', 'WLoc', 'LLoc', 'NumOT']
-    for col in to_drop:
-        del df[col]
+    df = data[[col for col in data.columns if col not in to_drop]].reset_index(drop=True)
+    
+    w_team = data['WTeamID'].to_numpy()
+    l_team = data['LTeamID'].to_numpy()
+    w_score = data['WScore'].to_numpy()
+    l_score = data['LScore'].to_numpy()
+    w_loc = pd.Series(data['WLoc'].to_numpy(dtype=object)).map(LOC_CODES).to_numpy()
+    
+    # orientation of each game, 1 when the winner is Team1
+    winner_first = w_team < l_team
+    df['Team1'] = np.where(winner_first, w_team, l_team)
+    df['Team2'] = np.where(winner_first, l_team, w_team)
+    df['target'] = np.where(winner_first, 1, 0)
+    df['target_points'] = np.where(winner_first, w_score - l_score, l_score - w_score)
+    df['T1_Loc'] = np.where(winner_first, w_loc, -w_loc)
+    df['T2_Loc'] = -df['T1_Loc']
+    df.loc[:,'ID'] = make_ids(df.Season, df.Team1, df.Team2)
+    
+    if mirror:
+        df = pd.concat([df, mirror_teams_target(df)], ignore_index=True)
     
-    df.loc[:,'ID'] = df.Season.astype(str) + '_' + df.Team1.astype(str) + '_' + df.Team2.astype(str)
     return df
 
 
+def mirror_teams_target(data):
+    '''
+    Swaps Team1 and Team2 of the targets of make_teams_target (e.g. to get the other orientation 
+    of make_teams_target(..., mirror=False) only when a model needs both)
+    '''
+    df = data.rename(columns={'Team1': 'Team2', 'Team2': 'Team1', 'T1_Loc': 'T2_Loc', 'T2_Loc': 'T1_Loc'})
+    df['target'] = 1 - df['target']
+    df['target_points'] = -df['target_points']
+    df.loc[:,'ID'] = make_ids(df.Season, df.Team1, df.Team2)
+    
+    return df[list(data.columns)]
 
-def prepare_data(league):
+
+def _run_season(task):
+    '''
+    Runs a function on the games of one season (in the worker processes)
+    '''
+    func, season_data, kwargs = task
+    
+    return func(season_data, **kwargs)
+
+
+def by_season(func, data, n_workers=None, **kwargs):
+    '''
+    Runs func (e.g. process_details, full_stats, rolling_stats, perc_OT_win) on each Season of the data separately, 
+    in parallel in a process pool of n_workers (default is all the CPUs, 1 runs them here)
+    data is either a DataFrame or a dict of them by league (e.g. {'men': ..., 'women': ...}), 
+    in which case the seasons of all the leagues share the pool and a dict by league is returned
+    Results are put back together in season order, or in the order of the rows of the data 
+    when func keeps the rows (like process_details), so they are the same as func(data, **kwargs)
+    Only for functions that never mix seasons
+    '''
+    if isinstance(data, dict):
+        parts = {league: [(season, season_data) for season, season_data in league_data.groupby('Season', sort=True)] 
+                 for league, league_data in data.items()}
+    else:
+        parts = {None: [(season, season_data) for season, season_data in data.groupby('Season', sort=True)]}
+    tasks = [(func, season_data, kwargs) for league_parts in parts.values() for _, season_data in league_parts]
+    
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    
+    if (n_workers == 1) or (len(tasks) <= 1):
+        results = list(map(_run_season, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_run_season, tasks))
+    
+    output = {}
+    for league, league_parts in parts.items():
+        league_results = results[:len(league_parts)]
+        results = results[len(league_parts):]
+        if all(res.index.equals(season_data.index) for res, (_, season_data) in zip(league_results, league_parts)):
+            league_data = data[league] if league is not None else data
+            output[league] = pd.concat(league_results)
+            if league_data.index.is_unique:
+                output[league] = output[league].loc[league_data.index]
+        else:
+            output[league] = pd.concat(league_results, ignore_index=True)
+    
+    return output if isinstance(data, dict) else output[None]
+
+
+def prepare_data(league, cache_dir=None, refresh=False, n_workers=1):
+    '''
+    Runs the whole pipeline from the raw files to the training data
+    With cache_dir, the result of each stage is saved there (see StageCache) and only the stages 
+    whose inputs (files, data from the previous stage, parameters) or code (this module, the dataset schemas) 
+    changed are recomputed, n_workers doesn't change the results
+    refresh forces every stage (True) or some of them (list of function names) to be recomputed
+    With n_workers other than 1, the season stats are computed by season in parallel (see by_season)
+    '''
+    if cache_dir is None:
+        def run(func, *args, **kwargs):
+            return func(*args, **kwargs)
+    else:
+        run = StageCache(cache_dir, refresh=refresh, deps=[datasets]).run
+    
+    def run_seasons(func, data):
+        if n_workers == 1:
+            return run(func, data)
+        return run(by_season, func, data, n_workers=n_workers)
 
     if league == 'women':
         regular_season = 'stage_2/WRegularSeasonDetailedResults.csv'
@@ -664,17 +1149,17 @@ def prepare_data(league):
         save_loc = 'processed/'
     
     # Season stats
-    reg = pd.read_csv(regular_season)
-    reg = process_details(reg)
-    regular_stats = full_stats(reg)
+    reg = read_dataset(regular_season)
+    reg = run_seasons(process_details, reg)
+    regular_stats = run_seasons(full_stats, reg)
     
-    regular_stats = add_seed(seed, regular_stats)    
+    regular_stats = run(add_seed, seed, regular_stats)    
     
     # Target data generation 
-    target_data = pd.read_csv(playoff_compact)
-    target_data = make_teams_target(target_data, league)
+    target_data = read_dataset(playoff_compact)
+    target_data = run(make_teams_target, target_data, league)
     
-    all_reg = make_training_data(regular_stats, target_data)
+    all_reg = run(make_training_data, regular_stats, target_data)
     all_reg = all_reg[all_reg.DayNum >= 136]  # remove pre tourney 
     
     return all_reg, regular_stats
@@ -0,0 +1,112 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+## The bracket builder and the analysis utilities are imported as in the notebooks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [os.path.join(ROOT, 'viz'), os.path.join(ROOT, 'analysis')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+## Box score columns of the synthetic team games
+STAT_COLS = ['Score', 'FGM', 'FGA', 'FGM2', 'FGA2', 'FGM3', 'FGA3', 'FTM', 'FTA', 'FGM_no_ast',
+             'opp_score', 'opp_FGA', 'opp_FTA']
+
+
+@pytest.fixture
+def stat_cols():
+    return list(STAT_COLS)
+
+
+@pytest.fixture
+def make_games():
+    '''
+    Team games (one row per team per game, as team_games) of three teams over two seasons, a few scores missing
+    '''
+    def make(seed=0, n_games=120):
+        rng = np.random.default_rng(seed)
+        games = pd.DataFrame({'Season': rng.choice([2019, 2020], n_games),
+                              'DayNum': rng.integers(0, 60, n_games),
+                              'NumOT': 0,
+                              'TeamID': rng.choice([1101, 1102, 1103], n_games),
+                              'OppTeamID': 1200,
+                              'is_win': rng.random(n_games) < 0.5})
+        for col in STAT_COLS:
+            games[col] = rng.integers(1, 40, n_games).astype(float)
+        games.loc[rng.choice(n_games, 5, replace=False), 'Score'] = np.nan
+        
+        return games
+    
+    return make
+
+
+@pytest.fixture
+def make_details():
+    '''
+    Team-season stats with a non-numeric region column
+    '''
+    def make():
+        return pd.DataFrame({'Season': [2019, 2019, 2019, 2020, 2020],
+                             'TeamID': [1101, 1102, 1103, 1101, 1104],
+                             'Score': [70.5, 65.0, 80.25, 72.0, 60.0],
+                             'N_wins': [20, 15, 25, 18, 10],
+                             'Seed': [1, 16, 8, 2, 15],
+                             'region': ['W', 'X', 'Y', 'Z', 'W']})
+    
+    return make
+
+
+@pytest.fixture
+def make_targets():
+    '''
+    Tournament games of the teams of make_details
+    '''
+    def make():
+        return pd.DataFrame({'Season': [2019, 2019, 2020, 2020],
+                             'DayNum': [136, 137, 136, 138],
+                             'Team1': [1101, 1103, 1101, 1104],
+                             'Team2': [1102, 1101, 1104, 1101],
+                             'target': [1, 0, 1, 0]})
+    
+    return make
+
+
+## Event types of the play-by-play files (the last ones aren't scored)
+EVENT_TYPES = ['made1', 'made2', 'made3', 'miss1', 'miss2', 'miss3', 'reb', 'turnover', 'assist', 'steal', 'block',
+               'foul', 'sub', 'timeout']
+
+## Day, winner, loser and last second of the synthetic games: regulation, OT, 2OT, a tournament game,
+##  a game without 2nd half events and the women's game with odd seconds
+EVENT_GAMES = [(10, 1101, 1102, 2399), (10, 1103, 1104, 2399), (12, 1101, 1103, 2699), (14, 1102, 1104, 2999),
+               (135, 1101, 1104, 2399), (16, 1103, 1102, 1199), (80, 3111, 3117, 2399)]
+
+
+@pytest.fixture
+def make_events():
+    '''
+    Play-by-play events of a few games in the layout of the Kaggle Events files
+    '''
+    def make(seed=0, n_events=80, season=2021):
+        rng = np.random.default_rng(seed)
+        games = []
+        for day, w_team, l_team, last_second in EVENT_GAMES:
+            seconds = np.sort(rng.choice(last_second + 1, n_events, replace=False))
+            seconds[-1] = last_second
+            games.append(pd.DataFrame({'Season': season, 'DayNum': day, 'WTeamID': w_team, 'LTeamID': l_team,
+                                       'WFinalScore': 70 + day % 7, 'LFinalScore': 60,
+                                       'WCurrentScore': 0, 'LCurrentScore': 0, 'ElapsedSeconds': seconds,
+                                       'EventTeamID': rng.choice([w_team, l_team], n_events),
+                                       'EventPlayerID': rng.integers(1, 100, n_events),
+                                       'EventType': rng.choice(EVENT_TYPES, n_events),
+                                       'EventSubType': 'unk', 'X': 0, 'Y': 0, 'Area': 0}))
+        events = pd.concat(games, ignore_index=True)
+        events = events.sample(frac=1, random_state=seed).reset_index(drop=True)
+        events.insert(0, 'EventID', np.arange(len(events)) + 1)
+        
+        return events
+    
+    return make
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from mm_data_manipulation import by_season, rolling_windows
+
+
+def double_scores(data, factor=2):
+    '''
+    Keeps the rows of the data, like process_details
+    '''
+    return data.assign(Score=data['Score'] * factor)
+
+
+@pytest.fixture
+def shuffled_games(make_games):
+    ## Seasons mixed up and an index that isn't a range
+    games = make_games().sample(frac=1, random_state=0)
+    
+    return games.set_axis(games.index * 10 + 3)
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_by_season_keeps_rows_and_index(shuffled_games, n_workers):
+    result = by_season(double_scores, shuffled_games, n_workers=n_workers, factor=3)
+    
+    pd.testing.assert_frame_equal(result, double_scores(shuffled_games, factor=3))
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_by_season_new_rows(shuffled_games, n_workers):
+    result = by_season(rolling_windows, shuffled_games, n_workers=n_workers, windows=['30D', None])
+    
+    pd.testing.assert_frame_equal(result, rolling_windows(shuffled_games, windows=['30D', None]))
+
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_by_season_leagues(make_games, shuffled_games, n_workers):
+    women = make_games(seed=3, n_games=80)
+    women['TeamID'] += 2000
+    data = {'men': shuffled_games, 'women': women}
+    
+    result = by_season(double_scores, data, n_workers=n_workers)
+    
+    assert list(result) == ['men', 'women']
+    for league, league_data in data.items():
+        pd.testing.assert_frame_equal(result[league], double_scores(league_data))
@@ -0,0 +1,74 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bracket_builder.calculate import compute_round_probs
+from bracket_builder.slots import SlotTree, load_slot_tree
+
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'men')
+
+## An 8 team region with a play-in game for the 8 seed
+SLOTS = pd.DataFrame([['W08', 'W08a', 'W08b'],
+                      ['R1W1', 'W01', 'W08'], ['R1W2', 'W04', 'W05'],
+                      ['R1W3', 'W03', 'W06'], ['R1W4', 'W02', 'W07'],
+                      ['R2W1', 'R1W1', 'R1W2'], ['R2W2', 'R1W3', 'R1W4'],
+                      ['R3W1', 'R2W1', 'R2W2']], columns=['Slot', 'StrongSeed', 'WeakSeed'])
+
+
+def random_win_probs(n_teams, seed=0):
+    rng = np.random.default_rng(seed)
+    win_probs = rng.uniform(0.05, 0.95, (n_teams, n_teams))
+    win_probs = np.triu(win_probs, 1)
+    win_probs = win_probs + np.tril(1 - win_probs.T, -1)
+    np.fill_diagonal(win_probs, 0.5)
+    
+    return win_probs
+
+
+def brute_force(slot_tree, seed_teams, win_probs):
+    '''
+    Probability of winning each round, from every outcome of every game
+    '''
+    n_rounds = slot_tree.slot_rounds.max() + 1
+    round_won = np.zeros((win_probs.shape[0], n_rounds))
+    for outcome in itertools.product([0, 1], repeat=slot_tree.n_slots):
+        winners = [seed_teams[seed] for seed in slot_tree.seeds]
+        prob = 1
+        for slot, (strong, weak) in enumerate(slot_tree.children):
+            teams = [winners[strong], winners[weak]]
+            winner, loser = teams[outcome[slot]], teams[1 - outcome[slot]]
+            prob *= win_probs[winner, loser]
+            winners.append(winner)
+        for slot, rnd in enumerate(slot_tree.slot_rounds):
+            round_won[winners[slot + slot_tree.n_seeds], rnd] += prob
+    
+    return round_won
+
+
+def test_round_probs_match_brute_force():
+    slot_tree = SlotTree(SLOTS)
+    seed_teams = {seed: i for i, seed in enumerate(slot_tree.seeds)}
+    win_probs = random_win_probs(len(seed_teams))
+    
+    round_probs = compute_round_probs(slot_tree, seed_teams, win_probs)
+    expected = brute_force(slot_tree, seed_teams, win_probs)
+    
+    ## Only the play-in teams have to win a game to reach Round1
+    play_in = [seed_teams['W08a'], seed_teams['W08b']]
+    np.testing.assert_allclose(round_probs[play_in, 0], expected[play_in, 0])
+    np.testing.assert_allclose(np.delete(round_probs[:, 0], play_in), 1)
+    np.testing.assert_allclose(round_probs[:, 1:4], expected[:, 1:4])
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join(DATA, 'MNCAATourneySlots.csv')), reason='No slots file')
+def test_round_probs_add_up():
+    slot_tree = load_slot_tree(os.path.join(DATA, 'MNCAATourneySlots.csv'), 2019)
+    seed_teams = {seed: i for i, seed in enumerate(slot_tree.seeds)}
+    
+    round_probs = compute_round_probs(slot_tree, seed_teams, random_win_probs(len(seed_teams), seed=1))
+    np.testing.assert_allclose(round_probs.sum(axis=0), [64, 32, 16, 8, 4, 2, 1])
+    assert (np.diff(round_probs, axis=1) <= 1e-12).all()
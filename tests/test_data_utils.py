@@ -0,0 +1,62 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_utils import get_rolling_avg_round_reached, get_rolling_avg_rounds_reached, get_round_met
+
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'men')
+
+pytestmark = pytest.mark.skipif(not os.path.exists(os.path.join(DATA, 'MNCAATourneySlots.csv')),
+                                reason='No men\'s data')
+
+
+@pytest.fixture(autouse=True)
+def data_dir(monkeypatch):
+    monkeypatch.chdir(DATA)
+
+
+def test_games_after_a_play_in_have_a_round():
+    ## 2005: North Carolina (Z01) beat the play-in winner (Z16b) on its way to the title
+    games = pd.DataFrame({'Season': [2005, 2005, 2005], 'WSeed': ['Z16b', 'Z01', 'Z01'],
+                          'LSeed': ['Z16a', 'Z16b', 'X01']})
+    
+    np.testing.assert_array_equal(get_round_met('men', games), [1, 1, 6])
+
+
+def test_one_seed_season_with_a_play_in_counts():
+    ## The old tagging left the 1st round game against the play-in winner without a round, which
+    ##  could drop the whole season of the 1 seed from the totals
+    avg = get_rolling_avg_round_reached('men', by='team', start_season=2006, end_season=2007, n_year_avg=1)
+    
+    assert avg.loc[avg['TeamID'] == 1314, 'total_rounds_sum'].tolist() == [7]
+    assert avg.loc[avg['TeamID'] == 1324, 'total_rounds_sum'].tolist() == [1]
+    
+    avg = get_rolling_avg_round_reached('men', by='team', start_season=2006, end_season=2007, n_year_avg=3)
+    assert avg.loc[avg['TeamID'] == 1314, 'total_rounds_sum'].tolist() == [9]
+
+
+def test_unmatched_seed_raises():
+    with pytest.raises(ValueError):
+        get_round_met('men', pd.DataFrame({'Season': [2005], 'WSeed': ['Z17'], 'LSeed': ['Z01']}))
+
+
+def test_many_windows_match_one_at_a_time():
+    ## No regular season results here, so the seed's region and number stand in for the conference standings
+    seeds = pd.read_csv('MNCAATourneySeeds.csv')
+    conf_win_pcts = seeds.assign(ConfAbbrev=seeds['Seed'].str[0], rank_in_conf=seeds['Seed'].str[1:3].astype(int),
+                                 n_wins=0, n_losses=0).drop(columns='Seed')
+    
+    by, n_year_avgs = ['conf_standing', 'coach/team', 'team'], [1, 3, 5]
+    avg_dfs = get_rolling_avg_rounds_reached('men', by=by, start_season=2010, end_season=2016,
+                                             n_year_avgs=n_year_avgs, conf_win_pcts_df=conf_win_pcts)
+    
+    assert sorted(avg_dfs) == sorted(itertools.product(by, n_year_avgs))
+    for (by_mode, n_year_avg), avg_df in avg_dfs.items():
+        expected = get_rolling_avg_round_reached('men', by=by_mode, start_season=2010, end_season=2016,
+                                                 n_year_avg=n_year_avg, conf_win_pcts_df=conf_win_pcts)
+        assert len(avg_df) > 0
+        pd.testing.assert_frame_equal(avg_df, expected)
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bracket_builder import datasets
+from bracket_builder.datasets import CACHE_DIRNAME, load_dataset, load_rank_cube, read_dataset, schema_name
+
+
+SEEDS = 'Season,Seed,TeamID\n2019,W01,1101\n2019,W16,1102\n'
+
+ORDINALS = pd.DataFrame({'Season': [2019, 2019, 2019, 2019, 2019, 2020],
+                         'RankingDayNum': [10, 10, 10, 20, 20, 15],
+                         'SystemName': ['POM', 'SAG', 'AP', 'POM', 'SAG', 'POM'],
+                         'TeamID': [1101, 1101, 1101, 1101, 1101, 1103],
+                         'OrdinalRank': [4, 6, 100, 1, 3, 7]})
+
+
+@pytest.fixture(autouse=True)
+def no_memo(monkeypatch):
+    monkeypatch.setattr(datasets, '_datasets', datasets.OrderedDict())
+    monkeypatch.setattr(datasets, '_rank_cubes', {})
+
+
+def write(path, text, mtime=None):
+    path.write_text(text)
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+    
+    return str(path)
+
+
+def test_schema_names():
+    assert schema_name('stage_2/WNCAATourneySeeds.csv') == 'NCAATourneySeeds'
+    assert schema_name('MEvents2015.csv') == 'Events'
+    assert schema_name('Cities.csv') == 'Cities'
+    assert schema_name('predictions.csv') is None
+
+
+def test_read_with_schema_and_cache(tmp_path):
+    path = write(tmp_path / 'MNCAATourneySeeds.csv', SEEDS)
+    
+    seeds = read_dataset(path)
+    assert seeds.dtypes.astype(str).tolist() == ['int16', 'category', 'int16']
+    assert len(os.listdir(tmp_path / CACHE_DIRNAME)) == 1
+    
+    ## Copies are safe to modify, and the same data comes back from the binary copy
+    seeds.loc[0, 'TeamID'] = 0
+    assert read_dataset(path)['TeamID'].tolist() == [1101, 1102]
+    datasets._datasets.clear()
+    pd.testing.assert_frame_equal(read_dataset(path), load_dataset('NCAATourneySeeds', data_dir=str(tmp_path)))
+
+
+def test_changed_file_is_read_again(tmp_path):
+    path = write(tmp_path / 'MNCAATourneySeeds.csv', SEEDS, mtime=10 ** 18)
+    assert read_dataset(path)['TeamID'].tolist() == [1101, 1102]
+    
+    write(tmp_path / 'MNCAATourneySeeds.csv', SEEDS + '2019,X01,1103\n', mtime=2 * 10 ** 18)
+    assert read_dataset(path)['TeamID'].tolist() == [1101, 1102, 1103]
+    ## Only the latest version is memoized and cached
+    assert len(datasets._datasets) == 1
+    assert len(os.listdir(tmp_path / CACHE_DIRNAME)) == 1
+
+
+def test_memo_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(datasets, 'MAX_MEMOIZED', 2)
+    paths = [write(tmp_path / f'M{name}.csv', SEEDS) for name in ['NCAATourneySeeds', 'A', 'B']]
+    for path in paths + paths[:1]:
+        read_dataset(path, cache=False)
+    
+    assert [key[0] for key in datasets._datasets] == [os.path.abspath(p) for p in [paths[2], paths[0]]]
+
+
+def test_unwritable_cache_still_loads(tmp_path):
+    path = write(tmp_path / 'MNCAATourneySeeds.csv', SEEDS)
+    ## A file where the cache directory should be can't be written to, like a read-only directory
+    (tmp_path / CACHE_DIRNAME).write_text('')
+    
+    assert read_dataset(path)['TeamID'].tolist() == [1101, 1102]
+    ORDINALS.to_csv(tmp_path / 'MMasseyOrdinals.csv', index=False)
+    assert load_rank_cube(str(tmp_path / 'MMasseyOrdinals.csv')).lookup([2019], [10], [1101])[0] == 5
+
+
+def test_unreadable_copy_is_rewritten(tmp_path):
+    path = write(tmp_path / 'MNCAATourneySeeds.csv', SEEDS)
+    read_dataset(path)
+    datasets._datasets.clear()
+    (cache_file,) = (tmp_path / CACHE_DIRNAME).iterdir()
+    cache_file.write_bytes(b'not a copy')
+    
+    assert read_dataset(path)['TeamID'].tolist() == [1101, 1102]
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_rank_cube_lookup(tmp_path, cache):
+    ORDINALS.to_csv(tmp_path / 'MMasseyOrdinals.csv', index=False)
+    cube = load_rank_cube(str(tmp_path / 'MMasseyOrdinals.csv'), cache=cache, chunksize=2)
+    if cache:
+        datasets._rank_cubes.clear()
+        cube = load_rank_cube(str(tmp_path / 'MMasseyOrdinals.csv'))
+        assert isinstance(cube.ranks, np.memmap)
+    
+    ## Ranks are as of the latest release (without the excluded AP), NaN before the first one and
+    ##  for unknown seasons and teams
+    ranks = cube.lookup([2019, 2019, 2019, 2019, 2019, 2020, 2020, 2018, 2019],
+                        [5, 10, 15, 20, 150, 20, 10, 20, 20],
+                        [1101, 1101, 1101, 1101, 1101, 1103, 1103, 1101, 1199])
+    np.testing.assert_array_equal(ranks, [np.nan, 5, 5, 2, 2, 7, np.nan, np.nan, np.nan])
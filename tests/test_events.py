@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bracket_builder.datasets import read_dataset_chunks
+from mm_data_manipulation import (EVENT_COLS, event_count, game_events, lead_changes, make_scores, quarter_score,
+                                  score_events, stream_game_events)
+
+
+def reference(events, men):
+    return lead_changes(quarter_score(make_scores(events), men))
+
+
+@pytest.mark.parametrize('men', [True, False])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_score_events_matches_the_steps(make_events, men, seed):
+    events = make_events(seed)
+    expected = reference(events, men).reset_index(drop=True)
+    scores = score_events(events, men)
+    
+    assert sorted(scores.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(scores[expected.columns], expected, check_dtype=False)
+
+
+def test_score_events_special_games(make_events):
+    scores = score_events(make_events(), men=False)
+    games = scores.groupby(['DayNum', 'WTeamID'])
+    
+    ## Overtimes, no lead changes without a 2nd half, and the women's odd game left out
+    assert games['n_OT'].first().to_dict() == {(10, 1101): 0, (10, 1103): 0, (12, 1101): 1, (14, 1102): 2,
+                                               (16, 1103): 0, (135, 1101): 0}
+    assert (games[['game_lc', 'half2_lc', 'crunchtime_lc']].first().loc[(16, 1103)] == 0).all()
+    assert scores['game_lc'].max() > 0
+    assert 3111 in score_events(make_events(), men=True)['WTeamID'].tolist()
+
+
+def _scoreinblock(data, text):
+    
+    df = data.groupby('tmp_gameID', as_index=False)[['WFinalScore', 'LFinalScore', 'WCurrentScore', 'LCurrentScore']].min()
+    df[f'Wpoints_made_{text}'] = df['WFinalScore'] - df['WCurrentScore']
+    df[f'Lpoints_made_{text}'] = df['LFinalScore'] - df['LCurrentScore']
+    
+    return df[['tmp_gameID', f'Wpoints_made_{text}', f'Lpoints_made_{text}']]
+
+
+def _statcount(data, stat, text):
+    
+    tmp = data.copy()
+    tmp['is_stat'] = np.where(tmp.EventType==stat, 1, 0)
+    tmp = tmp.groupby(['tmp_gameID', 'EventTeamID'], as_index=False).is_stat.sum()
+    
+    return tmp.rename(columns={'is_stat': text})
+
+
+def reference_event_count(data):
+    '''
+    event_count as it was, with a _statcount and two merges per stat and period
+    '''
+    df = data.copy()
+    df['tmp_gameID'] = df['DayNum'].astype(str) + '_' + df['WTeamID'].astype(str) + '_' + df['LTeamID'].astype(str)
+    
+    half2 = _scoreinblock(df[df.period==2], 'half2')
+    crunch = _scoreinblock(df[df.crunch==1], 'crunchtime')
+    
+    add_ons = pd.merge(half2, crunch, on='tmp_gameID')
+    add_ons = pd.merge(add_ons, df[['tmp_gameID', 'WTeamID', 'LTeamID']].drop_duplicates(), on='tmp_gameID')
+    
+    stats = ['made1', 'made2', 'made3', 'miss1', 'miss2', 'miss3', 'reb', 'turnover', 'assist', 'steal', 'block']
+    for period, tmp in [('game', df), ('half2', df[df.period==2]), ('crunchtime', df[df.crunch==1])]:
+        for stat in stats:
+            name = f'{stat}_{period}'
+            to_merge = _statcount(tmp, stat, name)
+            add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'WTeamID', 
+                                                       name: f'W{name}'}), on=['tmp_gameID', 'WTeamID'])
+            add_ons = pd.merge(add_ons, to_merge.rename(columns={'EventTeamID': 'LTeamID', 
+                                                       name: f'L{name}'}), on=['tmp_gameID', 'LTeamID'])
+    
+    for period in ['game', 'half2', 'crunchtime']:
+        add_ons[f'WAst_perc_{period}'] = (add_ons[f'Wassist_{period}'] / (add_ons[f'Wmade2_{period}'] + add_ons[f'Wmade3_{period}'])).fillna(0)
+        add_ons[f'LAst_perc_{period}'] = (add_ons[f'Lassist_{period}'] / (add_ons[f'Lmade2_{period}'] + add_ons[f'Lmade3_{period}'])).fillna(0)
+        add_ons[f'WFGM_perc_{period}'] = ((add_ons[f'Wmade2_{period}'] + add_ons[f'Wmade3_{period}'])
+                                          / (add_ons[f'Wmade2_{period}'] + add_ons[f'Wmade3_{period}'] + 
+                                             add_ons[f'Wmiss2_{period}'] + add_ons[f'Wmiss3_{period}'])).fillna(0)
+        add_ons[f'LFGM_perc_{period}'] = ((add_ons[f'Lmade2_{period}'] + add_ons[f'Lmade3_{period}'])
+                                          / ((add_ons[f'Lmade2_{period}'] + add_ons[f'Lmade3_{period}']) + 
+                                             add_ons[f'Lmiss2_{period}'] + add_ons[f'Lmiss3_{period}'])).fillna(0)
+        add_ons[f'WFGM3_perc_{period}'] = (add_ons[f'Wmade3_{period}'] / (add_ons[f'Wmade3_{period}'] + add_ons[f'Wmiss3_{period}'])).fillna(0)
+        add_ons[f'LFGM3_perc_{period}'] = (add_ons[f'Lmade3_{period}'] / (add_ons[f'Lmade3_{period}'] + add_ons[f'Lmiss3_{period}'])).fillna(0)
+        add_ons[f'WFTM_perc_{period}'] = (add_ons[f'Wmade1_{period}'] / (add_ons[f'Wmade1_{period}'] + add_ons[f'Wmiss1_{period}'])).fillna(0)
+        add_ons[f'LFTM_perc_{period}'] = (add_ons[f'Lmade1_{period}'] / (add_ons[f'Lmade1_{period}'] + add_ons[f'Lmiss1_{period}'])).fillna(0)
+    
+    unique_cols = ['Season', 'DayNum', 'tourney', 'tmp_gameID', 'WTeamID', 'LTeamID', 
+                   'WFinalScore', 'LFinalScore', 'Final_difference', 'n_OT', 
+                   'Halftime_difference', '3mins_difference', 
+                   'game_lc', 'half2_lc', 'crunchtime_lc']
+    to_drop = ['WTeamID', 'LTeamID'] + [col for col in add_ons if 'miss' in col]
+    df = pd.merge(df[unique_cols].drop_duplicates(), add_ons.drop(to_drop, axis=1), on='tmp_gameID')
+    del df['tmp_gameID']
+    
+    return df
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_event_count_matches_the_merges(make_events, seed):
+    events = make_events(seed, n_events=150)
+    ## The loser of the 2OT game has no events in crunch time
+    game = (events['DayNum'] == 14) & (events['ElapsedSeconds'] >= 37 * 60)
+    events.loc[game, 'EventTeamID'] = events.loc[game, 'WTeamID']
+    scores = score_events(events, men=True)
+    
+    expected = reference_event_count(scores)
+    counts = event_count(scores)
+    
+    assert counts.columns.tolist() == expected.columns.tolist()
+    pd.testing.assert_frame_equal(counts, expected, check_dtype=False)
+    assert any('_perc_' in col for col in counts.columns)
+    ## Games without 2nd half events or without events of a team in crunch time are dropped
+    assert set(zip(counts['DayNum'], counts['WTeamID'])) == {(10, 1101), (10, 1103), (12, 1101), (135, 1101), 
+                                                             (80, 3111)}
+
+
+@pytest.fixture
+def events_file(make_events, tmp_path):
+    events = make_events(n_events=60).sort_values('DayNum', kind='stable').reset_index(drop=True)
+    path = tmp_path / 'MEvents2021.csv'
+    events.to_csv(path, index=False)
+    
+    return events, str(path)
+
+
+def by_game(games):
+    return games.sort_values(['DayNum', 'WTeamID']).reset_index(drop=True)
+
+
+## A day of events is 60 to 120 rows, so every day is split across chunks
+@pytest.mark.parametrize('chunksize', [7, 45, 1000])
+def test_stream_game_events_matches_game_events(events_file, chunksize):
+    events, path = events_file
+    expected = by_game(game_events(events, men=True))
+    
+    chunks = list(read_dataset_chunks(path, columns=EVENT_COLS, chunksize=chunksize))
+    assert len(chunks) == -(-len(events) // chunksize)
+    streamed = by_game(stream_game_events(path, men=True, chunksize=chunksize))
+    
+    pd.testing.assert_frame_equal(streamed, expected, check_dtype=False)
+
+
+def test_stream_game_events_saves_games(events_file, tmp_path):
+    events, path = events_file
+    save_loc = tmp_path / 'games'
+    save_loc.mkdir()
+    
+    paths = stream_game_events([path], men=True, chunksize=45, save_loc=str(save_loc))
+    
+    assert paths == [str(save_loc / 'MEvents2021_games.csv')]
+    pd.testing.assert_frame_equal(by_game(pd.read_csv(paths[0])), by_game(game_events(events, men=True)), 
+                                  check_dtype=False)
+
+
+def test_stream_game_events_needs_sorted_days(events_file):
+    _, path = events_file
+    events = pd.read_csv(path).sort_values('DayNum', ascending=False)
+    events.to_csv(path, index=False)
+    
+    with pytest.raises(ValueError):
+        stream_game_events(path, chunksize=45)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mm_data_manipulation import FeatureStore, make_training_data
+
+
+def merged_reference(details, targets):
+    '''
+    The training data with merges, as before the store
+    '''
+    total = targets
+    for team in ['Team1', 'Team2']:
+        tmp = details.rename(columns={'TeamID': team})
+        tmp.columns = [col if col in ['Season', team] else f'T{team[-1]}_{col}' for col in tmp.columns]
+        total = pd.merge(total, tmp, on=['Season', team], how='left')
+    stats = [col[3:] for col in total.columns if 'T1_' in col and 'region' not in col]
+    for stat in stats:
+        total['delta_'+stat] = total['T1_'+stat] - total['T2_'+stat]
+    
+    return total
+
+
+def test_make_training_data_matches_merge(make_details, make_targets):
+    details, targets = make_details(), make_targets()
+    
+    pd.testing.assert_frame_equal(make_training_data(details, targets), merged_reference(details, targets))
+
+
+def test_frame_and_store_give_the_same_data(make_details, make_targets, tmp_path):
+    details, targets = make_details(), make_targets()
+    expected = make_training_data(details, targets)
+    
+    store = FeatureStore.from_frame(details)
+    assert store.columns == ['Score', 'N_wins', 'Seed']
+    pd.testing.assert_frame_equal(make_training_data(store, targets), expected)
+    
+    ## The labels and dtypes are saved too
+    store.save(str(tmp_path))
+    pd.testing.assert_frame_equal(make_training_data(FeatureStore.load(str(tmp_path)), targets), expected)
+    pd.testing.assert_frame_equal(FeatureStore.load(str(tmp_path)).to_frame(), details)
+
+
+def test_missing_team(make_details, make_targets):
+    store = FeatureStore.from_frame(make_details())
+    
+    assert np.isnan(store.gather([2020], [1102])).all()
+    with pytest.raises(ValueError):
+        make_training_data(store, make_targets().assign(Team2=1199))
+
+
+def test_labels_keep_their_place(make_details, make_targets, tmp_path):
+    details = make_details()[['Season', 'TeamID', 'Score', 'region', 'N_wins', 'Seed']]
+    targets = make_targets()
+    expected = merged_reference(details, targets)
+    
+    total = make_training_data(details, targets)
+    assert total.columns.tolist() == expected.columns.tolist()
+    pd.testing.assert_frame_equal(total, expected)
+    
+    store = FeatureStore.from_frame(details)
+    store.save(str(tmp_path))
+    pd.testing.assert_frame_equal(FeatureStore.load(str(tmp_path)).to_frame(), details)
+    pd.testing.assert_frame_equal(make_training_data(FeatureStore.load(str(tmp_path)), targets), expected)
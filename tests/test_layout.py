@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from bracket_builder.layout import bracket_layout
+
+
+def baseline_team_spots(n_teams):
+    '''
+    Spots of the team names of the original label_teams
+    '''
+    xpos, ypos, step = (1, 66.5, 2) if n_teams == 64 else (21, 65.5, 4)
+    right_x = 200.8 if n_teams == 64 else 180.8
+    half = n_teams // 2
+    spots = []
+    for index in range(n_teams):
+        if index in [half // 2, 3 * half // 2]:
+            ypos -= 4
+        elif index == half:
+            xpos, ypos = right_x, 66.5 if n_teams == 64 else 65.5
+        spots.append((xpos, ypos))
+        ypos -= step
+    
+    return spots
+
+
+def baseline_winner_spots(n_teams):
+    '''
+    Spots of the winners of each round of the original label_winners
+    '''
+    y_steps = {1: 4, 2: 8, 3: 16, 4: 35}
+    y_init = {1: 65.5, 2: 62.5, 3: 58.5, 4: 50.5}
+    quad_y_step = {1: 4, 2: 3, 3: 3, 4: 0}
+    rd_teams_left = {1: 32, 2: 16, 3: 8, 4: 4, 5: 2, 6: 1}
+    
+    spots = {}
+    for rnd in range(1 if n_teams == 64 else 2, 7):
+        if rnd == 5:
+            spots[rnd] = [(101.5, 35.5), (105.5, 30.5)]
+            continue
+        if rnd == 6:
+            spots[rnd] = [(109, 60.25)]
+            continue
+        xpos, ypos = 1 + 20 * rnd, y_init[rnd]
+        teams_left = rd_teams_left[rnd]
+        spots[rnd] = []
+        for index in range(teams_left):
+            if index in [teams_left / 4, 3 * teams_left / 4]:
+                ypos -= quad_y_step[rnd]
+            elif index == teams_left / 2:
+                xpos, ypos = 200.8 - 20 * rnd, y_init[rnd]
+            spots[rnd].append((xpos, ypos))
+            ypos -= y_steps[rnd]
+    
+    return spots
+
+
+@pytest.mark.parametrize('n_teams', [64, 32])
+def test_spots_match_the_original_labels(n_teams):
+    layout = bracket_layout(n_teams)
+    teams = layout.round_table(0)
+    np.testing.assert_allclose(np.column_stack([teams['x'], teams['y']]), baseline_team_spots(n_teams))
+    
+    skipped = 0 if n_teams == 64 else 1
+    for rnd, spots in baseline_winner_spots(n_teams).items():
+        winners = layout.round_table(rnd - skipped)
+        np.testing.assert_allclose(np.column_stack([winners['x'], winners['y']]), spots)
+    assert layout.n_rounds == 7 - skipped
+
+
+def test_first_round_lines_match_the_original():
+    layout = bracket_layout(64)
+    teams = layout.round_table(0)
+    
+    ## The original drew the 1st round at y 0 to 30 and 36 to 66 (every 2), from x 0 to 20 and 200 to 220
+    ys = np.r_[np.arange(0, 32, 2), np.arange(36, 67, 2)][::-1]
+    np.testing.assert_allclose(teams['line_y'], np.r_[ys, ys])
+    np.testing.assert_allclose(teams['line_x0'], [0] * 32 + [200] * 32)
+    np.testing.assert_allclose(teams['line_x1'], [20] * 32 + [220] * 32)
+    assert list(layout.xlim) == [-1, 221]
+    assert list(bracket_layout(32).xlim) == [19, 201]
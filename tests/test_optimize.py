@@ -0,0 +1,58 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from bracket_builder.calculate import init_slot_dists, update_slot_dists
+from bracket_builder.optimize import ESPN_POINTS, optimal_picks
+from bracket_builder.slots import SlotTree
+
+from test_calculate import SLOTS, random_win_probs
+
+
+def brute_force_points(slot_tree, seed_teams, win_probs):
+    '''
+    Most expected ESPN points over every possible bracket
+    '''
+    node_dists = init_slot_dists(slot_tree, seed_teams, win_probs.shape[0])
+    update_slot_dists(slot_tree, node_dists, win_probs)
+    
+    best = -np.inf
+    for outcome in itertools.product([0, 1], repeat=slot_tree.n_slots):
+        winners = [seed_teams[seed] for seed in slot_tree.seeds]
+        points = 0
+        for slot, (strong, weak) in enumerate(slot_tree.children):
+            winner = [winners[strong], winners[weak]][outcome[slot]]
+            winners.append(winner)
+            points += node_dists[slot + slot_tree.n_seeds, winner] * ESPN_POINTS[slot_tree.slot_rounds[slot]]
+        best = max(best, points)
+    
+    return best
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_optimal_picks_match_brute_force(seed):
+    slot_tree = SlotTree(SLOTS)
+    seed_teams = {seed: i for i, seed in enumerate(slot_tree.seeds)}
+    win_probs = random_win_probs(len(seed_teams), seed=seed)
+    
+    _, expected_points = optimal_picks(slot_tree, seed_teams, win_probs)
+    
+    np.testing.assert_allclose(expected_points, brute_force_points(slot_tree, seed_teams, win_probs))
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_play_in_pick_is_the_likely_winner(reverse):
+    slot_tree = SlotTree(SLOTS)
+    seeds = list(slot_tree.seeds)
+    seed_teams = {seed: i for i, seed in enumerate(seeds[::-1] if reverse else seeds)}
+    ## The 1 seed is a lock, so the 8 seed play-in winner doesn't matter for the points
+    win_probs = random_win_probs(len(seed_teams))
+    top, play_in = seed_teams['W01'], [seed_teams['W08a'], seed_teams['W08b']]
+    win_probs[top, play_in], win_probs[play_in, top] = 1, 0
+    win_probs[play_in[0], play_in[1]], win_probs[play_in[1], play_in[0]] = 0.3, 0.7
+    
+    picks, _ = optimal_picks(slot_tree, seed_teams, win_probs)
+    
+    assert picks[list(slot_tree.slots).index('W08')] == seed_teams['W08b']
+    assert picks[list(slot_tree.slots).index('R1W1')] == top
@@ -0,0 +1,136 @@
+import io
+import os
+import threading
+import zipfile
+
+import matplotlib
+matplotlib.use('Agg')
+import pytest
+
+from bracket_builder.draw import Bracket
+from bracket_builder.render import (BracketRenderer, _BackgroundWriter, _QueuedFile, _bracket_config,
+                                    export_brackets, render_brackets)
+from bracket_builder.slots import load_slot_tree
+
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'men')
+
+
+TEAMS = [f'Team {i}' for i in range(16)]
+WINNERS = [TEAMS[::2], TEAMS[::4], TEAMS[::8], TEAMS[:1]]
+
+
+def brackets(n_brackets, fail_at=None):
+    for i in range(n_brackets):
+        if i == fail_at:
+            raise RuntimeError('bad bracket')
+        yield {'n_teams': 16, 'team_names': TEAMS, 'winners': WINNERS, 'filename': f'b{i}'}
+
+
+def test_renderer_only_keeps_the_last_labels():
+    renderer = BracketRenderer(16, figsize=(4, 3), dpi=30)
+    blank = renderer.render()
+    image = renderer.render(team_names=TEAMS, winners=WINNERS, win_prob_teams=TEAMS[:1],
+                            win_probabilities=[[0.9, 0.5]])
+    
+    assert image != blank
+    assert renderer.render(team_names=TEAMS, winners=WINNERS, win_prob_teams=TEAMS[:1],
+                           win_probabilities=[[0.9, 0.5]]) == image
+    assert renderer.render() == blank
+    assert len(renderer.ax.texts) == 0
+
+
+def test_render_brackets_in_parallel():
+    jobs = [{'team_names': TEAMS, 'winners': WINNERS}, {'team_names': TEAMS[::-1]}, {}]
+    
+    images = render_brackets(jobs, 16, n_workers=1, figsize=(4, 3), dpi=30)
+    assert render_brackets(jobs, 16, n_workers=2, chunk_size=1, figsize=(4, 3), dpi=30) == images
+    assert len(set(images)) == 3
+
+
+def test_export(tmp_path):
+    pdf_path, zip_path = tmp_path / 'brackets.pdf', tmp_path / 'brackets.zip'
+    
+    assert export_brackets(brackets(3), str(pdf_path), str(zip_path), figsize=(4, 3), dpi=30) == 3
+    assert pdf_path.read_bytes().startswith(b'%PDF')
+    assert pdf_path.read_bytes().rstrip().endswith(b'%%EOF')
+    with zipfile.ZipFile(zip_path) as png_zip:
+        assert png_zip.namelist() == ['b0.png', 'b1.png', 'b2.png']
+
+
+def test_failed_export_removes_partial_files(tmp_path):
+    pdf_path, zip_path = tmp_path / 'brackets.pdf', tmp_path / 'brackets.zip'
+    
+    ## The error of the brackets is the one raised, and no truncated file is left
+    with pytest.raises(RuntimeError, match='bad bracket'):
+        export_brackets(brackets(3, fail_at=2), str(pdf_path), str(zip_path), figsize=(4, 3), dpi=30)
+    assert not pdf_path.exists()
+    assert not zip_path.exists()
+
+
+def test_failed_open_removes_partial_files(tmp_path):
+    pdf_path = tmp_path / 'brackets.pdf'
+    
+    with pytest.raises(FileNotFoundError):
+        export_brackets(brackets(1), str(pdf_path), str(tmp_path / 'missing' / 'brackets.zip'))
+    assert not pdf_path.exists()
+
+
+def test_bracket_config_keeps_actual():
+    bracket = Bracket(16, team_names=TEAMS, winners=WINNERS, actual=True)
+    
+    assert _bracket_config(bracket)['actual'] is True
+    assert _bracket_config(Bracket(16, team_names=TEAMS))['actual'] is False
+
+
+@pytest.mark.skipif(not os.path.exists(os.path.join(DATA, 'MNCAATourneySlots.csv')), reason='No slots file')
+def test_export_68_teams(tmp_path):
+    slot_tree = load_slot_tree(os.path.join(DATA, 'MNCAATourneySlots.csv'), 2021)
+    bracket = Bracket(68, slot_tree=slot_tree)
+    bracket.team_names = bracket.layout.seed_order
+    bracket.winners = [bracket.team_names[:4]]
+    zip_path = tmp_path / 'brackets.zip'
+    
+    assert export_brackets([bracket, bracket, {'n_teams': 16, 'team_names': TEAMS}], str(tmp_path / 'b.pdf'),
+                           str(zip_path), figsize=(4, 3), dpi=30) == 3
+    with zipfile.ZipFile(zip_path) as png_zip:
+        assert len(png_zip.namelist()) == 3
+
+
+def test_background_writer_keeps_order_and_first_error():
+    out = []
+    writer = _BackgroundWriter(max_pending=2)
+    for i in range(20):
+        writer.submit(out.append, i)
+    writer.close()
+    assert out == list(range(20))
+    
+    def fail(message):
+        raise OSError(message)
+    
+    ## The first failed write is raised, and the later writes are skipped
+    queued = threading.Event()
+    writer = _BackgroundWriter()
+    writer.submit(queued.wait)
+    writer.submit(fail, 'first')
+    writer.submit(fail, 'second')
+    queued.set()
+    with pytest.raises(OSError, match='first'):
+        writer.close()
+    with pytest.raises(OSError, match='first'):
+        writer.submit(out.append, 0)
+
+
+def test_queued_file_writes_blocks_in_order():
+    fh = io.BytesIO()
+    writer = _BackgroundWriter()
+    stream = _QueuedFile(fh, writer, block_size=4)
+    
+    for chunk in [b'ab', b'cde', b'f', b'ghij']:
+        assert stream.write(chunk) == len(chunk)
+    assert stream.tell() == 10
+    with pytest.raises(OSError):
+        stream.seek(0)
+    stream.flush()
+    writer.close()
+    assert fh.getvalue() == b'abcdefghij'
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mm_data_manipulation import PERC_COLS, rolling_stats, rolling_windows
+
+
+def reference(games, window, stat_cols):
+    '''
+    Means of the previous days of each game with pandas' rolling, team-season by team-season
+    '''
+    df = games.assign(GameDay=pd.to_datetime(games['DayNum'], unit='D'))
+    df = df.sort_values(['Season', 'TeamID', 'DayNum'], kind='stable')
+    means = df.groupby(['Season', 'TeamID'])[stat_cols + ['GameDay']].rolling(
+        window, on='GameDay', min_periods=1, closed='left').mean()
+    
+    return means[stat_cols].to_numpy()
+
+
+@pytest.mark.parametrize('window', ['7D', '30D'])
+def test_rolling_windows_matches_rolling(make_games, stat_cols, window):
+    games = make_games()
+    stats = rolling_windows(games, [window])
+    
+    expected = reference(games, window, stat_cols)
+    np.testing.assert_allclose(stats[[col + '_' + window.lower() for col in stat_cols]].to_numpy(), expected)
+
+
+def test_rolling_windows_non_finite_is_missing(make_games, stat_cols):
+    games = make_games(seed=1)
+    bad = games.index[games['Season'] == 2019][0]
+    games.loc[bad, 'Score'] = np.inf
+    stats = rolling_windows(games, ['30D', None])
+    
+    ## The inf is skipped like a NaN, and the other team-seasons are untouched
+    expected = reference(games.replace(np.inf, np.nan), '30D', stat_cols)
+    np.testing.assert_allclose(stats[[col + '_30d' for col in stat_cols]].to_numpy(), expected)
+    assert np.isfinite(stats['Score_season'].dropna()).all()
+
+
+def test_rolling_stats_columns(make_games):
+    games = make_games()
+    stats = rolling_stats(games)
+    
+    assert list(stats.columns[:2]) == ['Season', 'TeamID']
+    assert list(stats.columns[-len(PERC_COLS):]) == PERC_COLS
+    assert 'DayNum' not in stats.columns
+    assert rolling_stats(games, season_info='MSeasons.csv').columns[-1] == 'DayNum'
+    assert stats[PERC_COLS].notna().all().all()
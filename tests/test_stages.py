@@ -0,0 +1,81 @@
+import importlib
+import os
+import sys
+
+import pandas as pd
+
+from bracket_builder import stages
+from bracket_builder.stages import StageCache
+
+
+STAGE = '''
+import pandas as pd
+
+
+def helper(df):
+    return df * {factor}
+
+
+def stage(df, n_workers=1):
+    return helper(df)
+'''
+
+
+def load_module(path, factor):
+    path.write_text(STAGE.format(factor=factor))
+    sys.modules.pop(path.stem, None)
+    
+    return importlib.import_module(path.stem)
+
+
+def test_key_changes_with_helper(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cache = StageCache(str(tmp_path / 'cache'))
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    
+    module = load_module(tmp_path / 'stage_module.py', 2)
+    key = cache.key(module.stage, df)
+    assert cache.run(module.stage, df)['a'].tolist() == [2, 4, 6]
+    
+    ## Only the helper changes, the stage's own source is the same
+    module = load_module(tmp_path / 'stage_module.py', 10)
+    assert cache.key(module.stage, df) != key
+    assert cache.run(module.stage, df)['a'].tolist() == [10, 20, 30]
+
+
+def test_key_ignores_execution_args(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cache = StageCache(str(tmp_path / 'cache'))
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    module = load_module(tmp_path / 'workers_module.py', 2)
+    
+    assert cache.key(module.stage, df, n_workers=1) == cache.key(module.stage, df, n_workers=8)
+    assert cache.key(module.stage, df) != cache.key(module.stage, df * 2)
+
+
+def test_key_includes_deps(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    module = load_module(tmp_path / 'deps_module.py', 2)
+    dep = load_module(tmp_path / 'dep_module.py', 3)
+    key = StageCache(str(tmp_path), deps=[dep]).key(module.stage, df)
+    
+    dep = load_module(tmp_path / 'dep_module.py', 30)
+    assert StageCache(str(tmp_path), deps=[dep]).key(module.stage, df) != key
+
+
+def test_failed_parquet_falls_back_to_pickle(tmp_path, monkeypatch):
+    def broken_to_parquet(self, path, **kwargs):
+        with open(path, 'wb') as f:
+            f.write(b'PAR1')
+        raise ValueError('Unsupported column type')
+    
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(stages, 'parquet', object())
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', broken_to_parquet)
+    cache = StageCache(str(tmp_path / 'cache'))
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    module = load_module(tmp_path / 'parquet_module.py', 2)
+    
+    assert cache.run(module.stage, df)['a'].tolist() == [2, 4, 6]
+    assert [name.split('.', 1)[1] for name in os.listdir(tmp_path / 'cache')] == ['pkl']
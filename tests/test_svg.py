@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+import pytest
+
+from bracket_builder.constants import ROUND_COLS
+from bracket_builder.svg import SvgRenderer
+
+
+def labels(n_teams):
+    teams = [f'Team {i} & co' for i in range(n_teams)]
+    winners = []
+    names = teams
+    while len(names) > 1:
+        names = names[::2]
+        winners.append(names)
+    probs = pd.DataFrame({'TeamName': teams})
+    for rnd, col in enumerate(ROUND_COLS):
+        probs[col] = [0.5 ** rnd / (1 + i % 3) for i in range(n_teams)]
+    
+    return {'team_names': teams, 'winners': winners, 'probs_df': probs,
+            'win_prob_teams': teams[:2], 'win_probabilities': [[0.9, 0.5], [0.8, 0.3, 0.1]]}
+
+
+@pytest.mark.parametrize('n_teams', [16, 32, 64])
+def test_output_is_stable(n_teams):
+    document = SvgRenderer(n_teams).render(format='html', **labels(n_teams))
+    
+    ## A new renderer gives the same bytes
+    assert SvgRenderer(n_teams).render(format='html', **labels(n_teams)) == document
+    svg = SvgRenderer(n_teams).draw(**labels(n_teams))
+    root = ET.fromstring(svg)
+    assert len(root.findall('.//{http://www.w3.org/2000/svg}text')) == 2 * n_teams - 1
+
+
+def test_labels_must_fit_the_layout():
+    renderer = SvgRenderer(16)
+    teams = [f'Team {i}' for i in range(16)]
+    
+    with pytest.raises(ValueError):
+        renderer.draw(team_names=teams + ['Extra'])
+    with pytest.raises(ValueError):
+        renderer.draw(team_names=teams, winners=[teams[:9]])
+    with pytest.raises(ValueError):
+        renderer.draw(team_names=teams, winners=[teams[:8], teams[:4], teams[:2], teams[:1], teams[:1]])
+    assert renderer.draw(team_names=teams, winners=[teams[:8], teams[:4]])
+
+
+def test_import_is_light():
+    code = ('import sys, bracket_builder.svg; '
+            'print(any(m in sys.modules for m in ["bracket_builder.calculate", "bracket_builder.datasets", '
+            '"matplotlib"]))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            env={'PYTHONPATH': ':'.join(sys.path)})
+    
+    assert output.stdout.strip() == 'False'
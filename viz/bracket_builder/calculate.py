@@ -1,182 +1,182 @@
-import os
 import numpy as np
 import pandas as pd
 
+from bracket_builder.constants import ROUND_COLS
+from bracket_builder.datasets import load_dataset, read_dataset
+from bracket_builder.slots import load_slot_tree
+from bracket_builder.submission import read_submission
 
-def exhaust_possible_seeds(tourney_slots_df, seeds, max_depth_seeds = None):
+
+def build_win_prob_matrix(sub_df, team_ids):
     """
-    Recursive function to get all of the possible seeds for each slot.
-     Can be used to add a "possible_teams" column to the tournament slots data
+    Load a submission into a dense team x team matrix of win probabilities.
 
     Parameters
     ----------
-    tourney_slots_df : DataFrame
-        The provided tournament slots data.
-    parent_seeds : list
-        A list of seeds from each round. (When rd > 1 they are really the names of rounds).
+    sub_df : DataFrame
+        Submission with 'TeamID_1', 'TeamID_2' and 'Pred' (probability that TeamID_1 wins).
+    team_ids : list of int
+        Teams to keep, in the order used for the rows/columns of the matrix.
 
     Returns
     -------
-    list
-        A list of all possible seeds that could reach that round.
+    win_probs : np.array
+        Matrix where win_probs[i, j] is the probability that team i beats team j.
+    """
+    team_idx = pd.Index(team_ids)
+    idx_1 = team_idx.get_indexer(sub_df['TeamID_1'])
+    idx_2 = team_idx.get_indexer(sub_df['TeamID_2'])
+    in_field = (idx_1 >= 0) & (idx_2 >= 0)
+    preds = sub_df['Pred'].to_numpy(dtype=float)[in_field]
+
+    win_probs = np.full((len(team_idx), len(team_idx)), np.nan)
+    win_probs[idx_1[in_field], idx_2[in_field]] = preds
+    win_probs[idx_2[in_field], idx_1[in_field]] = 1 - preds
+    np.fill_diagonal(win_probs, 0.5)
+
+    if np.isnan(win_probs).any():
+        raise ValueError(f'Submission is missing {int(np.isnan(win_probs).sum() / 2)} matchups')
 
+    return win_probs
+
+
+def update_slot_dists(slot_tree, node_dists, win_probs, slots = None):
     """
+    Fill in the winner distributions of slots from the two nodes feeding each one, a round at a time.
+
+    Each slot holds the distribution of its winner over all teams, and the winners of a whole
+     round are computed at once from the two distributions feeding each slot:
+        P(i wins slot) = P(i from strong side) * sum_j P(j from weak side) * P(i beats j) + (vice versa)
+
+    Parameters
+    ----------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    node_dists : np.array
+        (nodes x teams) distribution of the team in each seed/slot, updated in place.
+    win_probs : np.array
+        Matrix where win_probs[i, j] is the probability that team i beats team j.
+    slots : np.array
+        Optional. Slot numbers to recompute (default is every slot).
+    """
+    if slots is None:
+        slots = np.arange(slot_tree.n_slots)
     
-    ## Get slots that seeds came from (earlier in the tourney)
-    earlier_rd_rows = tourney_slots_df[tourney_slots_df['Slot'].isin(seeds)].copy()
-    
-    ## Get the round that these are still "seeds"
-    seed_rd_rows = tourney_slots_df[(tourney_slots_df['StrongSeed'].isin(seeds)) |
-                                    (tourney_slots_df['WeakSeed'].isin(seeds))].copy()
-    ## Find the earliest round that the seed is in
-    min_round_seeds = np.min(seed_rd_rows['round'])
-    
-    ## Find the ones in this dataframe that are new
-    new_seeds = list((set(earlier_rd_rows['StrongSeed']) | set(earlier_rd_rows['WeakSeed'])) - set(seeds))
-    if min_round_seeds == 1:
-        seeds_reached_max_depth = list(set(seeds) - set(new_seeds))
-    else:
-        seeds_reached_max_depth = None
-    
-    if len(new_seeds) > 0:
-        ## If there's another level deeper, add new seeds we got this time, and run again
-        return exhaust_possible_seeds(tourney_slots_df, new_seeds, seeds_reached_max_depth)
-    else:
-        ## If this is the deepest level, don't run it again, just return the list
-        if min_round_seeds == 0:
-            possible_seeds = seeds
-            if max_depth_seeds is not None:
-                possible_seeds.extend(max_depth_seeds)
-        else:
-            possible_seeds = seeds
-        
-        possible_seeds = list(set([s for s in possible_seeds if s not in tourney_slots_df['Slot']]))  ## dedup
-        possible_seeds.sort()
+    for rnd in np.unique(slot_tree.slot_rounds[slots]):
+        rd_slots = slots[slot_tree.slot_rounds[slots] == rnd]
+        strong = node_dists[slot_tree.children[rd_slots, 0]]
+        weak = node_dists[slot_tree.children[rd_slots, 1]]
         
-        return possible_seeds
+        ## (slots x teams) probability of winning each slot in the round
+        node_dists[rd_slots + slot_tree.n_seeds] = (strong * (weak @ win_probs.T) +
+                                                     weak * (strong @ win_probs.T))
 
 
-def get_round_met(tourney_slots_df, seed_1, seed_2):
+def round_probs_from_dists(slot_tree, node_dists):
     """
-    Get the round that two seeds meet in the slots dataframe
+    Add up the slot winner distributions into the probability of reaching each round.
 
     Parameters
     ----------
-    tourney_slots_df : DataFrame
-        The provided tournament slots data.
-    seed_1 : str
-        Seed of team 1.
-    seed_2 : str
-        Seed of team 2.
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    node_dists : np.array
+        (nodes x teams) distribution of the team in each seed/slot.
 
     Returns
     -------
-    rd : int
-        Minimum round number that two teams can feasibly meet.
+    round_probs : np.array
+        (teams x 7) array with the probability of reaching Round1, Round2, ..., and winning the title.
     """
+    n_teams = node_dists.shape[1]
+    round_probs = np.ones((n_teams, len(ROUND_COLS)))
     
-    teams_in_slot = tourney_slots_df.possible_teams.apply(lambda x: ((seed_1 in x) and 
-                                                                    (seed_2 in x)))
-    slots_with_teams = tourney_slots_df[teams_in_slot]
-    
-    rd = np.min(slots_with_teams['round'])
+    for rnd in slot_tree.rounds():
+        rd_slots = slot_tree.round_slots(rnd)
+        round_won = node_dists[rd_slots + slot_tree.n_seeds].sum(axis = 0)
+        
+        ## Winning a round means reaching the next one (play-in teams have to win to reach Round1)
+        if rnd == 0:
+            playin_nodes = slot_tree.children[rd_slots].ravel()
+            playin_teams = node_dists[playin_nodes].sum(axis = 0) > 0
+            round_probs[playin_teams, 0] = round_won[playin_teams]
+        else:
+            round_probs[:, rnd] = round_won
     
-    return rd
+    return round_probs
 
 
-def find_round_prob(sub_df, probs_df, team_id, rnd):
+def init_slot_dists(slot_tree, seed_teams, n_teams):
     """
-    Get the probability that a given team reaches a round
-    
+    Start the (nodes x teams) slot distributions with every team in its seed.
+
     Parameters
     ----------
-    sub_df : DataFrame
-        Submission dataframe with round added.
-    team_name : str
-        Name of team.
-    rnd : int
-        Round of interest to get probability for.
-    
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    seed_teams : dict
+        Seed (e.g. 'W16a') to row/column index of the team in win_probs.
+    n_teams : int
+        Number of teams in the field.
+
     Returns
     -------
-    rnd_prob : float
-        Probability that a team reaches the round.
+    node_dists : np.array
+        (nodes x teams) with one-hot rows for the seeds and zeros for the slots.
     """
-    ## Get all possible matchups for the team in prior round
-    team_round_preds = sub_df[((sub_df['TeamID_1'] == team_id) | 
-                               (sub_df['TeamID_2'] == team_id)) &
-                               (sub_df['round'] == rnd-1)].copy()
+    node_dists = np.zeros((slot_tree.n_seeds + slot_tree.n_slots, n_teams))
+    seed_nodes = slot_tree.node_index.get_indexer(list(seed_teams.keys()))
+    node_dists[seed_nodes, list(seed_teams.values())] = 1
     
-    ## Defining a dict of column names corresponding to the round before
-    rd_cols = {0: 'Round0',
-               1: 'Round1',
-               2: 'Round2',
-               3: 'Sweet16',
-               4: 'Elite8',
-               5: 'Final4',
-               6: 'Final',
-               7: 'Champ'}
-    
-    if len(team_round_preds) == 1:
-        ## only 1 matchup to worry about, just get the corresponding prob for that team
-        if team_id in list(team_round_preds['TeamID_1']):
-            rnd_prob = float(team_round_preds['Pred'])
-        else:
-            rnd_prob = 1-float(team_round_preds['Pred'])
-        if rnd > 0:
-            team_prob_reaching = float(probs_df[probs_df['TeamID'] == team_id][rd_cols[rnd-1]])
-            rnd_prob = rnd_prob*team_prob_reaching
-    elif len(team_round_preds) == 0:
-        ## If they didn't have any games in the prior round, 
-        ### probability is 1 (applies to non-play-in teams making round 1)
-        rnd_prob = 1
-    else:
-        ## Using a json-like structure containing probabilities that an opposing team would make that round
-        ### and probability that the team of interest would beat that team
-        conditional_team_probs = {}
-        
-        ## Keys for the dict: possible teams
-        possible_teams = list((set(team_round_preds['TeamID_1']) | 
-                               set(team_round_preds['TeamID_2'])) - set([team_id]))
-        
-        ## Used for lookup in value 1 below
-        prob_reaching_df = (probs_df[probs_df['TeamID'].isin(possible_teams)]
-                                     [['TeamID', rd_cols[rnd-1]]]
-                                     .rename(columns = {rd_cols[rnd-1]: 'prob_reaching_rd'}))
-        
-        for t in possible_teams:
-            within_dict = {}
-            ## Value 1 (conditional part): chances that the opposing teams make the round
-            within_dict['prob_reaching'] = float(prob_reaching_df[prob_reaching_df['TeamID'] == t]['prob_reaching_rd'])            
-            
-            ## Value 2: win probability for the team of interest over the possible opposing team
-            if team_id < t:
-                win_prob = float(team_round_preds[team_round_preds['TeamID_2'] == t]['Pred'])
-            else:
-                win_prob = 1-float(team_round_preds[team_round_preds['TeamID_1'] == t]['Pred'])
-            within_dict['win_prob'] = win_prob
-            conditional_team_probs[t] = within_dict
-        
-        ### Get probability for the team for the prior round
-        team_prob_reaching = float(probs_df[probs_df['TeamID'] == team_id][rd_cols[rnd-1]])
-        
-        ### Calculate probability of making to the round of interest
-        rnd_games_probs = (np.sum([(t['prob_reaching']*t['win_prob'])
-                             for t in conditional_team_probs.values()]))
-        
-        rnd_prob = rnd_games_probs*team_prob_reaching
+    return node_dists
+
+
+def compute_round_probs(slot_tree, seed_teams, win_probs):
+    """
+    Walk the slot tree from the play-in games to the championship and get the probability
+     that each team reaches each round.
+
+    Parameters
+    ----------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    seed_teams : dict
+        Seed (e.g. 'W16a') to row/column index of the team in win_probs.
+    win_probs : np.array
+        Matrix where win_probs[i, j] is the probability that team i beats team j.
+
+    Returns
+    -------
+    round_probs : np.array
+        (teams x 7) array with the probability of reaching Round1, Round2, ..., and winning the title.
+    """
+    node_dists = init_slot_dists(slot_tree, seed_teams, win_probs.shape[0])
+    update_slot_dists(slot_tree, node_dists, win_probs)
     
-    return rnd_prob
+    return round_probs_from_dists(slot_tree, node_dists)
 
 
-def compute_conditional_probs(sub_filepath, season, league = 'men'):
+def load_tourney_field(sub_filepath, season, league = 'men'):
     """
-    Function to take the submission file and calculate conditional probabilities for each team/round.
+    Read a submission along with the seeds and slots for one season's tournament.
 
-    :param sub_filepath (str): location of Kaggle data submission
-    :param league (str): either 'men' or 'women'
-    :return: DataFrame containing probabilities for each team to make each round
+    Parameters
+    ----------
+    sub_filepath : str
+        Location of Kaggle data submission.
+    season : int
+        Season of the tournament.
+    league : str
+        Either 'men' or 'women'.
 
+    Returns
+    -------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    tourney_seeds_df : DataFrame
+        Seeds for the season (team i of win_probs is row i).
+    win_probs : np.array
+        Matrix where win_probs[i, j] is the probability that team i beats team j.
     """
     
     ## Prefix according to league
@@ -186,71 +186,74 @@ def compute_conditional_probs(sub_filepath, season, league = 'men'):
         prefix = 'W'
     
     ## Get the sample submission and break out the ID
-    sub_df = pd.read_csv(sub_filepath)
-    sub_df['Season']    = sub_df['ID'].apply(lambda x: x.split('_')[0]).astype(int)
-    sub_df['TeamID_1']  = sub_df['ID'].apply(lambda x: x.split('_')[1]).astype(int)
-    sub_df['TeamID_2']  = sub_df['ID'].apply(lambda x: x.split('_')[2]).astype(int)
+    sub_df = read_submission(sub_filepath, season)
     
     ## Get the seeds and slots
-    tourney_seeds_df = pd.read_csv(f"stage_2/{prefix}NCAATourneySeeds.csv")
-    tourney_seeds_df = tourney_seeds_df[tourney_seeds_df['Season'] == season].copy()
+    tourney_seeds_df = read_dataset(f"stage_2/{prefix}NCAATourneySeeds.csv")
+    tourney_seeds_df = tourney_seeds_df[tourney_seeds_df['Season'] == season].reset_index(drop = True)
     if league == 'men':
-        tourney_slots_df = pd.read_csv(f"stage_2/{prefix}NCAATourneySlots.csv")
-        tourney_slots_df = tourney_slots_df[tourney_slots_df['Season'] == season].copy()
+        slot_tree = load_slot_tree(f"stage_2/{prefix}NCAATourneySlots.csv", season)
     else:
-        tourney_slots_df = pd.read_csv(f"stage_2/{prefix}NCAATourneySlots2022.csv")
+        slot_tree = load_slot_tree(f"stage_2/{prefix}NCAATourneySlots2022.csv")
     
-    ## Merge in seeds to submission
-    tourney_seeds_df = tourney_seeds_df.rename(columns = {'TeamID': 'TeamID_1', 'Seed': 'Seed_1'})
-    sub_df = sub_df.merge(tourney_seeds_df, on = ['TeamID_1', 'Season'])
-    tourney_seeds_df = tourney_seeds_df.rename(columns = {'TeamID_1': 'TeamID_2', 'Seed_1': 'Seed_2'})
-    sub_df = sub_df.merge(tourney_seeds_df, on = ['TeamID_2', 'Season'])
+    ## Dense matrix of win probabilities between all of the teams in the field
+    win_probs = build_win_prob_matrix(sub_df, list(tourney_seeds_df['TeamID']))
     
-    ## Add a field to slots with the possible teams that could reach that round
-    tourney_slots_df['round'] = tourney_slots_df['Slot'].apply(lambda x: int(x[1]) if x.startswith('R')
-                                                               else 0)
-    tourney_slots_df['possible_teams'] = tourney_slots_df.apply(lambda x: 
-                                        exhaust_possible_seeds(tourney_slots_df,
-                                                               [x['StrongSeed'],
-                                                                x['WeakSeed']]), axis = 1)
+    return slot_tree, tourney_seeds_df, win_probs
+
+
+def make_probs_df(round_probs, team_ids, league = 'men'):
+    """
+    Label an array of round probabilities with team names in the round-by-round format.
+
+    Parameters
+    ----------
+    round_probs : np.array
+        (teams x 7) array with the probability of reaching each round.
+    team_ids : list of int
+        Team ID of each row.
+    league : str
+        Either 'men' or 'women'.
+
+    Returns
+    -------
+    probs_df : DataFrame
+        Probabilities for each team to make each round, sorted by team name.
+    """
+    probs_df = pd.DataFrame(round_probs, columns = ROUND_COLS)
+    probs_df.insert(0, 'TeamID', list(team_ids))
     
-    ## Add a column to tourney results with the round that the 2 teams meet
-    sub_df['round'] = sub_df.apply(lambda x: get_round_met(tourney_slots_df, x['Seed_1'], x['Seed_2']),
-                                             axis = 1)
-        
     ## Get the team names to merge in
-    team_names_df = pd.read_csv(f"{prefix}Teams.csv")
+    team_names_df = load_dataset('Teams', league)
+    probs_df = probs_df.merge(team_names_df[['TeamID', 'TeamName']], on = 'TeamID')
+    probs_df = (probs_df[['TeamName', 'TeamID'] + ROUND_COLS]
+                .sort_values('TeamName').reset_index(drop = True))
     
-    ## Merge team 1 name
-    team_names_df = (team_names_df[['TeamID', 'TeamName']]
-                    .rename(columns={'TeamName': 'TeamName_1',
-                                     'TeamID': 'TeamID_1'}))
-    sub_df = sub_df.merge(team_names_df, how='left', on='TeamID_1')
-
-    ## Merge team 2 name
-    team_names_df = team_names_df.rename(columns={'TeamName_1': 'TeamName_2',
-                                            'TeamID_1': 'TeamID_2'})
-    sub_df = sub_df.merge(team_names_df, how='left', on='TeamID_2')
-        
-    ## For each team, go through each round and calculate the prob. that they'll be in the next round
-    ##  based on the submission.
-    team_names = list(set(sub_df['TeamName_1']) | set(sub_df['TeamName_2']))
-    team_names.sort()
-    probs_df = pd.DataFrame({'TeamName': team_names})
-    team_names_df = team_names_df.rename(columns={'TeamName_2': 'TeamName',
-                                            'TeamID_2': 'TeamID'})
-    probs_df = probs_df.merge(team_names_df, on = 'TeamName')
-    probs_df['Round0'] = 1
-    
-    ## Fill in probabilities, round by round
-    probs_df['Round1']  = probs_df['TeamID'].apply(lambda x: find_round_prob(sub_df, probs_df, x, 1))
-    probs_df['Round2']  = probs_df['TeamID'].apply(lambda x: find_round_prob(sub_df, probs_df, x, 2))
-    probs_df['Sweet16'] = probs_df['TeamID'].apply(lambda x: find_round_prob(sub_df, probs_df, x, 3))
-    probs_df['Elite8']  = probs_df['TeamID'].apply(lambda x: find_round_prob(sub_df, probs_df, x, 4))
-    probs_df['Final4']  = probs_df['TeamID'].apply(lambda x: find_round_prob(sub_df, probs_df, x, 5))
-    probs_df['Final']   = probs_df['TeamID'].apply(lambda x: find_round_prob(sub_df, probs_df, x, 6))
-    probs_df['Champ']   = probs_df['TeamID'].apply(lambda x: find_round_prob(sub_df, probs_df, x, 7))
+    return probs_df
+
+
+def compute_conditional_probs(sub_filepath, season, league = 'men'):
+    """
+    Take the submission file and calculate conditional probabilities for each team/round.
+
+    Parameters
+    ----------
+    sub_filepath : str
+        Location of Kaggle data submission.
+    season : int
+        Season of the tournament.
+    league : str
+        Either 'men' or 'women'.
+
+    Returns
+    -------
+    probs_df : DataFrame
+        Probabilities for each team to make each round, sorted by team name.
+    """
+    slot_tree, tourney_seeds_df, win_probs = load_tourney_field(sub_filepath, season, league)
+    seed_teams = dict(zip(tourney_seeds_df['Seed'], tourney_seeds_df.index))
     
-    probs_df = probs_df.drop(columns = ['Round0'])
+    ## Fill in probabilities for all of the rounds at once
+    round_probs = compute_round_probs(slot_tree, seed_teams, win_probs)
     
-    return probs_df
\ No newline at end of file
+    return make_probs_df(round_probs, tourney_seeds_df['TeamID'], league)
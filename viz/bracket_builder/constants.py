@@ -0,0 +1,5 @@
+## Columns with the probability that a team reaches each round (Champ is winning the last round)
+ROUND_COLS = ['Round1', 'Round2', 'Sweet16', 'Elite8', 'Final4', 'Final', 'Champ']
+
+## Top to bottom order of the seeds within a region on a printed bracket
+REGION_SEED_ORDER = [1, 16, 8, 9, 5, 12, 4, 13, 6, 11, 3, 14, 7, 10, 2, 15]
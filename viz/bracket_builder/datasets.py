@@ -0,0 +1,403 @@
+import hashlib
+import os
+import pickle
+import re
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+## Column types shared by the Kaggle files (IDs and box score counts are small integers)
+_GAME_COLS = {'Season': 'int16', 'DayNum': 'int16', 'WTeamID': 'int16', 'LTeamID': 'int16',
+              'WScore': 'int16', 'LScore': 'int16', 'WLoc': 'category', 'NumOT': 'int8'}
+_BOX_SCORE_COLS = {f'{side}{stat}': 'int16' for side in ['W', 'L']
+                   for stat in ['FGM', 'FGA', 'FGM3', 'FGA3', 'FTM', 'FTA', 'OR', 'DR',
+                                'Ast', 'TO', 'Stl', 'Blk', 'PF']}
+
+## Schemas of the Kaggle files by name (without the M/W prefix)
+SCHEMAS = {
+    'Teams': {'TeamID': 'int16', 'TeamName': 'object', 'FirstD1Season': 'int16', 'LastD1Season': 'int16'},
+    'Seasons': {'Season': 'int16', 'DayZero': 'object', 'RegionW': 'object', 'RegionX': 'object',
+                'RegionY': 'object', 'RegionZ': 'object'},
+    'NCAATourneySeeds': {'Season': 'int16', 'Seed': 'category', 'TeamID': 'int16'},
+    'NCAATourneySlots': {'Season': 'int16', 'Slot': 'object', 'StrongSeed': 'object', 'WeakSeed': 'object'},
+    'NCAATourneySeedRoundSlots': {'Seed': 'category', 'GameRound': 'int8', 'GameSlot': 'object',
+                                  'EarlyDayNum': 'int16', 'LateDayNum': 'int16'},
+    'RegularSeasonCompactResults': _GAME_COLS,
+    'NCAATourneyCompactResults': _GAME_COLS,
+    'SecondaryTourneyCompactResults': dict(_GAME_COLS, SecondaryTourney='category'),
+    'RegularSeasonDetailedResults': dict(_GAME_COLS, **_BOX_SCORE_COLS),
+    'NCAATourneyDetailedResults': dict(_GAME_COLS, **_BOX_SCORE_COLS),
+    'SecondaryTourneyTeams': {'Season': 'int16', 'SecondaryTourney': 'category', 'TeamID': 'int16'},
+    'TeamCoaches': {'Season': 'int16', 'TeamID': 'int16', 'FirstDayNum': 'int16', 'LastDayNum': 'int16',
+                    'CoachName': 'object'},
+    'TeamConferences': {'Season': 'int16', 'TeamID': 'int16', 'ConfAbbrev': 'category'},
+    'ConferenceTourneyGames': {'Season': 'int16', 'ConfAbbrev': 'category', 'DayNum': 'int16',
+                               'WTeamID': 'int16', 'LTeamID': 'int16'},
+    'GameCities': {'Season': 'int16', 'DayNum': 'int16', 'WTeamID': 'int16', 'LTeamID': 'int16',
+                   'CRType': 'category', 'CityID': 'int16'},
+    'TeamSpellings': {'TeamNameSpelling': 'object', 'TeamID': 'int16'},
+    'Cities': {'CityID': 'int16', 'City': 'object', 'State': 'category'},
+    'Conferences': {'ConfAbbrev': 'category', 'Description': 'object'},
+    'MasseyOrdinals': {'Season': 'int16', 'RankingDayNum': 'int16', 'SystemName': 'category',
+                       'TeamID': 'int16', 'OrdinalRank': 'int16'},
+    'Events': {'EventID': 'int32', 'Season': 'int16', 'DayNum': 'int16', 'WTeamID': 'int16',
+               'LTeamID': 'int16', 'WFinalScore': 'int16', 'LFinalScore': 'int16',
+               'WCurrentScore': 'int16', 'LCurrentScore': 'int16', 'ElapsedSeconds': 'int16',
+               'EventTeamID': 'int16', 'EventPlayerID': 'int32', 'EventType': 'category',
+               'EventSubType': 'category', 'X': 'int16', 'Y': 'int16', 'Area': 'int8'},
+}
+
+## Directory (next to the CSVs) for the binary copies of the files
+CACHE_DIRNAME = '.cache'
+
+## Loaded files by (absolute path, modification time, size), the least recently used dropped past
+##  MAX_MEMOIZED files (their binary copies on disk stay)
+MAX_MEMOIZED = 16
+_datasets = OrderedDict()
+
+## Ranking systems left out of the consensus ranks because their values are on very different ranges
+EXCLUDED_SYSTEMS = ('AP', 'USA', 'DES', 'LYN', 'ACU', 'TRX', 'D1A', 'JNG', 'BNT')
+
+## Rank cubes by (absolute path, modification time, size, excluded systems)
+_rank_cubes = {}
+
+## Errors of a binary copy that can't be read back (written by another version of pandas/pyarrow,
+##  or truncated), which is then parsed from the CSV again
+_CACHE_READ_ERRORS = (OSError, EOFError, ValueError, AttributeError, ImportError, pickle.UnpicklingError)
+
+
+def schema_name(filepath):
+    """
+    Get the schema name of a Kaggle file from its name, e.g. 'stage_2/MNCAATourneySeeds.csv'
+     -> 'NCAATourneySeeds' and 'MEvents2015.csv' -> 'Events'.
+
+    Parameters
+    ----------
+    filepath : str
+        Location of the file.
+
+    Returns
+    -------
+    str
+        Name of the schema (None if the file isn't a known Kaggle file).
+    """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    for candidate in [name, name[1:]]:
+        candidate = re.sub(r'(_\d+|\d+)$', '', candidate)
+        if candidate in SCHEMAS:
+            return candidate
+
+    return None
+
+
+def read_dataset(filepath, cache=True):
+    """
+    Read a Kaggle CSV with its known column types. Files are memoized in memory (the
+     MAX_MEMOIZED most recently used) and cached in a binary format next to the CSV (Feather when
+     pyarrow is installed, pickle otherwise), both invalidated when the CSV's modification time
+     or size change.
+
+    Parameters
+    ----------
+    filepath : str
+        Location of the CSV file.
+    cache : bool
+        Default True. Whether to use (and write, when the directory allows it) the on-disk binary cache.
+
+    Returns
+    -------
+    DataFrame
+        Copy of the loaded data, safe for the caller to modify.
+    """
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key in _datasets:
+        _datasets.move_to_end(key)
+    else:
+        ## Older versions of the file won't be read again
+        for old_key in [k for k in _datasets if k[0] == key[0]]:
+            del _datasets[old_key]
+        _datasets[key] = _load_dataset(filepath, stat, cache)
+        while len(_datasets) > MAX_MEMOIZED:
+            _datasets.popitem(last=False)
+
+    return _datasets[key].copy()
+
+
+def load_dataset(name, league='men', data_dir='.', cache=True):
+    """
+    Load a Kaggle file by name and league, e.g. load_dataset('NCAATourneySeeds', 'women').
+
+    Parameters
+    ----------
+    name : str
+        Name of the file without the M/W prefix or '.csv' (e.g. 'Teams', 'Events2015').
+    league : str
+        Either 'men' or 'women'. Ignored for files shared by both (Cities, Conferences).
+    data_dir : str
+        Default '.'. Directory with the league's CSVs.
+    cache : bool
+        Default True. Whether to use (and write, when the directory allows it) the on-disk binary cache.
+
+    Returns
+    -------
+    DataFrame
+        Copy of the loaded data, safe for the caller to modify.
+    """
+    if name in ['Cities', 'Conferences']:
+        prefix = ''
+    elif league == 'women':
+        prefix = 'W'
+    else:
+        prefix = 'M'
+
+    return read_dataset(os.path.join(data_dir, f'{prefix}{name}.csv'), cache=cache)
+
+
+def read_dataset_chunks(filepath, columns=None, chunksize=1000000):
+    """
+    Read a Kaggle CSV that is too big to load at once (e.g. the play-by-play events) in chunks,
+     with its known column types. Chunks aren't memoized or cached.
+
+    Parameters
+    ----------
+    filepath : str
+        Location of the CSV file.
+    columns : list of str
+        Optional. Columns to read (default is all of them).
+    chunksize : int
+        Default 1000000. Number of rows in each chunk.
+
+    Returns
+    -------
+    iterator of DataFrame
+        Chunks of the file, in order.
+    """
+    schema = SCHEMAS.get(schema_name(filepath), {})
+    if columns is None:
+        columns = pd.read_csv(filepath, nrows=0).columns
+    dtypes = {col: schema[col] for col in columns if col in schema}
+
+    return pd.read_csv(filepath, usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+class RankCube:
+    """
+    Consensus (mean) Massey ordinal rank of every team on every day of every season.
+
+    Ranks are a dense float32 array [season, day, team] forward-filled from the latest ranking
+     release on or before each day, so lookups are as-of the day of a game. Days before the first
+     release of a season (and teams without ranks) are NaN.
+    """
+
+    def __init__(self, ranks, first_season, first_team):
+        """
+        Parameters
+        ----------
+        ranks : np.array
+            (seasons x days x teams) consensus ranks, possibly memory-mapped.
+        first_season : int
+            Season of ranks[0].
+        first_team : int
+            Team ID of ranks[:, :, 0].
+        """
+        self.ranks = ranks
+        self.first_season = first_season
+        self.first_team = first_team
+
+    def lookup(self, seasons, days, team_ids):
+        """
+        Get the ranks of teams as of some days with one gather.
+
+        Parameters
+        ----------
+        seasons, days, team_ids : array-like of int
+            Season, day number and team ID of each lookup.
+
+        Returns
+        -------
+        np.array
+            Rank of each team as of the day (NaN when there is none yet).
+        """
+        n_seasons, n_days, n_teams = self.ranks.shape
+        season_idx = np.asarray(seasons, dtype=int) - self.first_season
+        team_idx = np.asarray(team_ids, dtype=int) - self.first_team
+        ## Days after the last release keep the last ranks of the season
+        day_idx = np.clip(np.asarray(days, dtype=int), 0, n_days - 1)
+
+        valid = (season_idx >= 0) & (season_idx < n_seasons) & (team_idx >= 0) & (team_idx < n_teams)
+        ranks = np.full(len(valid), np.nan, dtype='float32')
+        ranks[valid] = self.ranks[season_idx[valid], day_idx[valid], team_idx[valid]]
+
+        return ranks
+
+
+def load_rank_cube(filepath, exclude_systems=EXCLUDED_SYSTEMS, cache=True, chunksize=1000000):
+    """
+    Load the consensus ranks of a Massey ordinals file (e.g. MMasseyOrdinals.csv). The CSV is read
+     in chunks once and the cube is saved as a .npy in the cache directory next to it, which later
+     loads are memory-mapped from (until the CSV changes).
+
+    Parameters
+    ----------
+    filepath : str
+        Location of the Massey ordinals CSV.
+    exclude_systems : list of str
+        Default EXCLUDED_SYSTEMS. Ranking systems (SystemName) left out of the mean rank.
+    cache : bool
+        Default True. Whether to use (and write, when the directory allows it) the on-disk cube.
+    chunksize : int
+        Default 1000000. Number of rows of the CSV read at a time when building the cube.
+
+    Returns
+    -------
+    RankCube
+        Consensus ranks by season, day and team.
+    """
+    stat = os.stat(filepath)
+    exclude_systems = tuple(sorted(exclude_systems))
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, exclude_systems)
+    if key in _rank_cubes:
+        return _rank_cubes[key]
+
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), CACHE_DIRNAME)
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    systems_hash = hashlib.md5(','.join(exclude_systems).encode()).hexdigest()[:8]
+    prefix = f'{name}-{stat.st_size}-{stat.st_mtime_ns}-ranks-{systems_hash}'
+
+    ## The season and team of the first entries are in the file name
+    cube = None
+    if cache and os.path.isdir(cache_dir):
+        for cache_file in os.listdir(cache_dir):
+            match = re.fullmatch(rf'{re.escape(prefix)}-(\d+)-(\d+)\.npy', cache_file)
+            if match:
+                try:
+                    ranks = np.load(os.path.join(cache_dir, cache_file), mmap_mode='r')
+                    cube = RankCube(ranks, int(match.group(1)), int(match.group(2)))
+                except (OSError, ValueError):
+                    pass
+
+    if cube is None:
+        cube = _build_rank_cube(filepath, exclude_systems, chunksize)
+        cache_path = os.path.join(cache_dir, f'{prefix}-{cube.first_season}-{cube.first_team}.npy')
+
+        def save(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.save(f, cube.ranks)
+
+        ## Cubes made from older versions of the CSV (or with other systems) are replaced
+        if cache and _write_cache(cache_path, rf'{re.escape(name)}-\d+-\d+-ranks-.*\.npy', save):
+            cube = RankCube(np.load(cache_path, mmap_mode='r'), cube.first_season, cube.first_team)
+
+    _rank_cubes[key] = cube
+
+    return cube
+
+
+def _build_rank_cube(filepath, exclude_systems, chunksize):
+    """
+    Average the ranks of each (season, day, team) a chunk at a time and forward-fill them over the days.
+    """
+    columns = ['Season', 'RankingDayNum', 'SystemName', 'TeamID', 'OrdinalRank']
+    totals = []
+    for chunk in read_dataset_chunks(filepath, columns=columns, chunksize=chunksize):
+        chunk = chunk[~chunk['SystemName'].isin(exclude_systems)]
+        totals.append(chunk.groupby(['Season', 'RankingDayNum', 'TeamID'])['OrdinalRank'].agg(['sum', 'count']))
+    totals = pd.concat(totals).groupby(level=[0, 1, 2]).sum().reset_index()
+
+    seasons = totals['Season'].to_numpy(dtype=int)
+    days = totals['RankingDayNum'].to_numpy(dtype=int)
+    teams = totals['TeamID'].to_numpy(dtype=int)
+    first_season, first_team = seasons.min(), teams.min()
+    shape = (seasons.max() - first_season + 1, days.max() + 1, teams.max() - first_team + 1)
+
+    ranks = np.full(shape, np.nan, dtype='float32')
+    ranks[seasons - first_season, days, teams - first_team] = totals['sum'] / totals['count']
+
+    ## Index of the latest release on or before each day, carried forward within each season
+    release_days = np.where(np.isnan(ranks), 0, np.arange(shape[1])[None, :, None])
+    release_days = np.maximum.accumulate(release_days, axis=1)
+
+    return RankCube(np.take_along_axis(ranks, release_days, axis=1), int(first_season), int(first_team))
+
+
+def _load_dataset(filepath, stat, cache):
+    """
+    Read a file from the binary cache when it is up to date, otherwise parse the CSV (and cache it).
+    """
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), CACHE_DIRNAME)
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    ext = 'feather' if feather is not None else 'pkl'
+    cache_path = os.path.join(cache_dir, f'{name}-{stat.st_size}-{stat.st_mtime_ns}.{ext}')
+
+    if cache and os.path.exists(cache_path):
+        ## Copies written by another version of pandas/pyarrow may not load, so they are rewritten
+        try:
+            if feather is not None:
+                return feather.read_table(cache_path, memory_map=True).to_pandas()
+            return pd.read_pickle(cache_path)
+        except _CACHE_READ_ERRORS:
+            pass
+
+    df = _read_csv_typed(filepath)
+
+    def save(tmp_path):
+        if feather is not None:
+            feather.write_feather(df, tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+
+    ## Copies made from older versions of the CSV are replaced
+    if cache:
+        _write_cache(cache_path, rf'{re.escape(name)}-\d+-\d+\.(feather|pkl)', save)
+
+    return df
+
+
+def _write_cache(cache_path, old_pattern, save):
+    """
+    Write a binary copy with save(tmp_path) and move it in place, removing the old copies whose
+     names match old_pattern. The copy is skipped when the directory can't be written to (e.g. a
+     read-only data directory), so the data is still loaded.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    tmp_path = f'{cache_path}.tmp'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for old_file in os.listdir(cache_dir):
+            if re.fullmatch(old_pattern, old_file):
+                os.remove(os.path.join(cache_dir, old_file))
+        save(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return False
+
+    return True
+
+
+def _read_csv_typed(filepath):
+    """
+    Parse a CSV with the column types of its schema (columns that aren't in the schema are inferred).
+    """
+    schema = SCHEMAS.get(schema_name(filepath), {})
+    columns = pd.read_csv(filepath, nrows=0).columns
+    dtypes = {col: schema[col] for col in columns if col in schema}
+
+    ## Integer columns with missing values (e.g. X/Y in some events) fall back to floats
+    try:
+        return pd.read_csv(filepath, dtype=dtypes)
+    except ValueError:
+        dtypes = {col: ('float32' if np.issubdtype(np.dtype(t), np.integer) else t)
+                  if t != 'category' else t for col, t in dtypes.items()}
+        return pd.read_csv(filepath, dtype=dtypes)
@@ -1,23 +1,26 @@
-import os
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import colors as mcolors
 from matplotlib.collections import LineCollection
 from matplotlib.backends.backend_pdf import PdfPages
 
+from bracket_builder.layout import (bracket_layout, pad_probabilities, path_lines, path_probabilities,
+                                    team_round_probs)
+from bracket_builder.svg import SvgRenderer
+
 
 class Bracket:
     """
     Plotter object used to draw a bracket in a few easy steps.
     """
 
-    def __init__(self, n_teams, team_names=None, winners=None, win_prob_teams=None, win_probabilities=None):
+    def __init__(self, n_teams, team_names=None, winners=None, win_prob_teams=None, win_probabilities=None,
+                 slot_tree=None, actual=False):
         """
         Parameters
         ----------
         n_teams : int
-            Number of teams in the tournament (32 or 64).
+            Number of teams in the tournament (16, 32, 64, or 68 with the slot tree).
         team_names : list of str
             Optional. List of team names used to label the bracket.
             Assumes team names are in the order of top left, bottom left,
@@ -31,13 +34,21 @@ class Bracket:
             Optional. A list of lists containing probabilities that each team makes each round
             e.g. if we're labeling 2 teams in a 4 round tournament, it may look like this:
                [ [0.9, 0.7, 0.3, 0.1], [0.8, 0.6, 0.25, 0.05] ]
+        slot_tree : SlotTree
+            Optional. Compiled tournament slots, which place the play-in games of a 68 team field
+            (team names then follow layout.seed_order, and the 1st list of winners is the play-in winners).
+        actual : bool
+            Default False. Whether the winners are actual results (black) or projected (gray).
 
         """
-        self.n_teams = n_teams
+        self.slot_tree = slot_tree
+        self.layout = bracket_layout(n_teams, slot_tree)
+        self.n_teams = self.layout.n_teams
         self.team_names = team_names
         self.winners = winners
         self.win_prob_teams = win_prob_teams
         self.win_probabilities = win_probabilities
+        self.actual = actual
 
     def draw_bracket(self):
         """
@@ -50,146 +61,12 @@ class Bracket:
         fig.set_figwidth(13)
 
         ## Limits are based on number of teams
-        if self.n_teams == 32:
-            ## 32 team bracket limits (smaller)
-            plt.xlim([19, 201])
-            plt.ylim([-1, 67])
-
-        if self.n_teams == 64:
-            ## 64 team bracket limits (larger)
-            plt.xlim([-1, 221])
-            plt.ylim([-1, 67])
-
-            ## Get collection of lines unique to the 64 team version ("round 1")
-            ### X values for left/right side
-            ## Left side of bracket
-            r1_left_x = np.array([0, 20])  # 1st round range x from 0 to 20
-            r1_left_connect_x = np.array([20, 20])  # Xs to connect the two teams playing each other
-
-            ## Right side of bracket
-            r1_right_x = np.array([200, 220])  # 1st round range x from 0 to 20
-            r1_right_connect_x = np.array([200, 200])  # Xs to connect the two teams playing each other
-
-            ### Y values can correspond to either side (reuse these arrays)
-            r1_ys = [np.repeat(np.array([x]), 2) for x in np.arange(0, 32, 2)]
-            r1_ys.extend([np.repeat(np.array([x]), 2) for x in np.arange(36, 67, 2)])
-            r1_connect_ys = [np.arange(x, x + 3, 2) for x in np.arange(0, 29, 4)]
-            r1_connect_ys.extend([np.arange(x, x + 3, 2) for x in np.arange(36, 65, 4)])
-
-            ## Make sequences of x,y pairs
-            left_r1_lines = collect_lines(r1_left_x, r1_ys)
-            left_r1_connect_lines = collect_lines(r1_left_connect_x, r1_connect_ys)
-
-            right_r1_lines = collect_lines(r1_right_x, r1_ys)
-            right_r1_connect_lines = collect_lines(r1_right_connect_x, r1_connect_ys)
-
-            ### Add the line segments to the plot
-            ## Left side
-            ax.add_collection(left_r1_lines)
-            ax.add_collection(left_r1_connect_lines)
-
-            ## Right side
-            ax.add_collection(right_r1_lines)
-            ax.add_collection(right_r1_connect_lines)
-
-        ### Collection of X values for the left side of the bracket
-        r2_left_x = np.array([20, 40])
-        r2_left_connect_x = np.array([40, 40])
-        r3_left_x = np.array([40, 60])
-        r3_left_connect_x = np.array([60, 60])
-        r4_left_x = np.array([60, 80])
-        r4_left_connect_x = np.array([80, 80])
-        r5_left_x = np.array([80, 100])
-        r5_left_connect_x = np.array([100, 100])
-        final_left_x = np.array([115, 100])
-
-        ### Collection of X values for the right side of the bracket
-        r2_right_x = np.array([180, 200])
-        r2_right_connect_x = np.array([180, 180])
-        r3_right_x = np.array([160, 180])
-        r3_right_connect_x = np.array([160, 160])
-        r4_right_x = np.array([140, 160])
-        r4_right_connect_x = np.array([140, 140])
-        r5_right_x = np.array([120, 140])
-        r5_right_connect_x = np.array([120, 120])
-        final_right_x = np.array([120, 105])
-
-        ## Champion Xs
-        champ_x = np.array([90, 130])
-
-        ### Y values for each round
-        r2_ys = [np.repeat(np.array([x]), 2) for x in np.arange(1, 30, 4)]
-        r2_ys.extend([np.repeat(np.array([x]), 2) for x in np.arange(37, 68, 4)])
-        r2_connect_ys = [np.arange(x, x + 5, 4) for x in np.arange(1, 28, 8)]
-        r2_connect_ys.extend([np.arange(x, x + 5, 4) for x in np.arange(37, 63, 8)])
-
-        r3_ys = [np.repeat(np.array([x]), 2) for x in np.arange(3, 28, 8)]
-        r3_ys.extend([np.repeat(np.array([x]), 2) for x in np.arange(38, 64, 8)])
-        r3_connect_ys = [np.array([3, 11]), np.array([19, 27]),
-                         np.array([38, 46]), np.array([54, 62])]
-
-        r4_ys = [np.repeat(np.array([x]), 2) for x in np.arange(7, 24, 16)]
-        r4_ys.extend([np.repeat(np.array([x]), 2) for x in np.arange(42, 59, 16)])
-        r4_connect_ys = [np.array([7, 23]), np.array([42, 58])]
-
-        r5_ys = [np.array([15, 15]), np.array([50, 50])]
-        r5_connect_ys = [np.array([15, 50]), np.array([15, 50])]
-
-        final_left_y = [np.array([35, 35])]
-        final_right_y = [np.array([30, 30])]
-        champ_ys = [np.array([60, 60])]
-
-        ## Make sequences of x,y pairs (collections of lines)
-        # left side
-        left_r2_lines = collect_lines(r2_left_x, r2_ys)
-        left_r2_connect_lines = collect_lines(r2_left_connect_x, r2_connect_ys)
-        left_r3_lines = collect_lines(r3_left_x, r3_ys)
-        left_r3_connect_lines = collect_lines(r3_left_connect_x, r3_connect_ys)
-        left_r4_lines = collect_lines(r4_left_x, r4_ys)
-        left_r4_connect_lines = collect_lines(r4_left_connect_x, r4_connect_ys)
-        left_r5_lines = collect_lines(r5_left_x, r5_ys)
-        left_r5_connect_lines = collect_lines(r5_left_connect_x, r5_connect_ys)
-
-        # right side
-        right_r2_lines = collect_lines(r2_right_x, r2_ys)
-        right_r2_connect_lines = collect_lines(r2_right_connect_x, r2_connect_ys)
-        right_r3_lines = collect_lines(r3_right_x, r3_ys)
-        right_r3_connect_lines = collect_lines(r3_right_connect_x, r3_connect_ys)
-        right_r4_lines = collect_lines(r4_right_x, r4_ys)
-        right_r4_connect_lines = collect_lines(r4_right_connect_x, r4_connect_ys)
-        right_r5_lines = collect_lines(r5_right_x, r5_ys)
-        right_r5_connect_lines = collect_lines(r5_right_connect_x, r5_connect_ys)
-
-        final_left_line = collect_lines(final_left_x, final_left_y)
-        final_right_line = collect_lines(final_right_x, final_right_y)
-
-        champ_line = collect_lines(champ_x, champ_ys)
-
-        ### Add the lines common to both numbers of teams
-        ## Left side
-        ax.add_collection(left_r2_lines)
-        ax.add_collection(left_r2_connect_lines)
-        ax.add_collection(left_r3_lines)
-        ax.add_collection(left_r3_connect_lines)
-        ax.add_collection(left_r4_lines)
-        ax.add_collection(left_r4_connect_lines)
-        ax.add_collection(left_r5_lines)
-        ax.add_collection(left_r5_connect_lines)
-
-        ## Right side
-        ax.add_collection(right_r2_lines)
-        ax.add_collection(right_r2_connect_lines)
-        ax.add_collection(right_r3_lines)
-        ax.add_collection(right_r3_connect_lines)
-        ax.add_collection(right_r4_lines)
-        ax.add_collection(right_r4_connect_lines)
-        ax.add_collection(right_r5_lines)
-        ax.add_collection(right_r5_connect_lines)
-
-        ## Final lines
-        ax.add_collection(final_left_line)
-        ax.add_collection(final_right_line)
-        ax.add_collection(champ_line)
+        plt.xlim(self.layout.xlim)
+        plt.ylim(self.layout.ylim)
+
+        ## All of the lines of the bracket in one collection
+        ax.add_collection(LineCollection(self.layout.segments, linewidths=1, colors='black',
+                                         linestyles='solid'))
 
         ## Turn off axes and show it
         plt.axis('off')
@@ -205,50 +82,14 @@ class Bracket:
         ## Redraw the plot
         plt.draw()
 
-        ## Iterate through the names and annotate the plot in order
-        t_names_series = pd.Series(self.team_names)
-        if self.n_teams == 64:
-            ## Set starting x/y position
-            xpos = 1
-            ypos = 66.5
-            for index, name in t_names_series.iteritems():
-                if (index < 16) or (index > 48) or \
-                        ((index < 32) and (index > 16)) or \
-                        ((index > 32) and (index < 48)):
-                    plt.annotate(name, xy=(xpos, ypos), size=6.5)
-                    ypos -= 2
-                elif (index == 16) or (index == 48):
-                    ypos -= 4
-                    plt.annotate(name, xy=(xpos, ypos), size=6.5)
-                    ypos -= 2
-                elif index == 32:
-                    ypos = 66.5
-                    xpos = 200.8
-                    plt.annotate(name, xy=(xpos, ypos), size=6.5)
-                    ypos -= 2
-        else:
-            ## Set starting x/y position
-            xpos = 21
-            ypos = 65.5
-            for index, name in t_names_series.iteritems():
-                if (index < 8) or (index > 24) or \
-                        ((index < 16) and (index > 8)) or \
-                        ((index > 16) and (index < 24)):
-                    plt.annotate(name, xy=(xpos, ypos), size=7.5)
-                    ypos -= 4
-                elif (index == 8) or (index == 24):
-                    ypos -= 4
-                    plt.annotate(name, xy=(xpos, ypos), size=7.5)
-                    ypos -= 4
-                elif index == 16:
-                    ypos = 65.5
-                    xpos = 180.8
-                    plt.annotate(name, xy=(xpos, ypos), size=7.5)
-                    ypos -= 4
+        ## Annotate the plot in order
+        spots = self.layout.round_table(0)
+        for name, xpos, ypos, size in zip(self.team_names, spots['x'], spots['y'], spots['size']):
+            plt.annotate(name, xy=(xpos, ypos), size=size)
 
         plt.draw()
 
-    def label_winners(self, actual=False):
+    def label_winners(self, actual=None):
         """
         Label the winners of each round (whether actual or projected).
 
@@ -262,10 +103,14 @@ class Bracket:
               (top left, bottom left, top right, bottom right)
 
         actual : bool
-            Default False, simply controls the color of the text
-            (black for True and gray for False/projected currently)
+            Optional, simply controls the color of the text
+            (black for True and gray for False/projected currently).
+            Kept on the bracket for the exports, the bracket's actual flag when not given.
 
         """
+        if actual is None:
+            actual = self.actual
+        self.actual = actual
 
         ## Color of text set by "type" (actual/projected)
         if actual:
@@ -273,79 +118,27 @@ class Bracket:
         else:
             color = 'gray'
 
-        ## Make dictionaries with parameters depending on the round
-        ## for the 1st 4 rounds, set the size of steps (within quadrant and extra outside quad)
-        #   and y starting position
-        y_steps = {1:4, 2:8, 3:16, 4:35, 5:None, 6:None}
-        y_init = {1:65.5, 2:62.5, 3:58.5, 4:50.5, 5:None, 6:None}
-        quad_y_step = {1:4, 2:3, 3:3, 4:0, 5:None, 6:None}
-
-        ## Params used in all rounds
-        rd_teams_left = {1:32, 2:16, 3:8, 4:4, 5:2, 6:1}
-        sizes = {1:7.5, 2:7.5, 3:8, 4:8.5, 5:9, 6:14}
-
         ## Redraw the plot
         plt.draw()
 
-        ## For 32 teams, pretend that it's just 1 round later of 64
-        if self.n_teams == 64:
-            round = 1
-        elif self.n_teams == 32:
-            round = 2
-
-        ## Iterate through the list of lists, making each list a series and set params based on the round
-        for names in self.winners:
-            w_names_series = pd.Series(names)
-
-            ## Set parameters:
-            # starting x/y position, y-increments (within quad and out of quad), and # of teams left
-            xpos = 1 + 20 * round
-            ypos = y_init[round]
-            step = y_steps[round]
-            q_step = quad_y_step[round]
-            teams_left = rd_teams_left[round]
-            size = sizes[round]
-
-            ### Up to the final 4 follows a pattern
-            if round < 5:
-
-                ## Iterating through team names and writing them on the bracket
-                for index, name in w_names_series.iteritems():
-                    if (index < (teams_left/4)) or (index > 3*(teams_left/4)) or \
-                            (index < (teams_left/2)) and (index > (teams_left/4)) or \
-                            (index > (teams_left/2)) and (index < 3*(teams_left/4)):
-                        ## When staying within a quadrant, drop y by the standard amount
-                        plt.annotate(name, xy=(xpos, ypos), size=size, color=color)
-                        ypos -= step
-
-                    elif (index == (teams_left/4)) or (index == 3*(teams_left/4)):
-                        ## When going from a top quadrant to a lower quadrant, subtract an extra time
-                        ypos -= q_step
-                        plt.annotate(name, xy=(xpos, ypos), size=size, color=color)
-                        ypos -= step
-
-                    elif index == (teams_left/2):
-                        ## Jumping from bottom left to top right, reset the initial X/Y position
-                        ypos = y_init[round]
-                        xpos = 200.8 - 20*round
-                        plt.annotate(name, xy=(xpos, ypos), size=size, color=color)
-                        ypos -= step
-
-            ## For the Championship
-            # assume 1st team is from left side, 2nd is from right
-            elif round == 5:
-                plt.annotate(names[0], xy=(101.5, 35.5), size=size, color=color)
-                plt.annotate(names[1], xy=(105.5, 30.5), size=size, color=color)
-
-            ## For the last round, write the champion in the top spot
-            else:
-                plt.annotate(names[0], xy=(109, 60.25), size=size, color=color, ha='center')
-
-            round += 1
+        ## Write the names of each round's winners on the bracket
+        for rnd, names in enumerate(self.winners, 1):
+            spots = self.layout.round_table(rnd)
+            for name, xpos, ypos, size, ha in zip(names, spots['x'], spots['y'], spots['size'], spots['ha']):
+                plt.annotate(name, xy=(xpos, ypos), size=size, color=color, ha=ha)
 
         plt.draw()
 
     def draw_weighted_lines(self, colors=None):
+        """
+        Draw the path of each of win_prob_teams with line widths from its win_probabilities
+         (a probability of 1 is 5 wide), starting from the team's line.
+
+        Parameters
+        ----------
+        colors : list of str
+            Optional. Color of each team's path (default black).
+        """
         if self.win_probabilities is None:
             pass
         else:
@@ -355,19 +148,63 @@ class Bracket:
             if colors is None:
                 colors = ["Black"]*len(self.win_prob_teams)
 
-            ## Dictionary with starting positions based on index number
-            start_dict = {0:[0, 66]}
-
             ## Find the indices of the teams to label
-            slots = [self.team_names.index(team) for team in self.win_prob_teams]
+            slots = [list(self.team_names).index(team) for team in self.win_prob_teams]
 
-            ## Draw weighted lines based on the index, probability, and color
-            for slot, color, win_prob in zip(slots, colors, self.win_probabilities):
-                xpos = start_dict[slot][0]
-                ypos = start_dict[slot][1]
-                plt.plot([xpos,xpos+20],[ypos,ypos], color=color, linewidth=5*win_prob)
+            ## One collection of weighted lines per round
+            for lines in weighted_path_collections(self.layout, slots, pad_probabilities(self.win_probabilities),
+                                                   colors):
+                plt.gca().add_collection(lines)
+
+            plt.draw()
 
-    def export_bracket(self, type='png', filename="bracket"):
+    def draw_probability_paths(self, probs_df, team_col='TeamName', colors=None, max_width=5, weight='width'):
+        """
+        Draw every team's path through the bracket weighted by its probability of reaching each round.
+
+        Parameters
+        ----------
+        probs_df : DataFrame
+            Probabilities of each team to make each round (e.g. from compute_conditional_probs).
+        team_col : str
+            Default 'TeamName'. Column of probs_df matching the team names of the bracket.
+        colors : list of str
+            Optional. Color of each team's path, in the order of the team names (default cycles
+             through the Tableau colors).
+        max_width : float
+            Default 5. Line width of a probability of 1.
+        weight : str
+            Default 'width'. Whether the probabilities set the width ('width') or the opacity ('alpha').
+        """
+        plt.draw()
+
+        positions = np.arange(len(self.team_names))
+        if colors is None:
+            colors = np.resize(list(mcolors.TABLEAU_COLORS), len(positions))
+        step_probs = path_probabilities(self.layout, team_round_probs(probs_df, self.team_names, team_col))
+        for lines in weighted_path_collections(self.layout, positions, step_probs, colors, max_width, weight):
+            plt.gca().add_collection(lines)
+
+        plt.draw()
+
+    def export_bracket(self, type='png', filename="bracket", actual=None, probs_df=None):
+        """
+        Save the bracket as 'png' or 'pdf' (the plot), or as 'svg' or 'html' (drawn from the team
+         names, winners and win probabilities without matplotlib, see SvgRenderer).
+
+        Parameters
+        ----------
+        type : str
+            Default 'png'. Format of the file.
+        filename : str
+            Default 'bracket'. File to save to (without extension).
+        actual : bool
+            Optional. For 'svg' and 'html', whether the winners are actual results (the bracket's actual
+             flag by default).
+        probs_df : DataFrame
+            Optional. For 'svg' and 'html', probabilities of every team to make each round
+             (paths and tooltips).
+        """
         ## Save to image
         if type == 'png':
             plt.draw()
@@ -379,6 +216,14 @@ class Bracket:
             pp.savefig()
             pp.close()
 
+        ## Write the markup directly
+        elif type in ['svg', 'html']:
+            SvgRenderer(layout=self.layout).render(filename, format=type, team_names=self.team_names,
+                                                   winners=self.winners,
+                                                   actual=self.actual if actual is None else actual,
+                                                   win_prob_teams=self.win_prob_teams,
+                                                   win_probabilities=self.win_probabilities, probs_df=probs_df)
+
 
 def collect_lines(x_array, y_arrays, colors='black',
                   linewidths=1, linestyles='solid'):
@@ -402,3 +247,50 @@ def collect_lines(x_array, y_arrays, colors='black',
                           linewidths=linewidths,
                           colors=colors,
                           linestyles=linestyles)
+
+
+def weighted_path_collections(layout, positions, step_probs, colors='black', max_width=5, weight='width'):
+    """
+    Build the lines along the paths of some teams weighted by their probabilities, with one
+     collection per round.
+
+    Parameters
+    ----------
+    layout : BracketLayout
+        Layout of the bracket.
+    positions : array-like of int
+        Positions of the teams (in the order of the team names).
+    step_probs : np.array
+        (teams x steps) probability of each team filling each spot of its path (see layout.paths),
+         NaN where nothing is drawn.
+    colors : str or list of str
+        Default 'black'. Color of every path, or of each team's path.
+    max_width : float
+        Default 5. Line width of a probability of 1.
+    weight : str
+        Default 'width'. Whether the probabilities set the width ('width') or the opacity ('alpha').
+
+    Returns
+    -------
+    list of LineCollection
+        Lines of each round, the widest first so the thinner ones stay visible on top.
+    """
+    if weight not in ['width', 'alpha']:
+        raise ValueError(f"weight should be 'width' or 'alpha', not {weight!r}")
+
+    lines = path_lines(layout, positions, step_probs)
+    probs = lines['probs']
+    rgba = np.broadcast_to(mcolors.to_rgba_array(colors), (len(positions), 4))[lines['teams']].copy()
+    if weight == 'alpha':
+        rgba[:, 3] *= probs
+        widths = np.full(len(probs), float(max_width))
+    else:
+        widths = max_width * probs
+
+    collections = []
+    for start, end in zip(lines['starts'][:-1], lines['starts'][1:]):
+        if end > start:
+            collections.append(LineCollection(lines['segments'][start:end], linewidths=widths[start:end],
+                                              colors=rgba[start:end], capstyle='projecting'))
+
+    return collections
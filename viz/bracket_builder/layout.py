@@ -0,0 +1,425 @@
+import numpy as np
+import pandas as pd
+
+from bracket_builder.constants import REGION_SEED_ORDER, ROUND_COLS
+
+
+## Number of teams of each bracket, by the rounds of the 64 team bracket it leaves off
+FIELD_SIZES = {64: 0, 32: 1, 16: 2}
+
+## Font size of the names of each round of the 64 team bracket (0 is the teams), and of play-in teams
+ROUND_SIZES = {0: 6.5, 1: 7.5, 2: 7.5, 3: 8, 4: 8.5, 5: 9, 6: 14}
+PLAY_IN_SIZE = 5.5
+
+## Columns of a layout table (stage is the index of the spot in ROUND_COLS, -1 for the play-in
+##  games, and the next round and position are where the winner of the spot goes, -1 for the champion)
+LAYOUT_COLS = ['round', 'position', 'side', 'x', 'y', 'size', 'ha', 'line_x0', 'line_x1', 'line_y', 'stage',
+               'next_round', 'next_position']
+
+## Layouts by number of teams and play-in spots
+_layouts = {}
+
+
+class BracketLayout:
+    """
+    Coordinates of everything on a printed bracket: where each name goes, the line under it,
+     and the connectors between rounds.
+
+    The table has a row for every spot of every round (0 is the teams, then the winners of each
+     round in the order of Bracket.winners), with positions from top left, bottom left, top right,
+     to bottom right.
+    """
+
+    def __init__(self, table, segments, segment_rounds, xlim, ylim, seed_order=None):
+        """
+        Parameters
+        ----------
+        table : DataFrame
+            One row per spot with LAYOUT_COLS (label anchor, font size and alignment, and line).
+        segments : np.array
+            (n_segments x 2 x 2) start and end points of each line of the blank bracket.
+        segment_rounds : np.array
+            Round of the names above each segment (connectors take the round they start from).
+        xlim, ylim : list of float
+            Limits of the plot.
+        seed_order : list of str
+            Optional. Seed of each team position (when built from a slot tree).
+        """
+        self.table = table
+        self.segments = segments
+        self.segment_rounds = segment_rounds
+        self.xlim = xlim
+        self.ylim = ylim
+        self.seed_order = seed_order
+        self.n_teams = int((table['round'] == 0).sum())
+
+        ## Columns of the table as arrays, for lookups
+        self.columns = {col: table[col].to_numpy() for col in table.columns}
+        self.n_rounds = int(table['round'].max()) + 1
+
+        ## First row of each round (rows are sorted by round and position)
+        self._round_starts = np.searchsorted(table['round'].to_numpy(), np.arange(self.n_rounds + 1))
+
+        ## Row that the winner of each row goes to
+        next_round = table['next_round'].to_numpy()
+        self.parents = np.where(next_round >= 0, self._round_starts[next_round] + table['next_position'].to_numpy(),
+                                -1)
+
+    def round_table(self, rnd):
+        """
+        Get the spots of a round.
+
+        Parameters
+        ----------
+        rnd : int
+            Round (0 is the teams, 1 the winners of the first round, etc.).
+
+        Returns
+        -------
+        DataFrame
+            Rows of the table for the round, by position.
+        """
+        return self.table.iloc[self._round_starts[rnd]:self._round_starts[rnd + 1]]
+
+    def spots(self, rnd, positions):
+        """
+        Get the coordinates of some spots of a round.
+
+        Parameters
+        ----------
+        rnd : int
+            Round (0 is the teams).
+        positions : array-like of int
+            Positions within the round.
+
+        Returns
+        -------
+        DataFrame
+            Rows of the table for the spots, in the same order.
+        """
+        return self.table.iloc[self._round_starts[rnd] + np.asarray(positions, dtype=int)]
+
+    def paths(self, positions):
+        """
+        Get the rows of the spots each team would fill on its way to the title.
+
+        Parameters
+        ----------
+        positions : array-like of int
+            Team positions (in round 0).
+
+        Returns
+        -------
+        np.array
+            (teams x steps) rows of the table from each team's line to the champion's, padded
+             with -1 (teams in play-in games have one more step).
+        """
+        rows = [np.asarray(positions, dtype=int) + self._round_starts[0]]
+        while (rows[-1] >= 0).any():
+            rows.append(np.where(rows[-1] >= 0, self.parents[np.maximum(rows[-1], 0)], -1))
+
+        return np.column_stack(rows[:-1])
+
+
+def _base_table():
+    """
+    Build the spots of the 64 team bracket.
+    """
+    ## Per round: y of the first name, steps between names, and extra step from the top to the bottom quadrant
+    y_init = {0: 66.5, 1: 65.5, 2: 62.5, 3: 58.5, 4: 50.5}
+    y_steps = {0: 2, 1: 4, 2: 8, 3: 16, 4: 35}
+    quad_y_step = {0: 4, 1: 4, 2: 3, 3: 3, 4: 0}
+
+    rounds, positions, sides, xs, ys = [], [], [], [], []
+    for rnd in range(5):
+        n_spots = 64 >> rnd
+        half = n_spots // 2
+        index = np.arange(n_spots) % half
+        ## Names step down within a side, with an extra drop into the bottom quadrant
+        y = y_init[rnd] - y_steps[rnd] * index - quad_y_step[rnd] * (index >= half // 2)
+        right = np.arange(n_spots) >= half
+        rounds.append(np.full(n_spots, rnd))
+        positions.append(np.arange(n_spots))
+        sides.append(np.where(right, 'right', 'left'))
+        xs.append(np.where(right, 200.8 - 20 * rnd, 1 + 20 * rnd))
+        ys.append(y)
+
+    table = pd.DataFrame({'round': np.concatenate(rounds), 'position': np.concatenate(positions),
+                          'side': np.concatenate(sides), 'x': np.concatenate(xs), 'y': np.concatenate(ys)})
+    table['size'] = table['round'].map(ROUND_SIZES)
+    table['ha'] = 'left'
+    left = table['side'] == 'left'
+    table['line_x0'] = np.where(left, 20 * table['round'], 200 - 20 * table['round'])
+    table['line_x1'] = table['line_x0'] + 20
+    table['line_y'] = table['y'] - 0.5
+    table['stage'] = table['round']
+    table['next_round'] = table['round'] + 1
+    table['next_position'] = table['position'] // 2
+
+    ## The finalists (the left side's above its line, the right side's below) and the champion
+    finals = pd.DataFrame([[5, 0, 'left', 101.5, 35.5, ROUND_SIZES[5], 'left', 100, 115, 35, 5, 6, 0],
+                           [5, 1, 'right', 105.5, 30.5, ROUND_SIZES[5], 'left', 105, 120, 30, 5, 6, 0],
+                           [6, 0, 'center', 109, 60.25, ROUND_SIZES[6], 'center', 90, 130, 60, 6, -1, -1]],
+                          columns=LAYOUT_COLS)
+
+    return pd.concat([table, finals], ignore_index=True)[LAYOUT_COLS]
+
+
+def _segments(table, last_connected):
+    """
+    Get the lines under every spot of a table, and the connectors between the pairs of each
+     round up to last_connected (a pair's lines meet at their inner ends).
+
+    Returns
+    -------
+    segments : np.array
+        (n_segments x 2 x 2) start and end points of each line.
+    segment_rounds : np.array
+        Round of each line.
+    """
+    lines = np.stack([table[['line_x0', 'line_y']].to_numpy(float), table[['line_x1', 'line_y']].to_numpy(float)],
+                     axis=1)
+    rounds = table['round'].to_numpy()
+
+    connected = table[table['round'] <= last_connected]
+    top, bottom = connected.iloc[0::2], connected.iloc[1::2]
+    inner_x = np.where(top['side'] == 'left', top['line_x1'], top['line_x0']).astype(float)
+    connectors = np.stack([np.column_stack([inner_x, bottom['line_y']]), np.column_stack([inner_x, top['line_y']])],
+                          axis=1)
+
+    return np.concatenate([lines, connectors]), np.concatenate([rounds, top['round'].to_numpy()])
+
+
+def _build_layout(n_teams, play_in_spots=()):
+    """
+    Build the layout of a field from the 64 team bracket, leaving off its first rounds for
+     smaller fields or adding play-in games outside of the first round for larger ones.
+    """
+    table = _base_table()
+    skip = FIELD_SIZES[64 if play_in_spots else n_teams]
+    table = table[table['round'] >= skip].reset_index(drop=True)
+    table['round'] -= skip
+    table['next_round'] = np.where(table['next_round'] >= 0, table['next_round'] - skip, -1)
+    segments, segment_rounds = _segments(table, last_connected=4 - skip)
+
+    xlim = [20 * skip - 1, 221 - 20 * skip]
+    ylim = [-1, 67]
+
+    if play_in_spots:
+        ## Every spot is a round later than in the 64 team bracket
+        table['next_round'] = np.where(table['next_round'] >= 0, table['next_round'] + 1, -1)
+
+        ## Play-in games go outside of the spots of their winners (in the first round)
+        spots = table[table['round'] == 0].iloc[list(play_in_spots)]
+        left = (spots['side'] == 'left').to_numpy()
+        play_in = pd.DataFrame({'round': 0, 'side': np.repeat(spots['side'].to_numpy(), 2),
+                                'x': np.repeat(np.where(left, -19, 220.8), 2),
+                                'y': (np.repeat(spots['line_y'].to_numpy(), 2) + np.tile([1.5, -0.5], len(spots))),
+                                'size': PLAY_IN_SIZE, 'ha': 'left',
+                                'line_x0': np.repeat(np.where(left, -20, 220), 2),
+                                'line_x1': np.repeat(np.where(left, 0, 240), 2),
+                                'line_y': np.repeat(spots['line_y'].to_numpy(), 2) + np.tile([1, -1], len(spots)),
+                                'stage': -1, 'next_round': 1, 'next_position': np.repeat(np.arange(len(spots)), 2)})
+        play_in_segments, play_in_rounds = _segments(play_in, last_connected=0)
+
+        ## Teams are in bracket order with each play-in spot's pair in place of its winner
+        teams = table[table['round'] == 0].drop(columns='position')
+        teams['order'] = np.arange(len(teams), dtype=float)
+        play_in['order'] = np.repeat(np.asarray(play_in_spots, dtype=float), 2) + np.tile([0.25, 0.5], len(spots))
+        teams = pd.concat([teams.drop(index=spots.index), play_in]).sort_values('order', kind='stable')
+        teams['position'] = np.arange(len(teams))
+
+        ## The play-in winners are a round before the first round's
+        winners = spots.assign(round=1, position=np.arange(len(spots)))
+        later = table[table['round'] > 0].assign(round=lambda df: df['round'] + 1)
+        table = pd.concat([teams[LAYOUT_COLS], winners, later], ignore_index=True)
+
+        segments = np.concatenate([play_in_segments, segments])
+        segment_rounds = np.concatenate([play_in_rounds, segment_rounds + 1])
+        xlim = [-21, 241]
+
+    table = table.sort_values(['round', 'position'], kind='stable').reset_index(drop=True)
+
+    return BracketLayout(table, segments, segment_rounds, xlim, ylim)
+
+
+def display_seed_order(slot_tree):
+    """
+    Get the seeds from top left to bottom right of a printed bracket (the order label_teams uses).
+     Regions follow the strong side first from the championship down, and seeds within a region
+     follow REGION_SEED_ORDER. Play-in seeds (e.g. 'W16a') share a spot ('W16').
+
+    Parameters
+    ----------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+
+    Returns
+    -------
+    list of str
+        Three character seeds in display order.
+    """
+    regions = []
+    nodes = [slot_tree.n_seeds + slot_tree.n_slots - 1]
+    while nodes:
+        node = nodes.pop(0)
+        slot = node - slot_tree.n_seeds
+        if slot_tree.slot_rounds[slot] == 4:
+            regions.append(slot_tree.slots[slot][2])
+        else:
+            nodes = list(slot_tree.children[slot]) + nodes
+
+    return [f'{region}{seed_num:02d}' for region in regions for seed_num in REGION_SEED_ORDER]
+
+
+def bracket_layout(n_teams=64, slot_tree=None):
+    """
+    Get the layout of a bracket (built once per size and play-in spots).
+
+    Parameters
+    ----------
+    n_teams : int
+        Default 64. Number of teams in the tournament (16, 32, 64 or 68). Fields with play-in games
+         need the slot tree to know where the games go.
+    slot_tree : SlotTree
+        Optional. Compiled tournament slots (e.g. the men's for a season, or the women's 2022 slots
+         file). The number of teams and play-in spots are taken from the tree, and the layout has
+         the seed of each team.
+
+    Returns
+    -------
+    BracketLayout
+        Coordinates of the bracket.
+    """
+    seed_order = None
+    play_in_spots = ()
+    if slot_tree is not None:
+        n_teams = slot_tree.n_seeds
+        spot_order = display_seed_order(slot_tree)
+        seed_set = set(slot_tree.seeds)
+        play_in_spots = tuple(i for i, seed in enumerate(spot_order) if f'{seed}a' in seed_set)
+        seed_order = [s for seed in spot_order
+                      for s in ([f'{seed}a', f'{seed}b'] if f'{seed}a' in seed_set else [seed])]
+    elif n_teams not in FIELD_SIZES:
+        raise ValueError(f'A {n_teams} team bracket needs the slot tree to place its play-in games')
+
+    key = (n_teams, play_in_spots)
+    if key not in _layouts:
+        _layouts[key] = _build_layout(n_teams, play_in_spots)
+    if seed_order is None:
+        return _layouts[key]
+
+    layout = _layouts[key]
+    return BracketLayout(layout.table, layout.segments, layout.segment_rounds, layout.xlim, layout.ylim,
+                         seed_order)
+
+
+def pad_probabilities(win_probabilities):
+    """
+    Stack per-team lists of probabilities (of making each round) into an array, padded with NaN.
+     A single probability for a team is the probability of its first line.
+
+    Parameters
+    ----------
+    win_probabilities : list of lists of float
+        Probabilities of each team making each round.
+
+    Returns
+    -------
+    np.array
+        (teams x rounds) probabilities.
+    """
+    rows = [np.atleast_1d(np.asarray(probs, dtype=float)) for probs in win_probabilities]
+    padded = np.full((len(rows), max((len(row) for row in rows), default=0)), np.nan)
+    for i, row in enumerate(rows):
+        padded[i, :len(row)] = row
+
+    return padded
+
+
+def team_round_probs(probs_df, team_names, team_col='TeamName'):
+    """
+    Get the probabilities of the teams of a bracket to make each round.
+
+    Parameters
+    ----------
+    probs_df : DataFrame
+        Probabilities of each team to make each round (with ROUND_COLS, e.g. from compute_conditional_probs).
+    team_names : list of str
+        Team names in bracket order.
+    team_col : str
+        Default 'TeamName'. Column of probs_df matching the team names.
+
+    Returns
+    -------
+    np.array
+        (teams x rounds) probabilities, NaN for teams missing from probs_df.
+    """
+    return probs_df.set_index(team_col)[ROUND_COLS].reindex(list(team_names)).to_numpy(dtype=float)
+
+
+def path_probabilities(layout, round_probs):
+    """
+    Get each team's probability of filling each spot of its path through the bracket.
+
+    Parameters
+    ----------
+    layout : BracketLayout
+        Layout of the bracket.
+    round_probs : np.array
+        (teams x rounds) probabilities of the teams to make each round, in bracket order (see team_round_probs).
+
+    Returns
+    -------
+    np.array
+        (teams x steps) probabilities along layout.paths, NaN past the end of a path and for
+         teams without probabilities.
+    """
+    ## Column 0 is being in a play-in game, and the rest are the rounds
+    round_probs = np.column_stack([np.where(np.isnan(round_probs[:, 0]), np.nan, 1), round_probs])
+
+    rows = layout.paths(np.arange(len(round_probs)))
+    stages = layout.columns['stage'][np.maximum(rows, 0)] + 1
+    step_probs = np.take_along_axis(round_probs, stages, axis=1)
+
+    return np.where(rows >= 0, step_probs, np.nan)
+
+
+def path_lines(layout, positions, step_probs):
+    """
+    Get the lines along the paths of some teams with their probabilities, grouped by round.
+
+    Parameters
+    ----------
+    layout : BracketLayout
+        Layout of the bracket.
+    positions : array-like of int
+        Positions of the teams (in round 0).
+    step_probs : np.array
+        (teams x steps) probability of each team filling each spot of its path (see
+         BracketLayout.paths), NaN where nothing is drawn.
+
+    Returns
+    -------
+    dict
+        'segments' (lines x 2 x 2) start and end points, 'rows' of the table, 'probs', 'teams'
+         (index in positions) and 'rounds' of each line, by round and the most likely first within a round, and
+         'starts', the first line of each round (with the number of lines at the end).
+    """
+    rows = layout.paths(positions)
+    n_steps = min(rows.shape[1], step_probs.shape[1])
+    rows, step_probs = rows[:, :n_steps], np.asarray(step_probs, dtype=float)[:, :n_steps]
+    teams = np.broadcast_to(np.arange(len(rows))[:, None], rows.shape)
+    keep = (rows >= 0) & (np.nan_to_num(step_probs) > 0)
+    rows, probs, teams = rows[keep], step_probs[keep], teams[keep]
+
+    rounds = layout.columns['round'][rows]
+    order = np.lexsort((-probs, rounds))
+    rows, probs, teams, rounds = rows[order], probs[order], teams[order], rounds[order]
+
+    line_y = layout.columns['line_y'][rows]
+    segments = np.stack([np.column_stack([layout.columns['line_x0'][rows], line_y]),
+                         np.column_stack([layout.columns['line_x1'][rows], line_y])], axis=1).astype(float)
+
+    return {'segments': segments, 'rows': rows, 'probs': probs, 'teams': teams, 'rounds': rounds,
+            'starts': np.searchsorted(rounds, np.arange(layout.n_rounds + 1))}
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from bracket_builder.calculate import (init_slot_dists, load_tourney_field, make_probs_df,
+                                       round_probs_from_dists, update_slot_dists)
+from bracket_builder.datasets import read_dataset
+
+
+class LiveTournament:
+    """
+    Round probabilities that are kept up to date as tournament games are completed.
+
+    Completed games fix their slots (and every earlier slot on the path of both teams) to the
+     actual winners, and only the slots above them are recomputed.
+    """
+
+    def __init__(self, slot_tree, seed_teams, win_probs, team_ids=None):
+        """
+        Parameters
+        ----------
+        slot_tree : SlotTree
+            Compiled tournament slots for the season.
+        seed_teams : dict
+            Seed (e.g. 'W16a') to row/column index of the team in win_probs.
+        win_probs : np.array
+            Matrix where win_probs[i, j] is the probability that team i beats team j.
+        team_ids : list of int
+            Optional. Team ID of each row of win_probs (defaults to the row numbers).
+        """
+        self.slot_tree = slot_tree
+        self.win_probs = win_probs
+        if team_ids is None:
+            team_ids = range(win_probs.shape[0])
+        self.team_ids = pd.Index(team_ids)
+
+        ## Seed node of each team
+        self.team_nodes = np.full(win_probs.shape[0], -1)
+        self.team_nodes[list(seed_teams.values())] = slot_tree.node_index.get_indexer(list(seed_teams.keys()))
+        self.team_seeds = np.array(slot_tree.node_index)[self.team_nodes]
+
+        ## Winner (team index) of every slot that has been decided, -1 when it hasn't
+        self.slot_winners = np.full(slot_tree.n_slots, -1)
+        self.node_dists = init_slot_dists(slot_tree, seed_teams, win_probs.shape[0])
+        update_slot_dists(slot_tree, self.node_dists, win_probs)
+
+    def add_results(self, winner_ids, loser_ids):
+        """
+        Fix the slots of completed games and recompute the slots that depend on them.
+
+        Parameters
+        ----------
+        winner_ids : list-like of int
+            Team IDs of the winners.
+        loser_ids : list-like of int
+            Team IDs of the losers (same order as the winners).
+
+        Returns
+        -------
+        np.array
+            Slot numbers that were fixed by these results.
+        """
+        winners = self.team_ids.get_indexer(winner_ids)
+        losers = self.team_ids.get_indexer(loser_ids)
+        if (winners < 0).any() or (losers < 0).any():
+            raise KeyError('Some results are for teams that are not in the tournament')
+        game_slots = self.slot_tree.get_slot_met(self.team_seeds[winners], self.team_seeds[losers])
+
+        ## Both teams won every slot on their way to the game, and the winner won the game
+        fixed = []
+        for game_slot, winner, loser in zip(game_slots, winners, losers):
+            game_node = game_slot + self.slot_tree.n_seeds
+            for team, last_node in ((winner, self.slot_tree.parent[game_node]), (loser, game_node)):
+                node = self.slot_tree.parent[self.team_nodes[team]]
+                while node != last_node:
+                    fixed.append(node - self.slot_tree.n_seeds)
+                    self.slot_winners[node - self.slot_tree.n_seeds] = team
+                    node = self.slot_tree.parent[node]
+        fixed = np.unique(fixed).astype(int)
+
+        for slot in fixed:
+            self.node_dists[slot + self.slot_tree.n_seeds] = 0
+            self.node_dists[slot + self.slot_tree.n_seeds, self.slot_winners[slot]] = 1
+
+        ## Only the undecided slots above a new result need to be recomputed
+        dirty = np.zeros(self.slot_tree.n_slots, dtype=bool)
+        for slot in fixed:
+            node = self.slot_tree.parent[slot + self.slot_tree.n_seeds]
+            while node >= 0 and not dirty[node - self.slot_tree.n_seeds]:
+                dirty[node - self.slot_tree.n_seeds] = True
+                node = self.slot_tree.parent[node]
+        dirty &= self.slot_winners < 0
+        update_slot_dists(self.slot_tree, self.node_dists, self.win_probs, np.flatnonzero(dirty))
+
+        return fixed
+
+    def round_probs(self):
+        """
+        Get the current probability that each team reaches each round.
+
+        Returns
+        -------
+        np.array
+            (teams x 7) array in the same layout as compute_round_probs.
+        """
+        return round_probs_from_dists(self.slot_tree, self.node_dists)
+
+    def probs_df(self, league='men'):
+        """
+        Get the current round probabilities in the round-by-round format of compute_conditional_probs.
+
+        Parameters
+        ----------
+        league : str
+            Either 'men' or 'women'.
+
+        Returns
+        -------
+        DataFrame
+            Probabilities for each team to make each round, sorted by team name.
+        """
+        return make_probs_df(self.round_probs(), self.team_ids, league)
+
+
+def read_results(results_filepath, season=None):
+    """
+    Read completed games from a compact results file (e.g. MNCAATourneyCompactResults.csv)
+     or a small results feed with WTeamID/LTeamID columns.
+
+    Parameters
+    ----------
+    results_filepath : str
+        Location of the results file.
+    season : int
+        Optional. Season to keep, for results files with a Season column.
+
+    Returns
+    -------
+    results_df : DataFrame
+        Completed games (WTeamID, LTeamID, ...) in the order they were played when DayNum is available.
+    """
+    results_df = read_dataset(results_filepath)
+    if (season is not None) and ('Season' in results_df.columns):
+        results_df = results_df[results_df['Season'] == season]
+    if 'DayNum' in results_df.columns:
+        results_df = results_df.sort_values('DayNum', kind='stable')
+
+    return results_df.reset_index(drop=True)
+
+
+def start_live_tournament(sub_filepath, season, league='men', results_filepath=None):
+    """
+    Set up live round probabilities from a submission, optionally with results already played.
+
+    Parameters
+    ----------
+    sub_filepath : str
+        Location of Kaggle data submission.
+    season : int
+        Season of the tournament.
+    league : str
+        Either 'men' or 'women'.
+    results_filepath : str
+        Optional. Location of the completed results (see read_results).
+
+    Returns
+    -------
+    LiveTournament
+        Tournament to keep adding results to with add_results.
+    """
+    slot_tree, tourney_seeds_df, win_probs = load_tourney_field(sub_filepath, season, league)
+    seed_teams = dict(zip(tourney_seeds_df['Seed'], tourney_seeds_df.index))
+    live = LiveTournament(slot_tree, seed_teams, win_probs, team_ids=tourney_seeds_df['TeamID'])
+
+    if results_filepath is not None:
+        results_df = read_results(results_filepath, season)
+        live.add_results(results_df['WTeamID'], results_df['LTeamID'])
+
+    return live
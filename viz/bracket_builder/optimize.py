@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+from bracket_builder.calculate import init_slot_dists, load_tourney_field, update_slot_dists
+from bracket_builder.datasets import load_dataset
+from bracket_builder.layout import display_seed_order
+
+
+## Points for a correct pick in each round (ESPN Tournament Challenge, play-in games aren't picked)
+ESPN_POINTS = {0: 0, 1: 10, 2: 20, 3: 40, 4: 80, 5: 160, 6: 320}
+
+
+def game_points(rnd, team_seed_nums, round_points=ESPN_POINTS, upset_bonus=0, seed_multiplier=False):
+    """
+    Points for correctly picking each team to beat each opponent in a round.
+
+    Parameters
+    ----------
+    rnd : int
+        Round number.
+    team_seed_nums : np.array
+        Seed number (1-16) of each team.
+    round_points : dict
+        Base points for a correct pick in each round.
+    upset_bonus : float or dict
+        Bonus points per seed line when the winner has a higher seed number than the loser.
+         Either one value for every round or a dict by round.
+    seed_multiplier : bool
+        Default False. Whether base points are multiplied by the winner's seed number.
+
+    Returns
+    -------
+    points : np.array
+        (teams x teams) points for picking team i when they beat team j.
+    """
+    base = np.full(len(team_seed_nums), float(round_points.get(rnd, 0)))
+    if seed_multiplier:
+        base = base * team_seed_nums
+
+    if isinstance(upset_bonus, dict):
+        upset_bonus = upset_bonus.get(rnd, 0)
+    seed_diffs = np.maximum(team_seed_nums[:, None] - team_seed_nums[None, :], 0)
+
+    return base[:, None] + upset_bonus * seed_diffs
+
+
+def _best_pick(best, dist):
+    """
+    Team with the most expected points below a node, ties (e.g. play-in games, which are worth
+     no points) going to the team most likely to come out of the node.
+    """
+    return np.argmax(np.where(best == best.max(), dist, -1))
+
+
+def optimal_picks(slot_tree, seed_teams, win_probs, round_points=ESPN_POINTS, upset_bonus=0,
+                  seed_multiplier=False):
+    """
+    Find the bracket with the most expected points with a DP over the slot tree.
+
+    The best bracket below a slot given its winner is the winner's best path up from their side,
+     plus the best bracket on the other side, plus the expected points for the pick itself:
+        E[points | pick i] = sum_j P(i from one side) * P(j from the other) * P(i beats j) * points(i, j)
+
+    Parameters
+    ----------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    seed_teams : dict
+        Seed (e.g. 'W16a') to row/column index of the team in win_probs.
+    win_probs : np.array
+        Matrix where win_probs[i, j] is the probability that team i beats team j.
+    round_points, upset_bonus, seed_multiplier
+        Scoring rules, see game_points.
+
+    Returns
+    -------
+    picks : np.array
+        Team index picked to win each slot. Picks that don't change the expected points
+         (e.g. play-in games with ESPN_POINTS) are the most likely winner of the slot.
+    expected_points : float
+        Expected points of the bracket.
+    """
+    n_teams = win_probs.shape[0]
+    n_seeds = slot_tree.n_seeds
+    node_dists = init_slot_dists(slot_tree, seed_teams, n_teams)
+    update_slot_dists(slot_tree, node_dists, win_probs)
+
+    team_seed_nums = np.zeros(n_teams)
+    for seed, idx in seed_teams.items():
+        team_seed_nums[idx] = int(seed[1:3])
+
+    ## (nodes x teams) best expected points below each node given who comes out of it
+    best = np.where(node_dists > 0, 0.0, -np.inf)
+
+    for rnd in slot_tree.rounds():
+        rd_slots = slot_tree.round_slots(rnd)
+        strong_nodes = slot_tree.children[rd_slots, 0]
+        weak_nodes = slot_tree.children[rd_slots, 1]
+        strong = node_dists[strong_nodes]
+        weak = node_dists[weak_nodes]
+
+        ## (slots x teams) expected points for the pick itself
+        pick_values = win_probs * game_points(rnd, team_seed_nums, round_points, upset_bonus, seed_multiplier)
+        pick_points = strong * (weak @ pick_values.T) + weak * (strong @ pick_values.T)
+
+        best_strong = best[strong_nodes]
+        best_weak = best[weak_nodes]
+        path_points = np.maximum(best_strong + best_weak.max(axis=1, keepdims=True),
+                                 best_weak + best_strong.max(axis=1, keepdims=True))
+        best[rd_slots + n_seeds] = np.where(np.isfinite(path_points), path_points + pick_points, -np.inf)
+
+    ## Back out the picks from the championship down
+    picks = np.full(slot_tree.n_slots, -1)
+    root = slot_tree.n_slots - 1
+    picks[root] = _best_pick(best[root + n_seeds], node_dists[root + n_seeds])
+    for slot in range(root, -1, -1):
+        for child in slot_tree.children[slot]:
+            if child < n_seeds:
+                continue
+            if np.isfinite(best[child, picks[slot]]):
+                picks[child - n_seeds] = picks[slot]
+            else:
+                picks[child - n_seeds] = _best_pick(best[child], node_dists[child])
+
+    return picks, best[root + n_seeds, picks[root]]
+
+
+def picks_to_winners(slot_tree, picks, team_labels, seed_order=None, first_round=1):
+    """
+    Turn picks into the list of lists of winners that Bracket.label_winners uses.
+
+    Parameters
+    ----------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    picks : np.array
+        Team index picked to win each slot.
+    team_labels : list of str
+        Label (e.g. team name) of each team index.
+    seed_order : list of str
+        Optional. Seeds in the same order as the team names given to the Bracket
+         (default is display_seed_order).
+    first_round : int
+        Default 1. First round to include (2 for a 32 team bracket).
+
+    Returns
+    -------
+    winners : list of lists of str
+        Picked winners of each round, in bracket order.
+    """
+    if seed_order is None:
+        seed_order = display_seed_order(slot_tree)
+    positions = pd.Series(range(len(seed_order)), index=[s[:3] for s in seed_order])
+    positions = positions[~positions.index.duplicated()]
+
+    ## Position of a slot on the bracket is the top-most seed that can reach it
+    seed_positions = positions.reindex([s[:3] for s in slot_tree.seeds]).to_numpy()
+    slot_positions = np.where(slot_tree.possible_seeds, seed_positions[None, :], np.inf).min(axis=1)
+
+    winners = []
+    for rnd in slot_tree.rounds():
+        if rnd < first_round:
+            continue
+        rd_slots = slot_tree.round_slots(rnd)
+        rd_slots = rd_slots[np.argsort(slot_positions[rd_slots], kind='stable')]
+        winners.append([team_labels[picks[s]] for s in rd_slots])
+
+    return winners
+
+
+def pick_bracket(sub_filepath, season, league='men', round_points=ESPN_POINTS, upset_bonus=0,
+                 seed_multiplier=False, seed_order=None):
+    """
+    Pick the bracket with the most expected points for a pool's scoring rules from a submission.
+
+    Parameters
+    ----------
+    sub_filepath : str
+        Location of Kaggle data submission.
+    season : int
+        Season of the tournament.
+    league : str
+        Either 'men' or 'women'.
+    round_points, upset_bonus, seed_multiplier
+        Scoring rules, see game_points.
+    seed_order : list of str
+        Optional. Seeds in the same order as the team names given to the Bracket.
+
+    Returns
+    -------
+    winners : list of lists of str
+        Team names picked to win each round (for Bracket(winners=...)).
+    expected_points : float
+        Expected points of the bracket.
+    """
+    slot_tree, tourney_seeds_df, win_probs = load_tourney_field(sub_filepath, season, league)
+    seed_teams = dict(zip(tourney_seeds_df['Seed'], tourney_seeds_df.index))
+    picks, expected_points = optimal_picks(slot_tree, seed_teams, win_probs, round_points,
+                                           upset_bonus, seed_multiplier)
+
+    team_names_df = load_dataset('Teams', league)
+    team_names = (tourney_seeds_df[['TeamID']].merge(team_names_df[['TeamID', 'TeamName']], how='left')
+                  ['TeamName'].tolist())
+
+    return picks_to_winners(slot_tree, picks, team_names, seed_order), expected_points
@@ -0,0 +1,381 @@
+import io
+import os
+import queue
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib import colors as mcolors
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+from bracket_builder.draw import Bracket, weighted_path_collections
+from bracket_builder.layout import bracket_layout, pad_probabilities, path_probabilities, team_round_probs
+
+
+## Renderers of this process by number of teams (each worker builds its own)
+_renderers = {}
+
+
+class BracketRenderer:
+    """
+    Draws many brackets of one size on a single figure.
+
+    The figure, limits and bracket lines are built once, and each image only swaps the text and
+     highlight artists (plain text rather than annotations, which look the same and draw faster).
+     The figure is drawn with the Agg canvas directly rather than through pyplot, so rendering
+     in a loop doesn't leak figures.
+    """
+
+    def __init__(self, n_teams, figsize=(13, 10), dpi=100, slot_tree=None):
+        """
+        Parameters
+        ----------
+        n_teams : int
+            Number of teams in the tournament (16, 32, 64, or 68 with the slot tree).
+        figsize : tuple of float
+            Default (13, 10). Width and height of the images in inches (as Bracket.draw_bracket).
+        dpi : int
+            Default 100. Resolution of the images.
+        slot_tree : SlotTree
+            Optional. Compiled tournament slots, which place the play-in games (see bracket_layout).
+        """
+        self.layout = bracket_layout(n_teams, slot_tree)
+        self.n_teams = self.layout.n_teams
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+
+        self.ax.set_xlim(self.layout.xlim)
+        self.ax.set_ylim(self.layout.ylim)
+        self.ax.add_collection(LineCollection(self.layout.segments, linewidths=1, colors='black',
+                                              linestyles='solid'))
+        self.ax.axis('off')
+
+        ## Artists of the current image
+        self._artists = []
+
+    def draw(self, team_names=None, winners=None, actual=False, win_prob_teams=None, win_probabilities=None,
+             colors=None, probs_df=None, path_colors=None, path_weight='width'):
+        """
+        Label the bracket for one image, like Bracket.label_teams, label_winners, draw_weighted_lines
+         and draw_probability_paths. The labels of the previous image are removed.
+
+        Parameters
+        ----------
+        team_names : list of str
+            Optional. Team names from top left, bottom left, top right, to bottom right.
+        winners : list of lists of str
+            Optional. Winners of each round, in the same order.
+        actual : bool
+            Default False. Whether the winners are actual results (black) or projected (gray).
+        win_prob_teams : list of str
+            Optional. Team names to highlight with lines weighted by their win probability.
+        win_probabilities : list of lists of float
+            Optional. Probabilities of each highlighted team making each round (line widths are 5
+             times the probability).
+        colors : list of str
+            Optional. Color of each highlighted team's path (default black).
+        probs_df : DataFrame
+            Optional. Probabilities of every team to make each round (by TeamName), drawn as paths.
+        path_colors : list of str
+            Optional. Color of each team's path from probs_df (default cycles through the Tableau colors).
+        path_weight : str
+            Default 'width'. Whether the probabilities of probs_df set the width or the opacity ('alpha').
+        """
+        for artist in self._artists:
+            artist.remove()
+        self._artists = []
+
+        if team_names is not None:
+            spots = self.layout.round_table(0)
+            for name, xpos, ypos, size in zip(team_names, spots['x'], spots['y'], spots['size']):
+                self._artists.append(self.ax.text(xpos, ypos, name, size=size))
+
+        if winners is not None:
+            color = 'black' if actual else 'gray'
+            for rnd, names in enumerate(winners, 1):
+                spots = self.layout.round_table(rnd)
+                for name, xpos, ypos, size, ha in zip(names, spots['x'], spots['y'], spots['size'], spots['ha']):
+                    self._artists.append(self.ax.text(xpos, ypos, name, size=size, color=color, ha=ha))
+
+        paths = []
+        if (probs_df is not None) and (team_names is not None):
+            if path_colors is None:
+                path_colors = np.resize(list(mcolors.TABLEAU_COLORS), len(team_names))
+            round_probs = team_round_probs(probs_df, team_names)
+            paths += weighted_path_collections(self.layout, np.arange(len(team_names)),
+                                               path_probabilities(self.layout, round_probs), path_colors,
+                                               weight=path_weight)
+        if (win_probabilities is not None) and (team_names is not None):
+            if colors is None:
+                colors = ['Black'] * len(win_prob_teams)
+            positions = [list(team_names).index(team) for team in win_prob_teams]
+            paths += weighted_path_collections(self.layout, positions, pad_probabilities(win_probabilities), colors)
+        for lines in paths:
+            self._artists.append(self.ax.add_collection(lines))
+
+    def render(self, filename=None, format='png', **labels):
+        """
+        Draw one bracket and save it.
+
+        Parameters
+        ----------
+        filename : str
+            Optional. File to save the image to (without extension). The image is returned
+             as bytes when it isn't given.
+        format : str
+            Default 'png'. Image format.
+        **labels
+            Passed to draw (team_names, winners, actual, win_prob_teams, win_probabilities, colors, probs_df, ...).
+
+        Returns
+        -------
+        bytes or str
+            The image, or the path it was saved to.
+        """
+        self.draw(**labels)
+
+        if filename is None:
+            buffer = io.BytesIO()
+            self.fig.savefig(buffer, format=format)
+            return buffer.getvalue()
+
+        path = f'{filename}.{format}'
+        self.fig.savefig(path, format=format)
+
+        return path
+
+
+def _render_jobs(task):
+    """
+    Render a chunk of brackets with this process's renderer for the size (in the worker processes).
+    """
+    n_teams, render_kwargs, jobs = task
+    key = (n_teams, tuple(sorted(render_kwargs.items())))
+    if key not in _renderers:
+        _renderers[key] = BracketRenderer(n_teams, **render_kwargs)
+
+    return [_renderers[key].render(**job) for job in jobs]
+
+
+def render_brackets(jobs, n_teams, n_workers=None, chunk_size=50, **render_kwargs):
+    """
+    Render many brackets of one size, in parallel in a process pool.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        Keyword arguments of BracketRenderer.render for each image (e.g. filename, team_names, winners).
+    n_teams : int
+        Number of teams in the tournament (32, 64 or 68).
+    n_workers : int
+        Optional. Number of processes (default is all of the CPUs, 1 renders here).
+    chunk_size : int
+        Default 50. Number of images each task renders.
+    **render_kwargs
+        Passed to BracketRenderer (figsize, dpi).
+
+    Returns
+    -------
+    list
+        Output of render for each job (bytes, or the paths of the saved images), in order.
+    """
+    tasks = [(n_teams, render_kwargs, jobs[i:i + chunk_size]) for i in range(0, len(jobs), chunk_size)]
+
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    if (n_workers == 1) or (len(tasks) <= 1):
+        chunks = list(map(_render_jobs, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            chunks = list(executor.map(_render_jobs, tasks))
+
+    return [output for chunk in chunks for output in chunk]
+
+
+class _BackgroundWriter:
+    """
+    Runs the writes of an export in a background thread, so rendering doesn't wait on the disk.
+     At most max_pending writes are queued, which keeps memory bounded when the disk is slower.
+    """
+
+    def __init__(self, max_pending=16):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((func, args))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            func, args = item
+            if self._error is None:
+                try:
+                    func(*args)
+                except Exception as error:
+                    self._error = error
+
+
+class _QueuedFile:
+    """
+    File-like object for PdfPages that hands its writes to a background writer in blocks.
+    """
+
+    def __init__(self, fh, writer, block_size=1 << 20):
+        self._fh = fh
+        self._writer = writer
+        self._block_size = block_size
+        self._blocks = []
+        self._buffered = 0
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._blocks.append(data)
+        self._buffered += len(data)
+        self._position += len(data)
+        if self._buffered >= self._block_size:
+            self.flush()
+
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, *args):
+        raise OSError('Exports are written as a stream')
+
+    def flush(self):
+        if self._blocks:
+            self._writer.submit(self._fh.write, b''.join(self._blocks))
+            self._blocks = []
+            self._buffered = 0
+
+
+def _bracket_config(bracket):
+    """
+    Labels of a Bracket (or a dict of render arguments) as a dict of render arguments.
+    """
+    if isinstance(bracket, Bracket):
+        return {'n_teams': bracket.n_teams, 'slot_tree': bracket.slot_tree, 'team_names': bracket.team_names,
+                'winners': bracket.winners, 'actual': bracket.actual, 'win_prob_teams': bracket.win_prob_teams,
+                'win_probabilities': bracket.win_probabilities}
+
+    return dict(bracket)
+
+
+def _finish_export(writer, files, failed):
+    """
+    Wait for the queued writes, then close the files of an export. When the export (or a write)
+     failed, the partial files are removed and the first error is the one raised.
+    """
+    error = None
+    try:
+        writer.close()
+    except Exception as write_error:
+        error = write_error
+
+    for fh, filepath in files:
+        if fh is None:
+            continue
+        try:
+            fh.close()
+        except Exception as close_error:
+            error = error or close_error
+        if (failed or error is not None) and os.path.exists(filepath):
+            os.remove(filepath)
+
+    if error is not None and not failed:
+        raise error
+
+
+def export_brackets(brackets, pdf_filepath=None, png_zip_filepath=None, n_teams=64, **render_kwargs):
+    """
+    Stream a collection of brackets into one multi-page PDF and/or a zip of PNGs.
+
+    Each bracket is drawn on a reused figure (one per size and slot tree) and written before the next one is
+     drawn, so memory doesn't grow with the number of pages. Files are written by a background
+     thread while the next bracket is drawn. If the export fails, the partial files are removed.
+
+    Parameters
+    ----------
+    brackets : iterable of Bracket or dict
+        Brackets to export, either Bracket objects or keyword arguments of BracketRenderer.draw,
+         optionally with 'n_teams', 'slot_tree' (needed for 68 teams) and 'filename' (name of the PNG
+         in the zip, without extension).
+    pdf_filepath : str
+        Optional. Location of the PDF with one page per bracket.
+    png_zip_filepath : str
+        Optional. Location of the zip of PNGs.
+    n_teams : int
+        Default 64. Number of teams of the brackets that don't say.
+    **render_kwargs
+        Passed to BracketRenderer (figsize, dpi).
+
+    Returns
+    -------
+    int
+        Number of brackets exported.
+    """
+    writer = _BackgroundWriter()
+    renderers = {}
+    pdf_fh = pdf_stream = pdf = png_zip = None
+    n_pages = 0
+    try:
+        if pdf_filepath is not None:
+            pdf_fh = open(pdf_filepath, 'wb')
+            pdf_stream = _QueuedFile(pdf_fh, writer)
+            pdf = PdfPages(pdf_stream)
+        if png_zip_filepath is not None:
+            ## PNGs are already compressed
+            png_zip = zipfile.ZipFile(png_zip_filepath, 'w', compression=zipfile.ZIP_STORED)
+
+        for bracket in brackets:
+            config = _bracket_config(bracket)
+            size = config.pop('n_teams', n_teams)
+            slot_tree = config.pop('slot_tree', None)
+            name = config.pop('filename', f'bracket_{n_pages:04d}')
+            ## Slot trees are memoized, so the brackets of a season share one renderer
+            if (size, slot_tree) not in renderers:
+                renderers[size, slot_tree] = BracketRenderer(size, slot_tree=slot_tree, **render_kwargs)
+            renderer = renderers[size, slot_tree]
+
+            renderer.draw(**config)
+            if pdf is not None:
+                pdf.savefig(renderer.fig)
+                pdf_stream.flush()
+            if png_zip is not None:
+                buffer = io.BytesIO()
+                renderer.fig.savefig(buffer, format='png')
+                writer.submit(png_zip.writestr, f'{name}.png', buffer.getvalue())
+            n_pages += 1
+
+        if pdf is not None:
+            pdf.close()
+            pdf_stream.flush()
+    except BaseException:
+        _finish_export(writer, [(pdf_fh, pdf_filepath), (png_zip, png_zip_filepath)], failed=True)
+        raise
+
+    ## Files are closed after the queued writes
+    _finish_export(writer, [(pdf_fh, pdf_filepath), (png_zip, png_zip_filepath)], failed=False)
+
+    return n_pages
@@ -0,0 +1,319 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from bracket_builder.calculate import ROUND_COLS, load_tourney_field, make_probs_df
+
+
+class SimulationResults:
+    """
+    Aggregate counts from many simulated tournaments.
+    """
+
+    def __init__(self, slot_tree, team_ids, seeds, round_counts, joint_counts, upset_counts, n_sims,
+                 brackets=None):
+        """
+        Parameters
+        ----------
+        slot_tree : SlotTree
+            Compiled tournament slots that were simulated.
+        team_ids : list of int
+            Team ID of each team index.
+        seeds : list of str
+            Seed of each team index.
+        round_counts : np.array
+            (teams x 7) number of simulations where each team reached each round.
+        joint_counts : np.array
+            (7 x teams x teams) number of simulations where both teams reached the round.
+        upset_counts : np.array
+            (rounds x games + 1) number of simulations with 0, 1, 2, ... upsets in each round.
+        n_sims : int
+            Number of simulated tournaments.
+        brackets : np.array
+            Optional. (simulations x slots) team index of the winner of each slot.
+        """
+        self.slot_tree = slot_tree
+        self.team_ids = list(team_ids)
+        self.seeds = list(seeds)
+        self.round_counts = round_counts
+        self.joint_counts = joint_counts
+        self.upset_counts = upset_counts
+        self.n_sims = n_sims
+        self.brackets = brackets
+
+    def round_probs(self):
+        """
+        Get the share of simulations where each team reached each round.
+
+        Returns
+        -------
+        np.array
+            (teams x 7) array in the same layout as compute_round_probs.
+        """
+        return self.round_counts / self.n_sims
+
+    def probs_df(self, league='men'):
+        """
+        Get the simulated round probabilities in the round-by-round format of compute_conditional_probs.
+
+        Parameters
+        ----------
+        league : str
+            Either 'men' or 'women'.
+
+        Returns
+        -------
+        DataFrame
+            Probabilities for each team to make each round, sorted by team name.
+        """
+        return make_probs_df(self.round_probs(), self.team_ids, league)
+
+    def joint_prob(self, team_ids, rnd='Final4'):
+        """
+        Get the probability that every one of a group of teams reaches a round in the same tournament.
+         Groups larger than 2 need the simulated brackets (keep_brackets=True).
+
+        Parameters
+        ----------
+        team_ids : list of int
+            Teams of interest (e.g. both 1-seeds in a region).
+        rnd : str
+            Round column name (one of ROUND_COLS).
+
+        Returns
+        -------
+        float
+            Probability that all of the teams reach the round.
+        """
+        col = ROUND_COLS.index(rnd)
+        idx = [self.team_ids.index(t) for t in team_ids]
+        if len(idx) == 1:
+            return self.round_counts[idx[0], col] / self.n_sims
+        elif len(idx) == 2:
+            return self.joint_counts[col, idx[0], idx[1]] / self.n_sims
+        elif self.brackets is None:
+            raise ValueError('Joint probabilities of more than 2 teams need keep_brackets=True')
+
+        ## Winning a game in the round means reaching the column (play-in teams need the round 0 win)
+        rd_winners = self.brackets[:, self.slot_tree.round_slots(col)]
+        reached = np.ones(self.n_sims, dtype=bool)
+        for i in idx:
+            if (col > 0) or (self.round_counts[i, 0] < self.n_sims):
+                reached &= (rd_winners == i).any(axis=1)
+
+        return reached.mean()
+
+    def upset_distribution(self):
+        """
+        Get the distribution of the number of upsets (lower seed number losing) in each round.
+
+        Returns
+        -------
+        DataFrame
+            Share of simulations (values) with each number of upsets (index) by round (columns
+             R0_upsets for the play-in games, R1_upsets, etc., so they don't read as ROUND_COLS).
+        """
+        dist_df = pd.DataFrame(self.upset_counts.T / self.n_sims,
+                               columns=[f'R{r}_upsets' for r in range(self.upset_counts.shape[0])])
+        dist_df.index.name = 'n_upsets'
+
+        return dist_df
+
+
+def simulate_brackets(slot_tree, seed_teams, win_probs, n_sims, rng):
+    """
+    Play out a batch of tournaments, one game per slot for all simulations at once.
+
+    Parameters
+    ----------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    seed_teams : dict
+        Seed (e.g. 'W16a') to row/column index of the team in win_probs.
+    win_probs : np.array
+        Matrix where win_probs[i, j] is the probability that team i beats team j.
+    n_sims : int
+        Number of tournaments to play out.
+    rng : np.random.Generator
+        Random number generator for the batch.
+
+    Returns
+    -------
+    winners : np.array
+        (simulations x slots) team index of the winner of each slot.
+    losers : np.array
+        (simulations x slots) team index of the loser of each slot.
+    """
+    n_nodes = slot_tree.n_seeds + slot_tree.n_slots
+    nodes = np.empty((n_sims, n_nodes), dtype=np.int16)
+    seed_nodes = slot_tree.node_index.get_indexer(list(seed_teams.keys()))
+    nodes[:, seed_nodes] = np.array(list(seed_teams.values()), dtype=np.int16)
+    losers = np.empty((n_sims, slot_tree.n_slots), dtype=np.int16)
+
+    for rnd in slot_tree.rounds():
+        rd_slots = slot_tree.round_slots(rnd)
+        strong = nodes[:, slot_tree.children[rd_slots, 0]]
+        weak = nodes[:, slot_tree.children[rd_slots, 1]]
+
+        strong_wins = rng.random(strong.shape) < win_probs[strong, weak]
+        nodes[:, rd_slots + slot_tree.n_seeds] = np.where(strong_wins, strong, weak)
+        losers[:, rd_slots] = np.where(strong_wins, weak, strong)
+
+    return nodes[:, slot_tree.n_seeds:], losers
+
+
+def _simulate_chunk(args):
+    """
+    Simulate one chunk of tournaments and reduce it to aggregate counts (run in the worker processes).
+    """
+    slot_tree, seed_teams, win_probs, n_sims, seed_seq, keep_brackets = args
+    rng = np.random.default_rng(seed_seq)
+    n_teams = win_probs.shape[0]
+    winners, losers = simulate_brackets(slot_tree, seed_teams, win_probs, n_sims, rng)
+
+    team_seed_nums = np.zeros(n_teams, dtype=int)
+    for seed, idx in seed_teams.items():
+        team_seed_nums[idx] = int(seed[1:3])
+
+    rounds = slot_tree.rounds()
+    max_games = max(len(slot_tree.round_slots(rnd)) for rnd in rounds)
+    round_counts = np.zeros((n_teams, len(ROUND_COLS)))
+    round_counts[:, 0] = n_sims
+    joint_counts = np.zeros((len(ROUND_COLS), n_teams, n_teams))
+    upset_counts = np.zeros((rounds.max() + 1, max_games + 1))
+    sim_rows = np.arange(n_sims)[:, None]
+
+    for rnd in rounds:
+        rd_slots = slot_tree.round_slots(rnd)
+        rd_winners = winners[:, rd_slots]
+
+        ## Indicator of the teams that won a game in the round (i.e. reached the next round)
+        reached = np.zeros((n_sims, n_teams), dtype=np.float32)
+        reached[sim_rows, rd_winners] = 1
+        if rnd == 0:
+            ## Teams outside of the play-in games reach Round1 in every simulation
+            playin_teams = np.unique(np.concatenate([rd_winners[0], losers[0, rd_slots]]))
+            not_playin = np.setdiff1d(np.arange(n_teams), playin_teams)
+            reached[:, not_playin] = 1
+            col = 0
+        else:
+            col = rnd
+        round_counts[:, col] = reached.sum(axis=0)
+        joint_counts[col] = reached.T @ reached
+
+        n_upsets = (team_seed_nums[rd_winners] > team_seed_nums[losers[:, rd_slots]]).sum(axis=1)
+        upset_counts[rnd] += np.bincount(n_upsets, minlength=max_games + 1)
+
+    if 0 not in rounds:
+        joint_counts[0] = n_sims
+
+    return round_counts, joint_counts, upset_counts, (winners if keep_brackets else None)
+
+
+def run_simulations(slot_tree, seed_teams, win_probs, team_ids=None, n_sims=1000000, chunk_size=100000,
+                    n_workers=None, random_state=None, keep_brackets=False):
+    """
+    Simulate many tournaments in chunks across a process pool, only keeping running totals
+     so memory is bounded by the chunk size.
+
+    Every chunk gets its own child of one SeedSequence, so results are reproducible for a given
+     random_state and chunk_size no matter how many workers run them.
+
+    Parameters
+    ----------
+    slot_tree : SlotTree
+        Compiled tournament slots for the season.
+    seed_teams : dict
+        Seed (e.g. 'W16a') to row/column index of the team in win_probs.
+    win_probs : np.array
+        Matrix where win_probs[i, j] is the probability that team i beats team j.
+    team_ids : list of int
+        Optional. Team ID of each row of win_probs (defaults to the row numbers).
+    n_sims : int
+        Number of tournaments to simulate.
+    chunk_size : int
+        Number of tournaments simulated at once in each task.
+    n_workers : int
+        Number of worker processes (default is the number of CPUs, 1 runs everything in this process).
+    random_state : int
+        Optional. Seed for reproducible simulations.
+    keep_brackets : bool
+        Default False. Whether to also keep every simulated bracket (simulations x slots).
+
+    Returns
+    -------
+    SimulationResults
+        Aggregated counts from the simulations.
+    """
+    n_chunks = int(np.ceil(n_sims / chunk_size))
+    chunk_sims = [min(chunk_size, n_sims - i * chunk_size) for i in range(n_chunks)]
+    seed_seqs = np.random.SeedSequence(random_state).spawn(n_chunks)
+    tasks = [(slot_tree, seed_teams, win_probs, n, seed_seq, keep_brackets)
+             for n, seed_seq in zip(chunk_sims, seed_seqs)]
+
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    if (n_workers == 1) or (n_chunks == 1):
+        chunk_results = map(_simulate_chunk, tasks)
+        results = _combine_chunks(chunk_results)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = _combine_chunks(executor.map(_simulate_chunk, tasks))
+    round_counts, joint_counts, upset_counts, brackets = results
+
+    if team_ids is None:
+        team_ids = range(win_probs.shape[0])
+    seeds = [seed for seed, _ in sorted(seed_teams.items(), key=lambda x: x[1])]
+
+    return SimulationResults(slot_tree, team_ids, seeds, round_counts, joint_counts, upset_counts,
+                             n_sims, brackets=brackets)
+
+
+def _combine_chunks(chunk_results):
+    """
+    Add up the counts from each chunk as they finish (brackets are stacked when kept).
+    """
+    round_counts, joint_counts, upset_counts, brackets = None, None, None, []
+    for chunk_rounds, chunk_joint, chunk_upsets, chunk_brackets in chunk_results:
+        if round_counts is None:
+            round_counts, joint_counts, upset_counts = chunk_rounds, chunk_joint, chunk_upsets
+        else:
+            round_counts += chunk_rounds
+            joint_counts += chunk_joint
+            upset_counts += chunk_upsets
+        if chunk_brackets is not None:
+            brackets.append(chunk_brackets)
+
+    return round_counts, joint_counts, upset_counts, (np.vstack(brackets) if brackets else None)
+
+
+def simulate_tournament(sub_filepath, season, league='men', n_sims=1000000, chunk_size=100000,
+                        n_workers=None, random_state=None, keep_brackets=False):
+    """
+    Simulate a season's tournament from a submission file.
+     The simulated round probabilities converge to compute_conditional_probs.
+
+    Parameters
+    ----------
+    sub_filepath : str
+        Location of Kaggle data submission.
+    season : int
+        Season of the tournament.
+    league : str
+        Either 'men' or 'women'.
+    n_sims, chunk_size, n_workers, random_state, keep_brackets
+        See run_simulations.
+
+    Returns
+    -------
+    SimulationResults
+        Aggregated counts from the simulations.
+    """
+    slot_tree, tourney_seeds_df, win_probs = load_tourney_field(sub_filepath, season, league)
+    seed_teams = dict(zip(tourney_seeds_df['Seed'], tourney_seeds_df.index))
+
+    return run_simulations(slot_tree, seed_teams, win_probs, team_ids=list(tourney_seeds_df['TeamID']),
+                           n_sims=n_sims, chunk_size=chunk_size, n_workers=n_workers,
+                           random_state=random_state, keep_brackets=keep_brackets)
@@ -0,0 +1,205 @@
+import os
+import numpy as np
+import pandas as pd
+
+from bracket_builder.datasets import read_dataset
+
+
+## Compiled slot trees by (absolute path of the slots file, season)
+_slot_trees = {}
+
+
+def slot_round(slot):
+    """
+    Get the round number from the name of a slot (play-in slots like 'W16' are round 0).
+
+    Parameters
+    ----------
+    slot : str
+        Name of the slot (e.g. 'R1W1', 'R6CH', 'W16').
+
+    Returns
+    -------
+    int
+        Round that the game in the slot is played.
+    """
+    return int(slot[1]) if slot.startswith('R') else 0
+
+
+class SlotTree:
+    """
+    Tournament slots for one season compiled into integer arrays.
+
+    Nodes are numbered with the seeds first (the leaves of the tree) followed by the slots,
+     sorted by round so that every slot comes after the two nodes feeding it.
+    """
+
+    def __init__(self, tourney_slots_df):
+        """
+        Parameters
+        ----------
+        tourney_slots_df : DataFrame
+            The provided tournament slots data for a single season (Slot, StrongSeed, WeakSeed).
+        """
+        slots_df = tourney_slots_df[['Slot', 'StrongSeed', 'WeakSeed']].copy()
+        slots_df['round'] = slots_df['Slot'].apply(slot_round)
+        slots_df = slots_df.sort_values(['round', 'Slot'], kind='stable').reset_index(drop=True)
+
+        ## Anything feeding a slot that isn't a slot itself is a seed
+        slot_names = list(slots_df['Slot'])
+        seed_names = sorted((set(slots_df['StrongSeed']) | set(slots_df['WeakSeed'])) - set(slot_names))
+
+        self.seeds = seed_names
+        self.slots = slot_names
+        self.n_seeds = len(seed_names)
+        self.n_slots = len(slot_names)
+        self.node_index = pd.Index(seed_names + slot_names)
+        self.seed_index = pd.Index(seed_names)
+
+        ## (slots x 2) node indices of the strong and weak side of each slot
+        self.children = np.column_stack([self.node_index.get_indexer(slots_df['StrongSeed']),
+                                         self.node_index.get_indexer(slots_df['WeakSeed'])])
+        self.slot_rounds = slots_df['round'].to_numpy()
+
+        ## Parent slot (as a node index) of every node, -1 for the championship
+        self.parent = np.full(self.n_seeds + self.n_slots, -1)
+        self.parent[self.children[:, 0]] = np.arange(self.n_slots) + self.n_seeds
+        self.parent[self.children[:, 1]] = np.arange(self.n_slots) + self.n_seeds
+
+        ## (slots x seeds) which seeds can possibly reach each slot, filled from the bottom up
+        self.possible_seeds = np.zeros((self.n_slots, self.n_seeds), dtype=bool)
+        for s, (strong, weak) in enumerate(self.children):
+            for child in (strong, weak):
+                if child < self.n_seeds:
+                    self.possible_seeds[s, child] = True
+                else:
+                    self.possible_seeds[s] |= self.possible_seeds[child - self.n_seeds]
+
+        ## (seeds x seeds) lowest common slot, i.e. the slot two seeds would meet in, and its round
+        ##  Going from the last slot backwards leaves the earliest slot in place.
+        self.slot_met = np.full((self.n_seeds, self.n_seeds), -1)
+        for s in range(self.n_slots - 1, -1, -1):
+            in_slot = np.flatnonzero(self.possible_seeds[s])
+            self.slot_met[np.ix_(in_slot, in_slot)] = s
+        np.fill_diagonal(self.slot_met, -1)
+        self.round_met = np.where(self.slot_met >= 0, self.slot_rounds[self.slot_met], -1)
+
+    def rounds(self):
+        """
+        Get the rounds played in the tournament, in order.
+
+        Returns
+        -------
+        np.array
+            Sorted unique round numbers (0 is the play-in round when there is one).
+        """
+        return np.unique(self.slot_rounds)
+
+    def round_slots(self, rnd):
+        """
+        Get the slot numbers (positions in self.slots) of the games in a round.
+
+        Parameters
+        ----------
+        rnd : int
+            Round number.
+
+        Returns
+        -------
+        np.array
+            Slot numbers for the round.
+        """
+        return np.flatnonzero(self.slot_rounds == rnd)
+
+    def get_slot_met(self, seeds_1, seeds_2):
+        """
+        Get the slots (positions in self.slots) that pairs of seeds would meet in.
+
+        Parameters
+        ----------
+        seeds_1 : list-like of str
+            Seeds of team 1.
+        seeds_2 : list-like of str
+            Seeds of team 2.
+
+        Returns
+        -------
+        np.array
+            Slot number where each pair meets (-1 if either seed isn't in the tournament).
+        """
+        idx_1 = self.seed_index.get_indexer(seeds_1)
+        idx_2 = self.seed_index.get_indexer(seeds_2)
+        slots = self.slot_met[idx_1, idx_2]
+        slots[(idx_1 < 0) | (idx_2 < 0)] = -1
+
+        return slots
+
+    def get_round_met(self, seeds_1, seeds_2):
+        """
+        Get the rounds that pairs of seeds would meet in, for any number of pairs at once.
+
+        Parameters
+        ----------
+        seeds_1 : list-like of str
+            Seeds of team 1.
+        seeds_2 : list-like of str
+            Seeds of team 2.
+
+        Returns
+        -------
+        np.array
+            Round number where each pair meets (-1 if either seed isn't in the tournament).
+        """
+        idx_1 = self.seed_index.get_indexer(seeds_1)
+        idx_2 = self.seed_index.get_indexer(seeds_2)
+        rounds = self.round_met[idx_1, idx_2]
+        rounds[(idx_1 < 0) | (idx_2 < 0)] = -1
+
+        return rounds
+
+
+def load_slot_tree(slots_filepath, season = None):
+    """
+    Read a tournament slots file and compile the slot tree for a season.
+     Trees are memoized, so repeat calls for the same file and season are free.
+
+    Parameters
+    ----------
+    slots_filepath : str
+        Location of the *NCAATourneySlots file.
+    season : int
+        Optional. Season to keep, for slot files with a Season column.
+
+    Returns
+    -------
+    SlotTree
+        Compiled slot tree for the season.
+    """
+    key = (os.path.abspath(slots_filepath), season)
+    if key not in _slot_trees:
+        tourney_slots_df = read_dataset(slots_filepath)
+        _slot_trees[key] = slot_tree_from_df(tourney_slots_df, season)
+
+    return _slot_trees[key]
+
+
+def slot_tree_from_df(tourney_slots_df, season = None):
+    """
+    Compile the slot tree for a season from already-loaded tournament slots.
+
+    Parameters
+    ----------
+    tourney_slots_df : DataFrame
+        The provided tournament slots data.
+    season : int
+        Optional. Season to keep, when the slots data has a Season column.
+
+    Returns
+    -------
+    SlotTree
+        Compiled slot tree for the season.
+    """
+    if (season is not None) and ('Season' in tourney_slots_df.columns):
+        tourney_slots_df = tourney_slots_df[tourney_slots_df['Season'] == season]
+
+    return SlotTree(tourney_slots_df)
@@ -0,0 +1,226 @@
+import hashlib
+import inspect
+import os
+import pickle
+import pandas as pd
+
+from bracket_builder import __version__
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+
+## Content hashes of input files by (absolute path, modification time, size)
+_file_hashes = {}
+
+## Arguments that only change how a stage runs (not its result), left out of the keys
+EXECUTION_ARGS = ['n_workers']
+
+
+def fingerprint(value):
+    """
+    Get a hash of a stage input. Data is hashed by content, paths of existing files by the content
+     of the file, functions by their source, and anything else by its repr.
+
+    Parameters
+    ----------
+    value : object
+        Input of a stage (DataFrame, file path, function, parameter, or a list/tuple/dict of them).
+
+    Returns
+    -------
+    str
+        Hex digest of the input.
+    """
+    h = hashlib.sha256()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        if isinstance(value, pd.DataFrame):
+            h.update(repr(list(value.columns)).encode())
+            h.update(repr(list(value.dtypes.astype(str))).encode())
+        else:
+            h.update(repr((value.name, str(value.dtype))).encode())
+    elif isinstance(value, str) and os.path.isfile(value):
+        h.update(_file_hash(value).encode())
+    elif inspect.isfunction(value):
+        h.update(f'{value.__module__}.{value.__qualname__}'.encode())
+        h.update(inspect.getsource(value).encode())
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            h.update(fingerprint(item).encode())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=repr):
+            h.update(repr(k).encode())
+            h.update(fingerprint(value[k]).encode())
+    else:
+        h.update(repr(value).encode())
+
+    return h.hexdigest()
+
+
+def _file_hash(filepath):
+    """
+    Hash the content of a file (only once per version of the file).
+    """
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_hashes:
+        h = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _file_hashes[key] = h.hexdigest()
+
+    return _file_hashes[key]
+
+
+def _source_hash(value):
+    """
+    Hash the source file of a module, or of the module defining a function (so edits to the helpers
+     it calls are seen too). Empty when there is no source file.
+    """
+    module = value if inspect.ismodule(value) else inspect.getmodule(value)
+    try:
+        filepath = inspect.getsourcefile(module)
+    except TypeError:
+        filepath = None
+    if filepath is None or not os.path.isfile(filepath):
+        return ''
+
+    return _file_hash(filepath)
+
+
+class StageCache:
+    """
+    Results of pipeline stages kept on disk, keyed by a hash of the stage's source code, its
+     dependencies and inputs.
+
+    The dependencies are the source files of the modules defining the stage and the functions it is
+     given, the modules or functions in deps, and the version of the package (e.g. the dataset schemas).
+
+    DataFrames are saved as Parquet when pyarrow is installed (pickle otherwise). Once the files
+     take more than max_bytes, the least recently used ones are removed.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, refresh=False, deps=None):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory for the saved results.
+        max_bytes : int
+            Default 2 GB. Size of the saved results above which the least recently used are removed.
+        refresh : bool or list of str
+            Default False. Recompute (and save again) every stage, or the stages with these function names.
+        deps : list of modules or functions
+            Optional. Other code every stage depends on, whose source files are part of the keys.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.deps = [] if deps is None else list(deps)
+
+    def key(self, func, *args, **kwargs):
+        """
+        Get the key of a stage: a hash of the function's name, its source, its dependencies and its
+         inputs (but not the arguments in EXECUTION_ARGS).
+
+        Returns
+        -------
+        str
+            Hex digest identifying the result.
+        """
+        kwargs = {k: v for k, v in kwargs.items() if k not in EXECUTION_ARGS}
+        deps = [func] + [value for value in list(args) + list(kwargs.values()) if inspect.isfunction(value)]
+        h = hashlib.sha256()
+        h.update(f'{func.__module__}.{func.__qualname__}'.encode())
+        h.update(inspect.getsource(func).encode())
+        h.update(__version__.encode())
+        for source_hash in sorted({_source_hash(dep) for dep in deps + self.deps}):
+            h.update(source_hash.encode())
+        h.update(fingerprint(list(args)).encode())
+        h.update(fingerprint(kwargs).encode())
+
+        return h.hexdigest()
+
+    def run(self, func, *args, **kwargs):
+        """
+        Get the result of func(*args, **kwargs) from the cache, or compute and save it.
+
+        Returns
+        -------
+        object
+            Result of the stage.
+        """
+        key = self.key(func, *args, **kwargs)
+        refresh = self.refresh if isinstance(self.refresh, bool) else func.__name__ in self.refresh
+        if not refresh:
+            for ext in ['parquet', 'pkl']:
+                path = os.path.join(self.cache_dir, f'{func.__name__}-{key}.{ext}')
+                if os.path.exists(path):
+                    try:
+                        result = parquet.read_table(path).to_pandas() if ext == 'parquet' else pd.read_pickle(path)
+                    except Exception:
+                        continue
+                    ## The modification time is when the result was last used
+                    os.utime(path)
+                    return result
+
+        result = func(*args, **kwargs)
+        self._save(result, func.__name__, key)
+
+        return result
+
+    def clear(self):
+        """
+        Remove every saved result.
+        """
+        for path, _, _ in self._entries():
+            os.remove(path)
+
+    def _save(self, result, name, key):
+        """
+        Write a result (Parquet for DataFrames when possible) and evict the least recently used.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for old_file in os.listdir(self.cache_dir):
+            if old_file.startswith(f'{name}-{key}.'):
+                os.remove(os.path.join(self.cache_dir, old_file))
+
+        path = os.path.join(self.cache_dir, f'{name}-{key}.pkl')
+        if parquet is not None and isinstance(result, pd.DataFrame):
+            try:
+                result.to_parquet(f'{path[:-4]}.parquet.tmp', engine='pyarrow')
+                path = f'{path[:-4]}.parquet'
+            except Exception:
+                ## Falls back to pickle, without leaving a partial Parquet file behind
+                if os.path.exists(f'{path[:-4]}.parquet.tmp'):
+                    os.remove(f'{path[:-4]}.parquet.tmp')
+        if path.endswith('.pkl'):
+            with open(f'{path}.tmp', 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f'{path}.tmp', path)
+
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for old_path, _, size in entries:
+            if total <= self.max_bytes or old_path == path:
+                continue
+            os.remove(old_path)
+            total -= size
+
+    def _entries(self):
+        """
+        Saved results as (path, last used, size).
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for file in os.listdir(self.cache_dir):
+            if file.endswith('.parquet') or file.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.cache_dir, file))
+                entries.append((os.path.join(self.cache_dir, file), stat.st_mtime_ns, stat.st_size))
+
+        return entries
@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+
+## Kaggle submission IDs are '{Season}_{TeamID_1}_{TeamID_2}' with 4 digit numbers
+ID_WIDTH = 14
+_SEPARATORS = [4, 9]
+_DIGITS = [slice(0, 4), slice(5, 9), slice(10, 14)]
+
+
+def pair_grid(seeds_df, seasons=None):
+    """
+    Get every pair of teams that could meet in the tournament (the lower team ID first), the rows
+     of a Kaggle submission.
+
+    Parameters
+    ----------
+    seeds_df : DataFrame
+        Teams of each season with Season and TeamID columns (e.g. the tournament seeds).
+    seasons : list of int
+        Optional. Seasons to include (default is every season of seeds_df).
+
+    Returns
+    -------
+    DataFrame
+        ID, Season, TeamID_1 and TeamID_2 of each pair, by season and team IDs.
+    """
+    if seasons is not None:
+        seeds_df = seeds_df[seeds_df['Season'].isin(seasons)]
+    teams = seeds_df[['Season', 'TeamID']].drop_duplicates().sort_values(['Season', 'TeamID'])
+    season_col = teams['Season'].to_numpy()
+    team_col = teams['TeamID'].to_numpy()
+
+    ## Upper triangle of each season's block of teams
+    starts = np.flatnonzero(np.r_[True, season_col[1:] != season_col[:-1]])
+    ends = np.r_[starts[1:], len(teams)]
+    pairs = []
+    for start, end in zip(starts, ends):
+        idx_1, idx_2 = np.triu_indices(end - start, 1)
+        pairs.append((idx_1 + start, idx_2 + start))
+    idx_1 = np.concatenate([p[0] for p in pairs]) if pairs else np.array([], dtype=int)
+    idx_2 = np.concatenate([p[1] for p in pairs]) if pairs else np.array([], dtype=int)
+
+    grid_df = pd.DataFrame({'Season': season_col[idx_1], 'TeamID_1': team_col[idx_1],
+                            'TeamID_2': team_col[idx_2]})
+    grid_df.insert(0, 'ID', make_ids(grid_df['Season'], grid_df['TeamID_1'], grid_df['TeamID_2']))
+
+    return grid_df
+
+
+def make_ids(seasons, team_ids_1, team_ids_2):
+    """
+    Build submission IDs (e.g. '2022_1112_1114') from integer arrays.
+
+    Parameters
+    ----------
+    seasons, team_ids_1, team_ids_2 : array-like of int
+        Season and team IDs of each row.
+
+    Returns
+    -------
+    np.array
+        ID of each row (as str).
+    """
+    parts = [np.asarray(col, dtype=np.int64) for col in [seasons, team_ids_1, team_ids_2]]
+    if len(parts[0]) == 0:
+        return np.array([], dtype=object)
+
+    ## Every part has 4 digits in the Kaggle files, so the IDs are written as bytes directly
+    if all(((col >= 1000) & (col <= 9999)).all() for col in parts):
+        chars = np.full((len(parts[0]), ID_WIDTH), ord('_'), dtype=np.uint8)
+        for col, digits in zip(parts, _DIGITS):
+            for pos, power in zip(range(digits.start, digits.stop), [1000, 100, 10, 1]):
+                chars[:, pos] = ord('0') + (col // power) % 10
+        return chars.view(f'S{ID_WIDTH}').ravel().astype(str).astype(object)
+
+    return (pd.Series(parts[0]).astype(str) + '_' + pd.Series(parts[1]).astype(str) + '_'
+            + pd.Series(parts[2]).astype(str)).to_numpy()
+
+
+def parse_ids(ids):
+    """
+    Break submission IDs (e.g. '2022_1112_1114') into integer arrays.
+
+    Parameters
+    ----------
+    ids : array-like of str
+        Submission IDs.
+
+    Returns
+    -------
+    seasons, team_ids_1, team_ids_2 : np.array
+        Season and team IDs of each row.
+    """
+    ids = np.asarray(ids, dtype=str)
+    if len(ids) == 0:
+        return tuple(np.array([], dtype=int) for _ in range(3))
+
+    ## IDs with 4 digit parts are read as a (rows x 14) array of characters
+    if ids.dtype.itemsize // 4 == ID_WIDTH:
+        chars = ids.astype(f'S{ID_WIDTH}').view(np.uint8).reshape(len(ids), ID_WIDTH).astype(np.int64)
+        numbers = chars - ord('0')
+        digits_ok = (np.delete(numbers, _SEPARATORS, axis=1) >= 0) & (np.delete(numbers, _SEPARATORS, axis=1) <= 9)
+        if (chars[:, _SEPARATORS] == ord('_')).all() and digits_ok.all():
+            return tuple(numbers[:, digits] @ np.array([1000, 100, 10, 1]) for digits in _DIGITS)
+
+    id_parts = pd.Series(ids).str.split('_', expand=True).astype(int)
+
+    return tuple(id_parts[i].to_numpy() for i in range(3))
+
+
+def read_submission(sub_filepath, season=None):
+    """
+    Read a Kaggle submission and break out the ID.
+
+    Parameters
+    ----------
+    sub_filepath : str
+        Location of Kaggle data submission.
+    season : int
+        Optional. Season to keep.
+
+    Returns
+    -------
+    DataFrame
+        Submission with Season, TeamID_1 and TeamID_2 columns added.
+    """
+    sub_df = pd.read_csv(sub_filepath)
+    sub_df['Season'], sub_df['TeamID_1'], sub_df['TeamID_2'] = parse_ids(sub_df['ID'])
+    if season is not None:
+        sub_df = sub_df[sub_df['Season'] == season]
+
+    return sub_df
+
+
+def write_submission(sub_df, sub_filepath, pred_col='Pred'):
+    """
+    Write a Kaggle format submission (ID,Pred) in one write.
+
+    Parameters
+    ----------
+    sub_df : DataFrame
+        Submission with an ID column, or Season, TeamID_1 and TeamID_2 columns, and predictions.
+    sub_filepath : str
+        Location to write the submission to.
+    pred_col : str
+        Default 'Pred'. Column with the probability that TeamID_1 wins.
+    """
+    if 'ID' in sub_df.columns:
+        ids = sub_df['ID'].to_numpy()
+    else:
+        ids = make_ids(sub_df['Season'], sub_df['TeamID_1'], sub_df['TeamID_2'])
+    preds = sub_df[pred_col].to_numpy(dtype=float)
+
+    lines = '\n'.join(map('{},{!r}'.format, ids, preds.tolist()))
+    with open(sub_filepath, 'w') as f:
+        f.write(f'ID,Pred\n{lines}\n')
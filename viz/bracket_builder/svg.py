@@ -0,0 +1,246 @@
+from html import escape
+
+import numpy as np
+
+from bracket_builder.constants import ROUND_COLS
+from bracket_builder.layout import bracket_layout, pad_probabilities, path_lines, path_probabilities, team_round_probs
+
+
+## Pixels per unit of the bracket coordinates, and per point of font size
+X_SCALE = 5
+Y_SCALE = 12
+FONT_SCALE = 1.25
+
+## Colors of the team paths that don't have one (Tableau 10, as the matplotlib default)
+PATH_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f',
+               '#bcbd22', '#17becf']
+
+SVG_TEMPLATE = ('<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                'viewBox="0 0 {width} {height}" font-family="DejaVu Sans, Verdana, sans-serif">\n'
+                '<path class="bracket" d="{skeleton}" stroke="black" stroke-width="1" fill="none"/>\n'
+                '{paths}{teams}{winners}</svg>\n')
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+svg {{ max-width: 100%; height: auto; }}
+.team {{ cursor: default; }}
+.team:hover text {{ font-weight: bold; }}
+.paths line:hover {{ stroke-opacity: 1; stroke: black; }}
+</style>
+</head>
+<body>
+{svg}</body>
+</html>
+'''
+
+
+## Tooltip of a team name with its probability of making each round
+_TOOLTIP = '\n'.join(['{}'] + [f'{col}: {{:.1%}}' for col in ROUND_COLS])
+
+## Line of a team's path weighted by width or by opacity, with its probability as the tooltip
+_WIDTH_LINE = '<line {} stroke="{}" stroke-width="{:.2f}"><title>{} {}: {:.1%}</title></line>\n'
+_ALPHA_LINE = '<line {} stroke="{}" stroke-width="5" stroke-opacity="{:.3f}"><title>{} {}: {:.1%}</title></line>\n'
+
+
+def _num(value):
+    """
+    Format a coordinate or size the same way every time.
+    """
+    return f'{value:g}'
+
+
+class SvgRenderer:
+    """
+    Writes brackets as SVG (or HTML pages with the SVG inline) from string templates, without
+     matplotlib.
+
+    The bracket lines and the attributes of every label and line are formatted once from the
+     layout, so each image only joins strings. The same labels always give the same bytes, so
+     the output can be cached and diffed. Names have tooltips with their round probabilities.
+    """
+
+    def __init__(self, n_teams=64, slot_tree=None, layout=None):
+        """
+        Parameters
+        ----------
+        n_teams : int
+            Default 64. Number of teams in the tournament (16, 32, 64, or 68 with the slot tree).
+        slot_tree : SlotTree
+            Optional. Compiled tournament slots, which place the play-in games (see bracket_layout).
+        layout : BracketLayout
+            Optional. Layout to draw (e.g. a Bracket's), instead of n_teams and slot_tree.
+        """
+        self.layout = bracket_layout(n_teams, slot_tree) if layout is None else layout
+        (x_min, x_max), (y_min, y_max) = self.layout.xlim, self.layout.ylim
+        self.width = _num((x_max - x_min) * X_SCALE)
+        self.height = _num((y_max - y_min) * Y_SCALE)
+
+        def px(x):
+            return (np.asarray(x, dtype=float) - x_min) * X_SCALE
+
+        def py(y):
+            return (y_max - np.asarray(y, dtype=float)) * Y_SCALE
+
+        segments = self.layout.segments
+        self.skeleton = ''.join(f'M{_num(x0)} {_num(y0)}L{_num(x1)} {_num(y1)}'
+                                for x0, y0, x1, y1 in zip(px(segments[:, 0, 0]), py(segments[:, 0, 1]),
+                                                          px(segments[:, 1, 0]), py(segments[:, 1, 1])))
+
+        ## Opening tag of the label, and the coordinates of the line, of every spot
+        table = self.layout.table
+        anchors = np.where(table['ha'] == 'center', ' text-anchor="middle"', '')
+        self._text_tags = [f'<text x="{_num(x)}" y="{_num(y)}" font-size="{_num(size * FONT_SCALE)}"{anchor}>'
+                           for x, y, size, anchor in zip(px(table['x']), py(table['y']), table['size'], anchors)]
+        self._line_coords = [f'x1="{_num(x0)}" y1="{_num(y)}" x2="{_num(x1)}" y2="{_num(y)}"'
+                             for x0, x1, y in zip(px(table['line_x0']), px(table['line_x1']), py(table['line_y']))]
+        self._round_starts = [self.layout.round_table(rnd).index[0] for rnd in range(self.layout.n_rounds)]
+        self._n_spots = [len(self.layout.round_table(rnd)) for rnd in range(self.layout.n_rounds)]
+        self._stage_names = np.array(['Play-in'] + ROUND_COLS)[self.layout.columns['stage'] + 1].tolist()
+
+    def draw(self, team_names=None, winners=None, actual=False, win_prob_teams=None, win_probabilities=None,
+             colors=None, probs_df=None, path_colors=None, path_weight='width'):
+        """
+        Write the SVG of one bracket (the arguments of BracketRenderer.draw).
+
+        Parameters
+        ----------
+        team_names : list of str
+            Optional. Team names from top left, bottom left, top right, to bottom right (one per spot).
+        winners : list of lists of str
+            Optional. Winners of each round, in the same order (one list per round that has been
+             played, filling the round).
+        actual : bool
+            Default False. Whether the winners are actual results (black) or projected (gray).
+        win_prob_teams : list of str
+            Optional. Team names to highlight with paths weighted by their win probabilities.
+        win_probabilities : list of lists of float
+            Optional. Probabilities of each highlighted team making each round.
+        colors : list of str
+            Optional. SVG color of each highlighted team's path (default black).
+        probs_df : DataFrame
+            Optional. Probabilities of every team to make each round (by TeamName), drawn as paths
+             and shown in the tooltips of the names.
+        path_colors : list of str
+            Optional. SVG color of each team's path from probs_df (default cycles through PATH_COLORS).
+        path_weight : str
+            Default 'width'. Whether the probabilities set the width or the opacity ('alpha') of the paths.
+
+        Returns
+        -------
+        str
+            The SVG.
+        """
+        if path_weight not in ['width', 'alpha']:
+            raise ValueError(f"path_weight should be 'width' or 'alpha', not {path_weight!r}")
+        self._check_labels(team_names, winners)
+
+        paths = []
+        teams = []
+        if team_names is not None:
+            names = [escape(str(name)) for name in team_names]
+            if probs_df is not None:
+                round_probs = team_round_probs(probs_df, team_names)
+                if path_colors is None:
+                    path_colors = np.resize(PATH_COLORS, len(names))
+                paths += self._path_lines(np.arange(len(names)), path_probabilities(self.layout, round_probs),
+                                          names, path_colors, path_weight)
+                tips = [name if np.isnan(probs).any() else _TOOLTIP.format(name, *probs)
+                        for name, probs in zip(names, round_probs.tolist())]
+            else:
+                tips = names
+            if win_probabilities is not None:
+                positions = [list(team_names).index(team) for team in win_prob_teams]
+                if colors is None:
+                    colors = ['black'] * len(positions)
+                paths += self._path_lines(positions, pad_probabilities(win_probabilities),
+                                          [names[p] for p in positions], colors, 'width')
+            start = self._round_starts[0]
+            teams = [f'<g class="team"><title>{tip}</title>{self._text_tags[start + i]}{name}</text></g>\n'
+                     for i, (name, tip) in enumerate(zip(names, tips))]
+
+        labels = []
+        if winners is not None:
+            for rnd, rd_names in enumerate(winners, 1):
+                start = self._round_starts[rnd]
+                labels += [f'{self._text_tags[start + i]}{escape(str(name))}</text>\n'
+                           for i, name in enumerate(rd_names)]
+
+        return SVG_TEMPLATE.format(
+            width=self.width, height=self.height, skeleton=self.skeleton,
+            paths=f'<g class="paths" stroke-linecap="square">\n{"".join(paths)}</g>\n' if paths else '',
+            teams=f'<g class="teams">\n{"".join(teams)}</g>\n' if teams else '',
+            winners=(f'<g class="winners" fill="{"black" if actual else "gray"}">\n{"".join(labels)}</g>\n'
+                     if labels else ''))
+
+    def render(self, filename=None, format='svg', title='Bracket', **labels):
+        """
+        Draw one bracket and save it.
+
+        Parameters
+        ----------
+        filename : str
+            Optional. File to save the bracket to (without extension). The document is returned
+             as a str when it isn't given.
+        format : str
+            Default 'svg'. Either 'svg', or 'html' for a page with the SVG inline.
+        title : str
+            Default 'Bracket'. Title of the HTML page.
+        **labels
+            Passed to draw (team_names, winners, actual, win_prob_teams, win_probabilities, colors, probs_df, ...).
+
+        Returns
+        -------
+        str
+            The document, or the path it was saved to.
+        """
+        if format not in ['svg', 'html']:
+            raise ValueError(f"format should be 'svg' or 'html', not {format!r}")
+
+        document = self.draw(**labels)
+        if format == 'html':
+            document = HTML_TEMPLATE.format(title=escape(title), svg=document)
+
+        if filename is None:
+            return document
+
+        path = f'{filename}.{format}'
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(document)
+
+        return path
+
+    def _check_labels(self, team_names, winners):
+        """
+        Make sure the names fit the spots of the layout.
+        """
+        n_spots = self._n_spots
+        if team_names is not None and len(team_names) != n_spots[0]:
+            raise ValueError(f'A {self.layout.n_teams} team bracket has {n_spots[0]} team names, '
+                             f'not {len(team_names)}')
+        if winners is None:
+            return
+        if len(winners) > len(n_spots) - 1:
+            raise ValueError(f'A {self.layout.n_teams} team bracket has at most {len(n_spots) - 1} rounds '
+                             f'of winners, not {len(winners)}')
+        for rnd, rd_names in enumerate(winners, 1):
+            if len(rd_names) != n_spots[rnd]:
+                raise ValueError(f'Round {rnd} of a {self.layout.n_teams} team bracket has {n_spots[rnd]} '
+                                 f'winners, not {len(rd_names)}')
+
+    def _path_lines(self, positions, step_probs, names, colors, weight):
+        """
+        Format the lines along the paths of some teams, by round and the most likely first.
+        """
+        lines = path_lines(self.layout, positions, step_probs)
+        if weight == 'width':
+            template, scale = _WIDTH_LINE, 5
+        else:
+            template, scale = _ALPHA_LINE, 1
+
+        return [template.format(self._line_coords[row], colors[team], prob * scale, names[team],
+                                self._stage_names[row], prob)
+                for row, prob, team in zip(lines['rows'].tolist(), lines['probs'].tolist(), lines['teams'].tolist())]